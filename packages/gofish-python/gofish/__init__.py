@@ -10,6 +10,14 @@ from .ast import (
     spread,
     stack,
     derive,
+    calculate,
+    bin_,
+    density,
+    quantile,
+    box_summary,
+    regress,
+    timeUnit,
+    lookup,
     group,
     scatter,
     table,
@@ -30,6 +38,9 @@ from .ast import (
     text,
     image,
 )
+from .executor import check_cancelled, DeriveCancelled, get_scheduler
+from .stats import stats
+from .trace import trace
 
 __all__ = [
     "chart",
@@ -39,6 +50,14 @@ __all__ = [
     "spread",
     "stack",
     "derive",
+    "calculate",
+    "bin_",
+    "density",
+    "quantile",
+    "box_summary",
+    "regress",
+    "timeUnit",
+    "lookup",
     "group",
     "scatter",
     "table",
@@ -58,6 +77,11 @@ __all__ = [
     "petal",
     "text",
     "image",
+    "check_cancelled",
+    "DeriveCancelled",
+    "get_scheduler",
+    "stats",
+    "trace",
 ]
 
 __version__ = "0.1.0"
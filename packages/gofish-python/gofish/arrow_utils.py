@@ -1,11 +1,15 @@
 """Utilities for converting between pandas DataFrames and Apache Arrow format."""
 
 import io
-from typing import Union
+from typing import Any, List, Union
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 
+from .trace import traced
 
+
+@traced("dataframe_to_arrow")
 def dataframe_to_arrow(df: pd.DataFrame) -> bytes:
     """
     Convert a pandas DataFrame to Apache Arrow format (bytes).
@@ -20,9 +24,26 @@ def dataframe_to_arrow(df: pd.DataFrame) -> bytes:
         >>> df = pd.DataFrame({"x": [1, 2, 3], "y": [4, 5, 6]})
         >>> arrow_bytes = dataframe_to_arrow(df)
     """
-    # Convert DataFrame to Arrow table
-    table = pa.Table.from_pandas(df)
-    
+    return table_to_arrow(pa.Table.from_pandas(df))
+
+
+@traced("table_to_arrow")
+def table_to_arrow(table: pa.Table, dictionary: bool = False) -> bytes:
+    """
+    Serialize a pyarrow Table to Arrow IPC stream bytes.
+
+    Int64/UInt64 columns are downcast to Int32/UInt32 when the values fit, so
+    the widget does not receive BigInt columns. Temporal columns are sent
+    natively: timestamps at millisecond resolution (JS Date precision) and
+    dates as date32, which the widget reads as epoch milliseconds.
+
+    Args:
+        table: pyarrow Table to serialize
+        dictionary: Dictionary-encode string columns with repeated values
+
+    Returns:
+        Arrow IPC format bytes
+    """
     # Convert Int64 columns to Int32 to avoid BigInt issues in JavaScript
     # This is safe for most charting use cases where values are reasonable
     fields = []
@@ -44,6 +65,19 @@ def dataframe_to_arrow(df: pd.DataFrame) -> bytes:
             except (pa.ArrowInvalidError, OverflowError):
                 # If casting fails (values too large), keep original type
                 fields.append(field)
+        elif pa.types.is_timestamp(field.type) and field.type.unit != "ms":
+            new_type = pa.timestamp("ms", tz=field.type.tz)
+            array = array.cast(new_type, safe=False)
+            fields.append(pa.field(field.name, new_type))
+            schema_changed = True
+        elif dictionary and _should_dictionary_encode(array):
+            array = pc.dictionary_encode(array.combine_chunks())
+            fields.append(pa.field(field.name, array.type))
+            schema_changed = True
+        elif pa.types.is_date64(field.type):
+            array = array.cast(pa.date32())
+            fields.append(pa.field(field.name, pa.date32()))
+            schema_changed = True
         else:
             fields.append(field)
         arrays.append(array)
@@ -58,6 +92,13 @@ def dataframe_to_arrow(df: pd.DataFrame) -> bytes:
     return sink.getvalue().to_pybytes()
 
 
+def _should_dictionary_encode(array: pa.ChunkedArray) -> bool:
+    """Whether a column is a string column where most values repeat."""
+    if not (pa.types.is_string(array.type) or pa.types.is_large_string(array.type)):
+        return False
+    return pc.count_distinct(array).as_py() * 2 <= len(array)
+
+
 def arrow_to_dataframe(arrow_bytes: bytes) -> pd.DataFrame:
     """
     Convert Apache Arrow bytes back to a pandas DataFrame.
@@ -75,3 +116,79 @@ def arrow_to_dataframe(arrow_bytes: bytes) -> pd.DataFrame:
     table = reader.read_all()
     return table.to_pandas()
 
+
+def arrow_to_table(arrow_bytes: bytes) -> pa.Table:
+    """
+    Read Arrow IPC stream bytes into a pyarrow Table (no pandas round trip).
+
+    Args:
+        arrow_bytes: Arrow IPC format bytes
+
+    Returns:
+        pyarrow Table
+    """
+    return pa.ipc.open_stream(arrow_bytes).read_all()
+
+
+def to_arrow_table(data: Any) -> pa.Table:
+    """
+    Coerce chart data to a pyarrow Table.
+
+    Args:
+        data: pyarrow Table, pandas DataFrame, list of row dicts, or None
+
+    Returns:
+        pyarrow Table
+    """
+    if isinstance(data, pa.Table):
+        return data
+    if data is None:
+        return pa.table({})
+    if isinstance(data, pd.DataFrame):
+        return pa.Table.from_pandas(data)
+    return pa.Table.from_pandas(pd.DataFrame(data))
+
+
+# pyarrow 14 replaced concat_tables(promote=True) with promote_options
+_PROMOTE = (
+    {"promote_options": "default"}
+    if int(pa.__version__.split(".")[0]) >= 14
+    else {"promote": True}
+)
+
+
+def concat_tables(tables: List[pa.Table]) -> pa.Table:
+    """
+    Concatenate tables whose schemas may differ.
+
+    Columns missing from some tables are filled with nulls, and null-typed
+    columns take the type of the other tables.
+    """
+    return pa.concat_tables(tables, **_PROMOTE)
+
+
+def with_column(table: pa.Table, name: str, values: Any) -> pa.Table:
+    """
+    Return `table` with column `name` set to `values`.
+
+    An existing column is replaced in place (keeping its position); otherwise
+    the column is appended.
+    """
+    index = table.schema.get_field_index(name)
+    if index == -1:
+        return table.append_column(name, values)
+    return table.set_column(index, name, values)
+
+
+def temporal_to_epoch_ms(table: pa.Table) -> pa.Table:
+    """
+    Replace date and timestamp columns with Int64 epoch milliseconds.
+
+    This is the representation the widget uses for temporal values, and is
+    used wherever rows are handed to JavaScript as JSON instead of Arrow.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+            millis = table.column(i).cast(pa.timestamp("ms")).cast(pa.int64())
+            table = table.set_column(i, field.name, millis)
+    return table
@@ -1,8 +1,15 @@
 """AST classes for building GoFish chart specifications."""
 
-from typing import Any, Callable, Dict, List, Optional, TypeVar, Union
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+import asyncio
+import time
 import uuid
 
+from .expr import evaluate, parse
+from .trace import span
+from .transpile import transpile as _transpile
+
 T = TypeVar("T")
 
 
@@ -21,16 +28,210 @@ class Operator:
 class DeriveOperator(Operator):
     """Operator for deriving new data via Python function."""
 
-    def __init__(self, fn: Callable):
+    def __init__(self, fn: Callable, transpile: bool = True):
         super().__init__("derive")
         self.fn = fn
         self.lambda_id = str(uuid.uuid4())
+        # Declarative IR equivalent of fn, when it matches a supported pattern
+        self.transpiled: Optional[dict] = _transpile(fn) if transpile else None
 
     def to_dict(self) -> dict:
-        """Convert to dict - return lambda ID."""
+        """Convert to dict - transpiled IR operator, or lambda ID for RPC."""
+        if self.transpiled is not None:
+            # Keep the lambda ID so hosts without native support can fall back
+            return {**self.transpiled, "lambdaId": self.lambda_id}
         return {"type": "derive", "lambdaId": self.lambda_id}
 
 
+class TableOperator(Operator, ABC):
+    """
+    Base class for operators that transform a whole table with columnar kernels.
+
+    Table operators that lead a pipeline (before any partitioning operator)
+    run eagerly on the Arrow table in the kernel at render time; elsewhere
+    they are sent to the widget as declarative IR.
+    """
+
+    eager = True
+
+    @abstractmethod
+    def apply(self, table: Any) -> Any:
+        """Apply the operator to a pyarrow Table and return the new Table."""
+
+
+class CalculateOperator(TableOperator):
+    """Operator adding a column computed from an expression."""
+
+    def __init__(self, name: str, expr: str):
+        self.name = name
+        self.expr = parse(expr)
+        super().__init__("calculate", name=name, expr=self.expr)
+
+    def apply(self, table: Any) -> Any:
+        """Evaluate the expression with pyarrow.compute and set the column."""
+        from .arrow_utils import with_column
+
+        return with_column(table, self.name, evaluate(self.expr, table))
+
+
+class RepeatOperator(TableOperator):
+    """
+    Operator expanding each row into as many copies as its count field.
+
+    Never run eagerly: the widget expands rows at render time, so the
+    repeated rows are not serialized or created in Python.
+    """
+
+    eager = False
+
+    def __init__(self, field: str):
+        self.field = field
+        super().__init__("repeat", field=field)
+
+    def apply(self, table: Any) -> Any:
+        """Expand rows with an index-vector take()."""
+        from .transforms import repeat_table
+
+        return repeat_table(table, self.field)
+
+
+class ColumnarFunction:
+    """
+    Derive callable wrapping a pyarrow Table -> Table transform.
+
+    Hosts that exchange Arrow (the widget) hand the decoded table straight to
+    ``transform``; calling the object with row dicts, the JS derive
+    convention, converts through Arrow instead.
+    """
+
+    def __init__(self, transform: Callable[[Any], Any]):
+        self.transform = transform
+
+    def __call__(self, data: Any) -> List[dict]:
+        from .arrow_utils import temporal_to_epoch_ms, to_arrow_table
+
+        result = self.transform(to_arrow_table(data))
+        return temporal_to_epoch_ms(result).to_pylist()
+
+
+# Column the widget tags rows with when it batches a transform's partitions
+PARTITION_FIELD = "_partition"
+
+
+class TransformOperator(TableOperator, DeriveOperator):
+    """
+    Operator computing a summary or derived columns with a columnar kernel.
+
+    Leading transforms run eagerly in the kernel. Elsewhere in a pipeline
+    they become a derive call: the widget sends every partition of a render
+    in one Arrow table tagged with a ``_partition`` column, the kernel runs
+    once per partition, and only the result table travels back.
+    """
+
+    def __init__(self, transform: str, kernel: Callable[..., Any], **params: Any):
+        DeriveOperator.__init__(
+            self, ColumnarFunction(self.apply_partitioned), transpile=False
+        )
+        self.transform = transform
+        self.kernel = kernel
+        self.params = params
+
+    def apply(self, table: Any) -> Any:
+        """Run the transform kernel on a pyarrow Table."""
+        return self.kernel(table, **self.params)
+
+    def apply_partitioned(self, table: Any) -> Any:
+        """Run the kernel per ``_partition`` value, keeping the tag on results."""
+        if PARTITION_FIELD not in table.column_names:
+            return self.apply(table)
+        import pyarrow as pa
+
+        from .arrow_utils import concat_tables
+        from .transforms import _groups
+
+        results = []
+        for key, part in _groups(table, [PARTITION_FIELD]):
+            out = self.apply(part.drop([PARTITION_FIELD]))
+            tag = pa.array([key[PARTITION_FIELD]] * out.num_rows, pa.int64())
+            results.append(out.append_column(PARTITION_FIELD, tag))
+        return concat_tables(results)
+
+    def to_dict(self) -> dict:
+        """Convert to dict - a derive RPC tagged with the transform."""
+        return {
+            "type": "derive",
+            "lambdaId": self.lambda_id,
+            "transform": self.transform,
+            **{
+                key.rstrip("_"): list(value) if isinstance(value, tuple) else value
+                for key, value in self.params.items()
+                if value is not None
+            },
+        }
+
+
+class LookupOperator(TransformOperator):
+    """
+    Operator joining fields from a second table onto each row by key.
+
+    The lookup table is shipped once inside the IR (as dictionary-encoded
+    Arrow) and joined in the widget with a hash index, so dimension columns
+    are not repeated across the fact rows in transit. With ``eager=True`` a
+    leading lookup is joined in the kernel with pyarrow instead.
+    """
+
+    def __init__(
+        self,
+        other: Any,
+        left: str,
+        right: str,
+        fields: Optional[List[str]],
+        default: Any = None,
+        eager: bool = False,
+    ):
+        from .arrow_utils import to_arrow_table
+        from .transforms import lookup_table
+
+        other = to_arrow_table(other)
+        if fields is None:
+            fields = [name for name in other.column_names if name != right]
+        missing = [name for name in [right, *fields] if name not in other.column_names]
+        if missing:
+            raise ValueError(f"lookup() fields not in lookup data: {missing}")
+        self.other = other.select([right, *fields])
+        self.eager = eager
+        super().__init__(
+            "lookup",
+            lookup_table,
+            other=self.other,
+            left=left,
+            right=right,
+            fields=fields,
+            default=default,
+        )
+        self._arrow_b64: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Convert to dict - join keys, fields and the Arrow lookup table."""
+        import base64
+        from .arrow_utils import table_to_arrow
+
+        if self._arrow_b64 is None:
+            arrow = table_to_arrow(self.other, dictionary=True)
+            self._arrow_b64 = base64.b64encode(arrow).decode("utf-8")
+        d = {
+            "type": "lookup",
+            "on": [self.params["left"], self.params["right"]],
+            "fields": self.params["fields"],
+            "arrowB64": self._arrow_b64,
+            # Hosts without a native lookup can run the join via RPC
+            "lambdaId": self.lambda_id,
+        }
+        if self.params["default"] is not None:
+            d["default"] = self.params["default"]
+        return d
+
+
 class Mark:
     """Base class for chart marks."""
 
@@ -261,62 +462,127 @@ class ChartBuilder:
         if self._mark is None:
             raise ValueError("Chart must have a mark before rendering")
 
-        # Import here to avoid circular dependencies
-        from .widget import GoFishChartWidget
-        from .arrow_utils import dataframe_to_arrow
-        import pandas as pd
+        with span(f"{type(self).__name__}.render"):
+            return _make_widget(*_timed_prepare(self), w, h, axes, debug)
 
-        # LayerSelector charts have no data of their own
-        if isinstance(self.data, LayerSelector):
-            import pyarrow as pa
-            schema = pa.schema([pa.field("_placeholder", pa.int32())])
-            table = pa.Table.from_arrays([], schema=schema)
-            sink = pa.BufferOutputStream()
-            with pa.ipc.new_stream(sink, schema) as writer:
-                writer.write_table(table)
-            arrow_data = sink.getvalue().to_pybytes()
-        else:
-            # Convert data to Arrow format
-            if isinstance(self.data, pd.DataFrame):
-                df = self.data
-            elif self.data is None:
-                df = pd.DataFrame()
-            else:
-                df = pd.DataFrame(self.data)
-
-            if len(df) == 0:
-                import pyarrow as pa
-                schema = pa.schema([pa.field("_placeholder", pa.int32())])
-                table = pa.Table.from_arrays([], schema=schema)
-                sink = pa.BufferOutputStream()
-                with pa.ipc.new_stream(sink, schema) as writer:
-                    writer.write_table(table)
-                arrow_data = sink.getvalue().to_pybytes()
-            else:
-                arrow_data = dataframe_to_arrow(df)
-
-        # Get the IR spec
-        spec = self.to_ir()
+    async def render_async(
+        self,
+        w: int = 800,
+        h: int = 600,
+        axes: bool = False,
+        debug: bool = False,
+    ):
+        """
+        Render the chart without blocking the running event loop.
+
+        Eager operators and Arrow encoding run on the loop's default executor,
+        so other coroutines (e.g. async derives of charts already on screen)
+        keep running meanwhile.
+
+        Args:
+            w: Chart width in pixels
+            h: Chart height in pixels
+            axes: Whether to show axes
+            debug: Whether to enable debug mode
 
-        # Collect derive functions for RPC execution in the widget
+        Returns:
+            GoFishChartWidget instance that will display in Jupyter
+
+        Example:
+            >>> widget = await chart(df).mark(rect(h="y")).render_async()
+        """
+        if self._mark is None:
+            raise ValueError("Chart must have a mark before rendering")
+
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(None, _timed_prepare, self)
+        return _make_widget(*prepared, w, h, axes, debug)
+
+    def explain(self):
+        """
+        Report what will make this chart slow, without rendering it.
+
+        Covers the encoded payload, columns no channel uses, the number of
+        derive round trips to the kernel, the estimated number of SVG marks
+        and high-cardinality partition fields, each with a suggestion.
+
+        Returns:
+            Explanation; print it for a readable report
+
+        Example:
+            >>> print(chart(df).flow(spread(by="id")).mark(rect(h="y")).explain())
+        """
+        from .explain import explain_chart
+
+        return explain_chart(self)
+
+    def _prepare_render(self) -> Tuple[bytes, dict, Dict[str, Callable]]:
+        """
+        Encode data, IR and derive registry for the widget.
+
+        Leading eager table operators are applied to the data in the kernel
+        and dropped from the IR sent to the widget.
+
+        Returns:
+            Tuple of (Arrow IPC bytes, IR spec, lambda_id -> derive function)
+        """
+        eager_ops, widget_ops = _split_eager(self.data, self.operators)
+        arrow_data = _serialize_data(self.data, eager_ops)
+        spec = self.to_ir()
+        spec["operators"] = [op.to_dict() for op in widget_ops]
         derive_functions = {
             op.lambda_id: op.fn
-            for op in self.operators
+            for op in widget_ops
             if isinstance(op, DeriveOperator)
         }
+        return arrow_data, spec, derive_functions
+
+
+def _split_eager(
+    data: Any, operators: List[Operator]
+) -> Tuple[List[Operator], List[Operator]]:
+    """Split the leading run of eager table operators off a pipeline."""
+    if isinstance(data, LayerSelector):
+        return [], operators
+    count = 0
+    for op in operators:
+        if not (isinstance(op, TableOperator) and op.eager):
+            break
+        count += 1
+    return operators[:count], operators[count:]
+
+
+def _serialize_data(data: Any, eager_ops: List[Operator]) -> bytes:
+    """Serialize chart data to Arrow IPC bytes after applying eager operators."""
+    return _encode_table(_apply_eager(data, eager_ops))
+
+
+def _apply_eager(data: Any, eager_ops: List[Operator]) -> Any:
+    """Chart data as a pyarrow Table with eager operators applied, or None."""
+    from .arrow_utils import to_arrow_table
+
+    # LayerSelector charts have no data of their own
+    if isinstance(data, LayerSelector):
+        return None
+    table = to_arrow_table(data)
+    for op in eager_ops:
+        table = op.apply(table)
+    return table
 
-        # Create and return widget
-        widget = GoFishChartWidget(
-            spec=spec,
-            arrow_data=arrow_data,
-            derive_functions=derive_functions,
-            width=w,
-            height=h,
-            axes=axes,
-            debug=debug,
-        )
 
-        return widget
+def _encode_table(table: Any) -> bytes:
+    """Arrow IPC bytes sent to the widget for a table (or no data)."""
+    import pyarrow as pa
+    from .arrow_utils import table_to_arrow
+
+    if table is None or table.num_rows == 0:
+        schema = pa.schema([pa.field("_placeholder", pa.int32())])
+        table = schema.empty_table()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    return table_to_arrow(table, dictionary=True)
 
 
 # Operator factory functions
@@ -367,17 +633,322 @@ def stack(
     return Operator("stack", **options)
 
 
-def derive(fn: Callable) -> DeriveOperator:
+def derive(fn: Callable, *, transpile: bool = True) -> DeriveOperator:
     """
     Derive operator - apply a Python function to transform data.
 
+    Simple lambdas (``sorted(d, key=lambda r: r["f"])``, ``[{**row, "x": ...}
+    for row in d]`` and filter comprehensions) are translated into declarative
+    operators that run in the widget without a kernel round trip.
+
     Args:
         fn: Function that takes data and returns transformed data
+        transpile: Set False to always execute fn in Python via RPC
 
     Returns:
         DeriveOperator object
     """
-    return DeriveOperator(fn)
+    return DeriveOperator(fn, transpile=transpile)
+
+
+def calculate(*, name: str, expr: str) -> CalculateOperator:
+    """
+    Calculate operator — add (or replace) a field computed from an expression.
+
+    Expressions support arithmetic, comparisons, ``a if cond else b``,
+    element-wise functions (abs, sqrt, exp, log, floor, round, pow, min, max,
+    ...) and aggregates over the current rows (sum, mean, count, min, max).
+    The widget evaluates them natively, without a Python round trip.
+
+    Args:
+        name: Field to write the result to
+        expr: Expression, e.g. ``"people / sum(people)"`` or ``"sqrt(Death)"``
+
+    Returns:
+        CalculateOperator object
+
+    Example:
+        >>> chart(data).flow(
+        ...     spread(by="age", dir="x"),
+        ...     calculate(name="proportion", expr="people / sum(people)"),
+        ...     stack(by="sex", dir="y"),
+        ... )
+    """
+    return CalculateOperator(name, expr)
+
+
+def bin_(
+    field: str,
+    *,
+    maxbins: int = 10,
+    step: Optional[float] = None,
+    extent: Optional[Tuple[float, float]] = None,
+    groupby: Optional[List[str]] = None,
+    as_: Tuple[str, str] = ("bin_start", "bin_end"),
+) -> TransformOperator:
+    """
+    Bin operator — histogram a numeric field into one row per non-empty bin.
+
+    Named ``bin_`` (like ``as_``) so ``from gofish import *`` does not shadow
+    the ``bin`` builtin.
+
+    Args:
+        field: Numeric field to bin
+        maxbins: Upper bound on the number of bins (steps are 1/2/5 x 10^k)
+        step: Explicit bin width, overriding maxbins
+        extent: (min, max) range to bin; defaults to the data extent
+        groupby: Fields to bin separately; their values are kept in the output
+        as_: Output field names for the bin start and end
+
+    Returns:
+        TransformOperator producing ``{*groupby, bin_start, bin_end, count}`` rows
+
+    Example:
+        >>> chart(cars).flow(
+        ...     bin_("Horsepower", maxbins=20),
+        ...     spread(by="bin_start", dir="x", spacing=0),
+        ... ).mark(rect(h="count"))
+    """
+    from .transforms import bin_table
+
+    return TransformOperator(
+        "bin",
+        bin_table,
+        field=field,
+        maxbins=maxbins,
+        step=step,
+        extent=extent,
+        groupby=groupby,
+        as_=as_,
+    )
+
+
+def density(
+    field: str,
+    *,
+    bandwidth: Optional[float] = None,
+    extent: Optional[Tuple[float, float]] = None,
+    steps: int = 100,
+    groupby: Optional[List[str]] = None,
+    as_: Tuple[str, str] = ("value", "density"),
+) -> TransformOperator:
+    """
+    Density operator — Gaussian kernel density estimate sampled on a grid.
+
+    Large inputs are pre-binned, so the cost is linear in the number of rows.
+
+    Args:
+        field: Numeric field to estimate the density of
+        bandwidth: Kernel bandwidth; defaults to Scott's rule
+        extent: (min, max) range of the grid; defaults to the data extent
+        steps: Number of grid points per group
+        groupby: Fields to estimate separately
+        as_: Output field names for the grid value and density
+
+    Returns:
+        TransformOperator producing ``steps`` rows per group
+    """
+    from .transforms import density_table
+
+    return TransformOperator(
+        "density",
+        density_table,
+        field=field,
+        bandwidth=bandwidth,
+        extent=extent,
+        steps=steps,
+        groupby=groupby,
+        as_=as_,
+    )
+
+
+def quantile(
+    field: str,
+    *,
+    probs: Optional[List[float]] = None,
+    groupby: Optional[List[str]] = None,
+    as_: Tuple[str, str] = ("prob", "value"),
+) -> TransformOperator:
+    """
+    Quantile operator — one row per requested probability.
+
+    Args:
+        field: Numeric field
+        probs: Probabilities in [0, 1]; defaults to the quartiles
+        groupby: Fields to compute quantiles for separately
+        as_: Output field names for the probability and quantile value
+
+    Returns:
+        TransformOperator object
+    """
+    from .transforms import quantile_table
+
+    return TransformOperator(
+        "quantile",
+        quantile_table,
+        field=field,
+        probs=list(probs) if probs is not None else [0.25, 0.5, 0.75],
+        groupby=groupby,
+        as_=as_,
+    )
+
+
+def box_summary(
+    field: str,
+    *,
+    extent: float = 1.5,
+    groupby: Optional[List[str]] = None,
+) -> TransformOperator:
+    """
+    Box summary operator — one row of box-plot statistics per group.
+
+    Output fields are count, min, lower, q1, median, q3, upper, max and
+    outliers, where lower/upper are whiskers at ``extent`` x IQR.
+
+    Args:
+        field: Numeric field to summarize
+        extent: Whisker length as a multiple of the interquartile range
+        groupby: Fields to summarize separately (e.g. the category axis)
+
+    Returns:
+        TransformOperator object
+    """
+    from .transforms import box_summary_table
+
+    return TransformOperator(
+        "boxSummary",
+        box_summary_table,
+        field=field,
+        extent=extent,
+        groupby=groupby,
+    )
+
+
+def regress(
+    x: str,
+    y: str,
+    *,
+    method: str = "linear",
+    order: int = 2,
+    bandwidth: float = 0.3,
+    steps: Optional[int] = None,
+    groupby: Optional[List[str]] = None,
+) -> TransformOperator:
+    """
+    Regression operator — fit y against x and emit points on the fitted curve.
+
+    Args:
+        x: Predictor field
+        y: Response field
+        method: "linear", "poly" or "loess"
+        order: Polynomial degree for method="poly"
+        bandwidth: Fraction of points in each local fit for method="loess"
+        steps: Number of output points (2 for linear, 100 otherwise)
+        groupby: Fields to fit separately
+
+    Returns:
+        TransformOperator producing ``{*groupby, x, y}`` rows
+    """
+    from .transforms import regress_table
+
+    if method not in ("linear", "poly", "loess"):
+        raise ValueError(
+            f"regress() method must be 'linear', 'poly' or 'loess', got {method!r}"
+        )
+    return TransformOperator(
+        "regress",
+        regress_table,
+        x=x,
+        y=y,
+        method=method,
+        order=order,
+        bandwidth=bandwidth,
+        steps=steps,
+        groupby=groupby,
+    )
+
+
+def timeUnit(
+    field: str,
+    unit: str = "month",
+    *,
+    step: int = 1,
+    format: Optional[str] = None,
+    as_: Optional[str] = None,
+) -> TransformOperator:
+    """
+    Time unit operator — truncate a time field to calendar boundaries.
+
+    Works on whole columns with pyarrow.compute, so bucketing years of
+    minute-level data does not loop over rows. Date, timestamp and ISO-8601
+    string columns are accepted.
+
+    Args:
+        field: Time field to truncate
+        unit: One of year, quarter, month, week, day, hour, minute, second,
+            millisecond
+        step: Bin width in units, e.g. unit="minute", step=15
+        format: strftime pattern for string output, e.g. "%b" for "Jan"
+        as_: Output field (defaults to overwriting ``field``)
+
+    Returns:
+        TransformOperator object
+
+    Example:
+        >>> chart(weather).flow(
+        ...     timeUnit("date", "month", format="%b", as_="month"),
+        ...     spread(by="month", dir="x"),
+        ... )
+    """
+    from .transforms import TIME_UNITS, time_unit_table
+
+    if unit not in TIME_UNITS:
+        raise ValueError(f"timeUnit() unit must be one of {TIME_UNITS}, got {unit!r}")
+    return TransformOperator(
+        "timeUnit",
+        time_unit_table,
+        field=field,
+        unit=unit,
+        step=step,
+        format=format,
+        as_=as_,
+    )
+
+
+def lookup(
+    other_data: Any,
+    *,
+    on: Union[str, Tuple[str, str]],
+    fields: Optional[List[str]] = None,
+    default: Any = None,
+    eager: bool = False,
+) -> LookupOperator:
+    """
+    Lookup operator — add fields from another table whose key matches each row.
+
+    Use it to chart a fact table against a dimension table without
+    denormalizing first: both tables are sent once and joined in the widget.
+    The first matching row wins; unmatched rows get ``default``.
+
+    Args:
+        other_data: Lookup table (list of dicts, DataFrame or pyarrow Table)
+        on: Key field, or (chart field, lookup field) when the names differ
+        fields: Lookup fields to copy (defaults to all but the key)
+        default: Value for rows without a match
+        eager: Join in the kernel with pyarrow when the lookup leads the
+            pipeline, instead of shipping the lookup table
+
+    Returns:
+        LookupOperator object
+
+    Example:
+        >>> chart(sales).flow(
+        ...     lookup(stores, on=("store_id", "id"), fields=["region"]),
+        ...     stack(by="region", dir="y"),
+        ... )
+    """
+    left, right = (on, on) if isinstance(on, str) else on
+    return LookupOperator(other_data, left, right, fields, default, eager)
 
 
 def group(*, by: str, **options: Any) -> Operator:
@@ -520,36 +1091,80 @@ def select(layer_name: str) -> LayerSelector:
 # Data utilities (for use inside derive() callbacks)
 
 
-def normalize(data: List[dict], field: str) -> List[dict]:
+def normalize(data: Any, field: str) -> Any:
     """
     Normalize a numeric field so values sum to 1.
 
+    Row lists are handled row by row; pyarrow Tables and pandas DataFrames are
+    divided as whole columns.
+
     Args:
-        data: List of row dicts
+        data: List of row dicts, pyarrow Table or pandas DataFrame
         field: Field name to normalize
 
     Returns:
-        New list of dicts with field normalized
+        New data of the same kind with field normalized
     """
-    total = sum(row[field] for row in data)
+    if isinstance(data, list):
+        total = sum(row[field] for row in data)
+        if total == 0:
+            return data
+        return [{**row, field: row[field] / total} for row in data]
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from .arrow_utils import with_column
+
+    if isinstance(data, pa.Table):
+        column = pc.cast(data.column(field), pa.float64())
+        total = pc.sum(column).as_py()
+        if not total:
+            return data
+        return with_column(data, field, pc.divide(column, total))
+
+    total = data[field].sum()
     if total == 0:
         return data
-    return [{**row, field: row[field] / total} for row in data]
+    return data.assign(**{field: data[field] / total})
 
 
-def repeat(row: dict, field: str) -> List[dict]:
+def repeat(row: Any = None, field: Optional[str] = None) -> Any:
     """
-    Repeat a row N times based on a numeric field value.
+    Repeat rows based on a numeric count field.
+
+    ``repeat("count")`` is a declarative operator for waffle-style charts: the
+    widget expands each row into ``count`` copies at render time, so the
+    kernel never materializes the repeated rows. As a data utility,
+    ``repeat(row, field)`` copies one row dict, and ``repeat(table, field)``
+    expands a pyarrow Table or pandas DataFrame with a single ``take()``.
+    Fractional counts are truncated towards zero.
 
     Args:
-        row: A single data row dict
+        row: Count field name (operator form), row dict, Table or DataFrame
         field: Field name containing the repeat count
 
     Returns:
-        List of copies of the row, length = row[field]
+        RepeatOperator, list of row copies, or expanded Table/DataFrame
     """
-    n = int(row[field])
-    return [row] * n
+    if row is None and field is not None:
+        return RepeatOperator(field)
+    if field is None:
+        if not isinstance(row, str):
+            raise TypeError("repeat() takes a field name, or data and a field name")
+        return RepeatOperator(row)
+    if isinstance(row, dict):
+        n = int(row[field])
+        return [row] * n
+
+    import numpy as np
+    import pyarrow as pa
+    from .transforms import repeat_table
+
+    if isinstance(row, pa.Table):
+        return repeat_table(row, field)
+    counts = row[field].fillna(0).to_numpy(dtype=int)
+    index = np.repeat(np.arange(len(row)), np.maximum(counts, 0))
+    return row.iloc[index].reset_index(drop=True)
 
 
 # Mark factory functions
@@ -824,62 +1439,99 @@ class LayerBuilder:
         Returns:
             GoFishChartWidget instance that will display in Jupyter
         """
+        with span(f"{type(self).__name__}.render"):
+            return _make_widget(*_timed_prepare(self), w, h, axes, debug)
+
+    async def render_async(
+        self,
+        w: int = 800,
+        h: int = 600,
+        axes: bool = False,
+        debug: bool = False,
+    ):
+        """
+        Render the layer without blocking the running event loop.
+
+        Args:
+            w: Chart width in pixels
+            h: Chart height in pixels
+            axes: Whether to show axes
+            debug: Whether to enable debug mode
+
+        Returns:
+            GoFishChartWidget instance that will display in Jupyter
+        """
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(None, _timed_prepare, self)
+        return _make_widget(*prepared, w, h, axes, debug)
+
+    def explain(self):
+        """
+        Report what will make this layer slow, without rendering it.
+
+        Returns:
+            Explanation covering every chart of the layer
+        """
+        from .explain import explain_layer
+
+        return explain_layer(self)
+
+    def _prepare_render(self) -> Tuple[str, dict, Dict[str, Callable]]:
+        """Encode every child's data, the layer IR and the derive registry."""
         import base64
         import json
-        from .widget import GoFishChartWidget
-        from .arrow_utils import dataframe_to_arrow
-        import pandas as pd
-        import pyarrow as pa
-
-        def _serialize_child_data(child: ChartBuilder) -> str:
-            """Serialize a child chart's data to base64 Arrow bytes."""
-            if isinstance(child.data, LayerSelector):
-                schema = pa.schema([pa.field("_placeholder", pa.int32())])
-                table = pa.Table.from_arrays([], schema=schema)
-                sink = pa.BufferOutputStream()
-                with pa.ipc.new_stream(sink, schema) as writer:
-                    writer.write_table(table)
-                return base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
-
-            if isinstance(child.data, pd.DataFrame):
-                df = child.data
-            elif child.data is None:
-                df = pd.DataFrame()
-            else:
-                df = pd.DataFrame(child.data)
-
-            if len(df) == 0:
-                schema = pa.schema([pa.field("_placeholder", pa.int32())])
-                table = pa.Table.from_arrays([], schema=schema)
-                sink = pa.BufferOutputStream()
-                with pa.ipc.new_stream(sink, schema) as writer:
-                    writer.write_table(table)
-                return base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
-
-            return base64.b64encode(dataframe_to_arrow(df)).decode("ascii")
 
         # Serialize each child's data and collect derive functions
         arrow_dict: dict = {}
         derive_functions: dict = {}
+        chart_specs: List[dict] = []
         for i, child in enumerate(self.children):
-            arrow_dict[str(i)] = _serialize_child_data(child)
-            for op in child.operators:
-                if isinstance(op, DeriveOperator):
-                    derive_functions[op.lambda_id] = op.fn
+            child_arrow, child_spec, child_derives = child._prepare_render()
+            arrow_dict[str(i)] = base64.b64encode(child_arrow).decode("ascii")
+            chart_specs.append(child_spec)
+            derive_functions.update(child_derives)
 
         arrow_data = json.dumps(arrow_dict)
-        spec = self.to_ir()
-
-        widget = GoFishChartWidget(
-            spec=spec,
-            arrow_data=arrow_data,
-            derive_functions=derive_functions,
-            width=w,
-            height=h,
-            axes=axes,
-            debug=debug,
-        )
-        return widget
+        spec = {"type": "layer", "charts": chart_specs, "options": self.options}
+        return arrow_data, spec, derive_functions
+
+
+def _timed_prepare(builder: Any) -> Tuple[tuple, float]:
+    """Run a builder's _prepare_render() and time it."""
+    start = time.perf_counter()
+    with span(f"{type(builder).__name__}._prepare_render"):
+        prepared = builder._prepare_render()
+    return prepared, time.perf_counter() - start
+
+
+def _make_widget(
+    prepared: tuple,
+    encode_s: float,
+    w: int,
+    h: int,
+    axes: bool,
+    debug: bool,
+):
+    """Create the widget for prepared render inputs."""
+    # Import here to avoid circular dependencies
+    from .widget import GoFishChartWidget
+
+    arrow_data, spec, derive_functions = prepared
+    kernel_timings = {
+        "encode_ms": encode_s * 1000,
+        "sent_at_ms": time.time() * 1000,
+        "arrow_bytes": len(arrow_data),
+    }
+    return GoFishChartWidget(
+        spec=spec,
+        arrow_data=arrow_data,
+        derive_functions=derive_functions,
+        width=w,
+        height=h,
+        axes=axes,
+        debug=debug,
+        kernel_timings=kernel_timings,
+    )
 
 
 def Layer(
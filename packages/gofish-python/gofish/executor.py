@@ -0,0 +1,383 @@
+"""Background execution of derive requests with cancellation.
+
+Each widget runs its derive requests on a DeriveExecutor instead of inside
+the comm message handler, so the kernel stays responsive to new messages —
+in particular to cancellations. Requests are tagged with the render
+generation that issued them; cancelling a generation drops its queued tasks
+and flags its running ones.
+
+All executors share one kernel-wide DeriveScheduler. It caps how many
+derives run at once and decides which widget's request runs next: widgets
+the frontend reports as visible go first, and widgets of equal visibility
+take turns, so one chart with many partitions cannot starve the others.
+By default one derive runs at a time, as when derives ran on the comm
+thread, because user functions may share globals or objects that are not
+thread-safe. ``GOFISH_DERIVE_WORKERS`` or ``set_max_workers()`` raises it.
+
+Derive functions can cooperate with cancellation by calling
+``check_cancelled()`` between expensive steps. ``async def`` derives skip
+the worker pool: they are awaited on the kernel's event loop, where they
+only hold the loop between awaits, and are cancelled at their next await.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional
+
+_local = threading.local()
+_logger = logging.getLogger(__name__)
+
+# Derives run at once unless GOFISH_DERIVE_WORKERS says otherwise
+DEFAULT_WORKERS = 1
+
+
+class DeriveCancelled(Exception):
+    """Raised inside a derive function whose result is no longer needed."""
+
+
+def is_cancelled() -> bool:
+    """Whether the derive request running on this thread has been cancelled."""
+    task = getattr(_local, "task", None)
+    return task is not None and task.cancel_event.is_set()
+
+
+def check_cancelled() -> None:
+    """
+    Raise DeriveCancelled if the current derive request was cancelled.
+
+    Call this from long-running derive functions (e.g. between chunks of
+    work) so a re-rendered or closed widget frees the kernel promptly.
+    Outside a derive request it does nothing.
+    """
+    if is_cancelled():
+        raise DeriveCancelled()
+
+
+class DeriveTask:
+    """A submitted derive request."""
+
+    def __init__(
+        self,
+        owner: "DeriveExecutor",
+        request_id: str,
+        generation: Any,
+        run: Callable[[], Any],
+        on_done: Callable[["DeriveTask", Any, Optional[BaseException]], None],
+    ):
+        self.owner = owner
+        self.request_id = request_id
+        self.generation = generation
+        self.run = run
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+        self.future: Any = None
+
+
+class DeriveScheduler:
+    """
+    Kernel-wide queue of derive tasks from every widget.
+
+    Args:
+        max_workers: Number of derive requests run concurrently
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self._cond = threading.Condition()
+        self._queues: Dict["DeriveExecutor", Deque[DeriveTask]] = {}
+        self._running: Dict["DeriveExecutor", List[DeriveTask]] = {}
+        # Turn counter for round-robin between widgets
+        self._turns = itertools.count()
+        self._last_turn: Dict["DeriveExecutor", int] = {}
+        self._workers: List[threading.Thread] = []
+
+    def submit(self, task: DeriveTask) -> None:
+        """Queue a task behind the other tasks of its widget."""
+        with self._cond:
+            self._queues.setdefault(task.owner, deque()).append(task)
+            self._ensure_workers()
+            self._cond.notify()
+
+    def set_max_workers(self, max_workers: int) -> None:
+        """
+        Change how many derive requests run at once.
+
+        Only raise it if the chart's derive functions are thread-safe:
+        with more than one worker, calls (including partitions of the same
+        derive) run concurrently.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        with self._cond:
+            self.max_workers = max_workers
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def cancel(self, owner: "DeriveExecutor", generations: Iterable[Any]) -> int:
+        """
+        Cancel a widget's tasks from the given generations.
+
+        Queued tasks are dropped; running tasks are flagged so that
+        ``check_cancelled()`` raises inside them.
+
+        Returns:
+            Number of tasks cancelled
+        """
+        targets = set(generations)
+        with self._cond:
+            queue = self._queues.get(owner, deque())
+            dropped = [t for t in queue if t.generation in targets]
+            kept = deque(t for t in queue if t.generation not in targets)
+            if kept:
+                self._queues[owner] = kept
+            else:
+                self._queues.pop(owner, None)
+            running = [
+                t for t in self._running.get(owner, []) if t.generation in targets
+            ]
+        for task in dropped + running:
+            task.cancel_event.set()
+        return len(dropped) + len(running)
+
+    def forget(self, owner: "DeriveExecutor") -> None:
+        """Cancel all of a widget's tasks, e.g. when it is closed."""
+        with self._cond:
+            tasks = list(self._queues.pop(owner, ())) + self._running.get(owner, [])
+            self._last_turn.pop(owner, None)
+        for task in tasks:
+            task.cancel_event.set()
+
+    def queue_depth(self, owner: Optional["DeriveExecutor"] = None) -> int:
+        """Number of queued (not yet running) tasks, for one widget or all."""
+        with self._cond:
+            if owner is not None:
+                return len(self._queues.get(owner, ()))
+            return sum(len(q) for q in self._queues.values())
+
+    def running(self, owner: Optional["DeriveExecutor"] = None) -> int:
+        """Number of running tasks, for one widget or all."""
+        with self._cond:
+            if owner is not None:
+                return len(self._running.get(owner, ()))
+            return sum(len(r) for r in self._running.values())
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the scheduler's load."""
+        with self._cond:
+            return {
+                "queued": sum(len(q) for q in self._queues.values()),
+                "running": sum(len(r) for r in self._running.values()),
+                "widgets": len(self._queues),
+                "visible_widgets": sum(1 for o in self._queues if o.visible),
+                "max_workers": self.max_workers,
+            }
+
+    def _ensure_workers(self) -> None:
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._work,
+                name=f"gofish-derive-{len(self._workers)}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_task(self) -> Optional[DeriveTask]:
+        """
+        Pop the next task: visible widgets first, then widgets with fewer
+        running tasks, then the widget that waited longest for a turn.
+        """
+        if not self._queues:
+            return None
+        # Idle workers left over after set_max_workers() lowered the cap
+        if sum(len(r) for r in self._running.values()) >= self.max_workers:
+            return None
+        owner = min(
+            self._queues,
+            key=lambda o: (
+                not o.visible,
+                len(self._running.get(o, ())),
+                self._last_turn.get(o, -1),
+            ),
+        )
+        queue = self._queues[owner]
+        task = queue.popleft()
+        if not queue:
+            del self._queues[owner]
+        self._last_turn[owner] = next(self._turns)
+        return task
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+                self._running.setdefault(task.owner, []).append(task)
+            try:
+                self._execute(task)
+            finally:
+                with self._cond:
+                    running = self._running.get(task.owner, [])
+                    if task in running:
+                        running.remove(task)
+                    if not running:
+                        self._running.pop(task.owner, None)
+                    self._cond.notify()
+
+    @staticmethod
+    def _execute(task: DeriveTask) -> None:
+        if task.cancel_event.is_set():
+            return
+        _local.task = task
+        result, error = None, None
+        try:
+            result = task.run()
+        except BaseException as exc:
+            error = exc
+        finally:
+            _local.task = None
+        _notify(task, result, error)
+
+
+def _notify(task: DeriveTask, result: Any, error: Optional[BaseException]) -> None:
+    """Call a task's ``on_done``; a failing callback must not stop the worker."""
+    try:
+        task.on_done(task, result, error)
+    except Exception:
+        # E.g. sending on the comm of a closed widget
+        _logger.exception("GoFish derive callback for %s failed", task.request_id)
+
+
+_scheduler: Optional[DeriveScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> DeriveScheduler:
+    """
+    Return the kernel-wide derive scheduler, creating it on first use.
+
+    Its worker count comes from the ``GOFISH_DERIVE_WORKERS`` environment
+    variable (default 1); change it later with ``set_max_workers()``.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DeriveScheduler(_configured_workers())
+        return _scheduler
+
+
+def _configured_workers() -> int:
+    try:
+        return max(1, int(os.environ.get("GOFISH_DERIVE_WORKERS", DEFAULT_WORKERS)))
+    except ValueError:
+        return DEFAULT_WORKERS
+
+
+class DeriveExecutor:
+    """
+    One widget's handle on the derive scheduler, cancellable by generation.
+
+    Args:
+        scheduler: Scheduler to submit to; defaults to the kernel-wide one
+    """
+
+    def __init__(self, scheduler: Optional[DeriveScheduler] = None):
+        self.scheduler = scheduler or get_scheduler()
+        # Whether the widget is on screen, as reported by the frontend
+        self.visible = False
+        self._lock = threading.Lock()
+        self._async_tasks: Dict[str, DeriveTask] = {}
+
+    def submit(
+        self,
+        request_id: str,
+        generation: Any,
+        run: Callable[[], Any],
+        on_done: Callable[[DeriveTask, Any, Optional[BaseException]], None],
+    ) -> DeriveTask:
+        """
+        Queue ``run`` and call ``on_done(task, result, error)`` when it ends.
+
+        ``on_done`` is not called for tasks cancelled before they started.
+        """
+        task = DeriveTask(self, request_id, generation, run, on_done)
+        self.scheduler.submit(task)
+        return task
+
+    def submit_async(
+        self,
+        request_id: str,
+        generation: Any,
+        run: Callable[[], Awaitable[Any]],
+        on_done: Callable[[DeriveTask, Any, Optional[BaseException]], None],
+        loop: asyncio.AbstractEventLoop,
+    ) -> DeriveTask:
+        """
+        Await ``run()`` on ``loop`` and call ``on_done`` when it ends.
+
+        Async tasks wait on I/O rather than hold a worker thread, so they do
+        not count against the scheduler's concurrency cap. ``on_done`` is not
+        called for cancelled tasks.
+        """
+        task = DeriveTask(self, request_id, generation, run, on_done)
+
+        async def execute() -> None:
+            result, error = None, None
+            try:
+                result = await run()
+            except asyncio.CancelledError:
+                return
+            except BaseException as exc:
+                error = exc
+            finally:
+                with self._lock:
+                    self._async_tasks.pop(request_id, None)
+            _notify(task, result, error)
+
+        with self._lock:
+            self._async_tasks[request_id] = task
+        task.future = asyncio.run_coroutine_threadsafe(execute(), loop)
+        return task
+
+    def cancel(self, generations: Iterable[Any]) -> int:
+        """Cancel every task from the given generations."""
+        targets = set(generations)
+        with self._lock:
+            tasks = [
+                t for t in self._async_tasks.values() if t.generation in targets
+            ]
+        for task in tasks:
+            task.cancel_event.set()
+            task.future.cancel()
+        return self.scheduler.cancel(self, targets) + len(tasks)
+
+    @property
+    def pending(self) -> int:
+        """Number of queued or running tasks."""
+        with self._lock:
+            awaiting = len(self._async_tasks)
+        return (
+            self.scheduler.queue_depth(self) + self.scheduler.running(self) + awaiting
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of tasks waiting for a worker."""
+        return self.scheduler.queue_depth(self)
+
+    def shutdown(self) -> None:
+        """Cancel outstanding work."""
+        with self._lock:
+            tasks = list(self._async_tasks.values())
+        for task in tasks:
+            task.cancel_event.set()
+            task.future.cancel()
+        self.scheduler.forget(self)
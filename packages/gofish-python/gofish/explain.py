@@ -0,0 +1,397 @@
+"""Static performance advisor behind ChartBuilder.explain().
+
+Looks at a chart's data and pipeline without rendering it and reports the
+things that drive render cost: payload size, unused columns, how many derive
+round trips the widget will make, how many SVG elements the mark will
+produce, and partition fields with many distinct values. Every finding comes
+with a suggestion.
+
+Counts are estimates: the data is only known up to the first operator the
+kernel cannot evaluate statically. Python derives are assumed to keep the
+row count; widget-side transforms, which summarize, make it unknown.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+
+from .ast import (
+    DeriveOperator,
+    LookupOperator,
+    Operator,
+    RepeatOperator,
+    TableOperator,
+    TransformOperator,
+    _apply_eager,
+    _encode_table,
+    _split_eager,
+)
+
+# Operators that split the rows into one child per group (or per row)
+PARTITION_OPERATORS = ("spread", "stack", "group", "scatter", "table")
+# Marks drawn as one SVG element per group rather than per row
+PATH_MARKS = ("line", "area")
+
+# SVG gets sluggish past a few thousand elements and struggles past ~20k
+SVG_MARKS_WARN = 5_000
+SVG_MARKS_LIMIT = 20_000
+# Partitions beyond this are hard to read and slow to lay out
+HIGH_CARDINALITY = 100
+DERIVE_RPCS_WARN = 20
+PAYLOAD_WARN_BYTES = 10 * 1024 * 1024
+
+
+class Finding:
+    """
+    One issue found by explain().
+
+    Args:
+        severity: ``"warning"`` (likely slow) or ``"info"``
+        code: Short identifier, e.g. ``"derive-after-spread"``
+        message: What was found
+        suggestion: What to change
+    """
+
+    def __init__(self, severity: str, code: str, message: str, suggestion: str):
+        self.severity = severity
+        self.code = code
+        self.message = message
+        self.suggestion = suggestion
+
+    def to_dict(self) -> dict:
+        return {
+            "severity": self.severity,
+            "code": self.code,
+            "message": self.message,
+            "suggestion": self.suggestion,
+        }
+
+    def __repr__(self) -> str:
+        return f"Finding({self.severity!r}, {self.code!r}, {self.message!r})"
+
+
+class Explanation:
+    """
+    Result of explain(): per-chart cost summaries and findings.
+
+    Printing it (or displaying it in a notebook) shows a readable report.
+    """
+
+    def __init__(self, charts: List[Dict[str, Any]], findings: List[Finding]):
+        self.charts = charts
+        self.findings = findings
+
+    @property
+    def warnings(self) -> List[Finding]:
+        """Findings likely to make the chart slow."""
+        return [f for f in self.findings if f.severity == "warning"]
+
+    def to_dict(self) -> dict:
+        return {
+            "charts": self.charts,
+            "findings": [f.to_dict() for f in self.findings],
+        }
+
+    def __str__(self) -> str:
+        lines = []
+        for summary in self.charts:
+            lines.append(
+                f"{summary['chart']}: {_count(summary['rows'])} rows x "
+                f"{summary['columns']} columns, {_size(summary['bytes'])} encoded"
+            )
+            lines.append(f"  derive RPCs: {_count(summary['derive_rpcs'])}")
+            lines.append(
+                f"  marks: {_count(summary['marks'])} ({summary['mark']})"
+            )
+        if not self.findings:
+            lines.append("No issues found.")
+        for finding in self.findings:
+            lines.append(f"{finding.severity} [{finding.code}] {finding.message}")
+            lines.append(f"  -> {finding.suggestion}")
+        return "\n".join(lines)
+
+    __repr__ = __str__
+
+
+def explain_chart(builder: Any, label: str = "chart") -> Explanation:
+    """Analyze one ChartBuilder."""
+    findings: List[Finding] = []
+    data = builder.data
+    eager_ops, widget_ops = _split_eager(data, builder.operators)
+    mark = builder._mark
+    mark_type = mark.mark_type if mark is not None else "none"
+
+    table = _apply_eager(data, eager_ops)
+    payload = 0 if table is None else len(_encode_table(table))
+
+    summary: Dict[str, Any] = {
+        "chart": label,
+        "rows": table.num_rows if table is not None else None,
+        "columns": table.num_columns if table is not None else None,
+        "bytes": payload,
+        "unused_columns": [],
+        "derive_rpcs": 0,
+        "partitions": 1,
+        "rows_out": None,
+        "marks": None,
+        "mark": mark_type,
+    }
+
+    if payload > PAYLOAD_WARN_BYTES:
+        findings.append(
+            Finding(
+                "warning",
+                "large-payload",
+                f"{label} sends {_size(payload)} of data to the widget.",
+                "Aggregate in the kernel first (bin_(), quantile(), a leading "
+                "derive) or drop columns the chart does not use.",
+            )
+        )
+
+    if table is not None:
+        _check_unused_columns(table, widget_ops, mark, label, summary, findings)
+        _walk_pipeline(table, widget_ops, label, summary, findings)
+        _check_marks(mark_type, label, summary, findings)
+
+    return Explanation([summary], findings)
+
+
+def explain_layer(layer: Any) -> Explanation:
+    """Analyze every chart of a LayerBuilder."""
+    charts: List[Dict[str, Any]] = []
+    findings: List[Finding] = []
+    for i, child in enumerate(layer.children):
+        explanation = explain_chart(child, label=f"chart {i}")
+        charts += explanation.charts
+        findings += explanation.findings
+    total = sum(c["marks"] or 0 for c in charts)
+    if total > SVG_MARKS_LIMIT and all(
+        (c["marks"] or 0) <= SVG_MARKS_LIMIT for c in charts
+    ):
+        findings.append(
+            Finding(
+                "warning",
+                "too-many-marks",
+                f"The layer draws about {_count(total)} SVG elements in total.",
+                "Aggregate or sample the largest layers; SVG rendering slows "
+                f"down past roughly {_count(SVG_MARKS_LIMIT)} elements.",
+            )
+        )
+    return Explanation(charts, findings)
+
+
+def _check_unused_columns(
+    table: pa.Table,
+    operators: List[Operator],
+    mark: Any,
+    label: str,
+    summary: Dict[str, Any],
+    findings: List[Finding],
+) -> None:
+    """Report columns no operator or mark channel refers to."""
+    if any(_is_opaque(op) for op in operators):
+        # A Python derive may read any column
+        return
+    specs = [op.to_dict() for op in operators]
+    if mark is not None:
+        specs.append(mark.to_dict())
+    strings = list(_strings(specs))
+    unused = [
+        name
+        for name in table.column_names
+        if name != "_placeholder" and not any(_refers_to(s, name) for s in strings)
+    ]
+    summary["unused_columns"] = unused
+    if not unused:
+        return
+    wasted = table.select(unused).nbytes
+    shown = ", ".join(unused[:8]) + (", ..." if len(unused) > 8 else "")
+    findings.append(
+        Finding(
+            "warning" if wasted > PAYLOAD_WARN_BYTES // 10 else "info",
+            "unused-columns",
+            f"{label}: {len(unused)} of {table.num_columns} columns are never "
+            f"used ({shown}); about {_size(wasted)} before encoding.",
+            "Select the columns the chart needs before charting, e.g. "
+            "chart(df[[...]]).",
+        )
+    )
+
+
+def _walk_pipeline(
+    table: pa.Table,
+    operators: List[Operator],
+    label: str,
+    summary: Dict[str, Any],
+    findings: List[Finding],
+) -> None:
+    """Estimate partitions, derive round trips and rows through the pipeline."""
+    partitions = 1
+    rows: Optional[int] = table.num_rows
+    known = True  # whether `table` still describes the rows at this point
+    partitioned_by: Optional[str] = None
+    for op in operators:
+        if isinstance(op, RepeatOperator):
+            if known and op.field in table.column_names:
+                rows = int(pa.compute.sum(table[op.field]).as_py() or 0)
+            known = False
+        elif _is_remote(op):
+            # Transforms send every partition of a render in one call
+            batched = isinstance(op, TransformOperator)
+            summary["derive_rpcs"] += 1 if batched else partitions
+            if (
+                not batched
+                and partitioned_by is not None
+                and partitions >= HIGH_CARDINALITY
+            ):
+                findings.append(
+                    Finding(
+                        "warning",
+                        "derive-after-spread",
+                        f"{label}: {_describe(op)} runs after {partitioned_by}, "
+                        f"once per partition: about {_count(partitions)} kernel "
+                        "round trips.",
+                        "Move it before the partitioning operator so it runs once "
+                        "on the whole table, or use calculate() / a built-in "
+                        "transform that runs in the widget.",
+                    )
+                )
+            if isinstance(op, TransformOperator):
+                rows = None
+            known = False
+        elif op.op_type in PARTITION_OPERATORS:
+            count = _partition_count(op, table if known else None, rows)
+            if count is None:
+                continue
+            partitions *= max(count, 1)
+            partitioned_by = _describe(op)
+            by = op.kwargs.get("by")
+            if by is not None and count > HIGH_CARDINALITY:
+                findings.append(
+                    Finding(
+                        "warning",
+                        "high-cardinality-by",
+                        f"{label}: {partitioned_by} creates {_count(count)} "
+                        "partitions.",
+                        "Bin or timeUnit() the field, or keep the top categories "
+                        "and group the rest, before partitioning on it.",
+                    )
+                )
+    summary["partitions"] = partitions
+    summary["rows_out"] = rows
+    summary["marks"] = None if rows is None else rows
+    if summary["derive_rpcs"] > DERIVE_RPCS_WARN and not any(
+        f.code == "derive-after-spread" for f in findings
+    ):
+        findings.append(
+            Finding(
+                "info",
+                "derive-rpcs",
+                f"{label}: about {_count(summary['derive_rpcs'])} derive round "
+                "trips to the kernel.",
+                "Combine derives, or move them before partitioning operators.",
+            )
+        )
+
+
+def _check_marks(
+    mark_type: str, label: str, summary: Dict[str, Any], findings: List[Finding]
+) -> None:
+    """Estimate SVG elements and compare them with what browsers handle well."""
+    if summary["marks"] is None:
+        return
+    if mark_type in PATH_MARKS:
+        # One path per series
+        summary["marks"] = summary["partitions"]
+    marks = summary["marks"]
+    if marks > SVG_MARKS_LIMIT:
+        severity = "warning"
+    elif marks > SVG_MARKS_WARN:
+        severity = "info"
+    else:
+        return
+    findings.append(
+        Finding(
+            severity,
+            "too-many-marks",
+            f"{label} draws about {_count(marks)} {mark_type} elements.",
+            "Aggregate first (bin_(), a derive that summarizes, repeat() "
+            "only where needed) or sample; SVG rendering slows down past "
+            f"roughly {_count(SVG_MARKS_LIMIT)} elements.",
+        )
+    )
+
+
+def _partition_count(
+    op: Operator, table: Optional[pa.Table], rows: Optional[int]
+) -> Optional[int]:
+    """Number of children a partitioning operator creates, if known."""
+    by = op.kwargs.get("by")
+    if by is None:
+        # Per-item layout
+        return rows
+    if table is None:
+        return None
+    fields = list(by.values()) if isinstance(by, dict) else [by]
+    count = 1
+    for field in fields:
+        if field not in table.column_names:
+            return None
+        count *= pa.compute.count_distinct(table[field]).as_py()
+    return count
+
+
+def _is_remote(op: Operator) -> bool:
+    """Whether the widget calls back into the kernel for this operator."""
+    if isinstance(op, LookupOperator):
+        return False
+    if isinstance(op, TableOperator) and not isinstance(op, TransformOperator):
+        return False
+    return isinstance(op, DeriveOperator) and op.transpiled is None
+
+
+def _is_opaque(op: Operator) -> bool:
+    """Whether an operator runs Python code whose column use is unknown."""
+    return _is_remote(op) and not isinstance(op, TransformOperator)
+
+
+def _describe(op: Operator) -> str:
+    if isinstance(op, TransformOperator):
+        return f"{op.to_dict().get('transform', 'transform')}()"
+    if isinstance(op, DeriveOperator):
+        name = getattr(op.fn, "__name__", "fn")
+        return f"derive({name})"
+    by = op.kwargs.get("by")
+    return f"{op.op_type}(by={by!r})" if by is not None else f"{op.op_type}()"
+
+
+def _strings(value: Any) -> Iterable[str]:
+    """Every string inside a nested IR dict."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _strings(item)
+
+
+def _refers_to(text: str, column: str) -> bool:
+    """Whether an IR string is, or mentions, a column name."""
+    if text == column:
+        return True
+    return re.search(rf"(?<![\w.]){re.escape(column)}(?!\w)", text) is not None
+
+
+def _count(value: Optional[int]) -> str:
+    return "unknown" if value is None else f"{value:,}"
+
+
+def _size(nbytes: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GB"
@@ -0,0 +1,378 @@
+"""Expression mini-language for calculate() and other declarative transforms.
+
+Expressions use a small, Python-flavoured grammar::
+
+    people / sum(people)
+    sqrt(Death)
+    "big" if count > 10 else "small"
+    datum["Miles per Gallon"] * 0.425
+
+Bare identifiers (and ``datum["..."]`` for names that are not identifiers)
+refer to fields of the current rows. ``sum``/``mean``/``count`` and one-argument
+``min``/``max`` aggregate over all rows the operator sees (e.g. one spread
+group), so ``people / sum(people)`` is a per-group proportion.
+
+Both evaluators (:func:`evaluate` here and ``widget-src/expr.ts``) share one
+semantics, so an operator gives the same column wherever it runs: a null
+operand makes any operator or element-wise function (two-argument
+``min``/``max`` included) null, except ``and``/``or``; aggregates skip nulls
+and ``sum`` of no values is 0; ``/``, ``**`` and ``pow`` compute in floating
+point (``2 ** -1`` is 0.5); ``+`` concatenates when either side is a string.
+
+Expressions are parsed into a JSON-serializable tree that the widget compiles
+into a column loop, and that :func:`evaluate` runs on a pyarrow Table with
+``pyarrow.compute`` kernels.
+"""
+
+import ast
+from typing import Any, Dict, List, Optional, Set
+
+# Binary operators: Python AST node type -> IR operator token
+_BIN_OPS = {
+    ast.Add: "+",
+    ast.Sub: "-",
+    ast.Mult: "*",
+    ast.Div: "/",
+    ast.Mod: "%",
+    ast.Pow: "**",
+}
+
+_CMP_OPS = {
+    ast.Eq: "==",
+    ast.NotEq: "!=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+}
+
+# Element-wise functions and their accepted arities
+FUNCTIONS: Dict[str, Set[int]] = {
+    "abs": {1},
+    "sqrt": {1},
+    "exp": {1},
+    "log": {1},
+    "log10": {1},
+    "log2": {1},
+    "floor": {1},
+    "ceil": {1},
+    "round": {1},
+    "pow": {2},
+    "min": {2},
+    "max": {2},
+}
+
+# Aggregates over the operator's input rows (broadcast back to every row)
+AGGREGATES = {"sum", "mean", "min", "max", "count"}
+
+
+class ExpressionError(ValueError):
+    """Raised when an expression uses syntax outside the supported grammar."""
+
+
+class _Converter:
+    """Converts a Python expression AST into the expression IR tree.
+
+    Subclasses customize how names, subscripts and call targets resolve, which
+    lets the derive transpiler reuse the same grammar for lambda bodies.
+    """
+
+    def convert(self, node: ast.AST) -> dict:
+        method = getattr(self, f"visit_{type(node).__name__}", None)
+        if method is None:
+            raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+        return method(node)
+
+    def visit_Expression(self, node: ast.Expression) -> dict:
+        return self.convert(node.body)
+
+    def visit_Constant(self, node: ast.Constant) -> dict:
+        if node.value is not None and not isinstance(
+            node.value, (bool, int, float, str)
+        ):
+            raise ExpressionError(f"Unsupported literal: {node.value!r}")
+        return {"type": "literal", "value": node.value}
+
+    def visit_Name(self, node: ast.Name) -> dict:
+        return {"type": "field", "name": node.id}
+
+    def visit_Subscript(self, node: ast.Subscript) -> dict:
+        if isinstance(node.value, ast.Name) and node.value.id == "datum":
+            return {"type": "field", "name": _subscript_key(node)}
+        raise ExpressionError("Only datum[\"field\"] subscripts are supported")
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> dict:
+        if isinstance(node.op, ast.USub):
+            return {"type": "unary", "op": "-", "arg": self.convert(node.operand)}
+        if isinstance(node.op, ast.UAdd):
+            return self.convert(node.operand)
+        if isinstance(node.op, ast.Not):
+            return {"type": "unary", "op": "not", "arg": self.convert(node.operand)}
+        raise ExpressionError(f"Unsupported unary operator: {type(node.op).__name__}")
+
+    def visit_BinOp(self, node: ast.BinOp) -> dict:
+        op = _BIN_OPS.get(type(node.op))
+        if op is None:
+            raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        return {
+            "type": "binary",
+            "op": op,
+            "left": self.convert(node.left),
+            "right": self.convert(node.right),
+        }
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> dict:
+        op = "and" if isinstance(node.op, ast.And) else "or"
+        result = self.convert(node.values[0])
+        for value in node.values[1:]:
+            result = {
+                "type": "binary",
+                "op": op,
+                "left": result,
+                "right": self.convert(value),
+            }
+        return result
+
+    def visit_Compare(self, node: ast.Compare) -> dict:
+        # Chained comparisons (a < b < c) become (a < b) and (b < c)
+        result: Optional[dict] = None
+        left = self.convert(node.left)
+        for op_node, comparator in zip(node.ops, node.comparators):
+            op = _CMP_OPS.get(type(op_node))
+            if op is None:
+                raise ExpressionError(
+                    f"Unsupported comparison: {type(op_node).__name__}"
+                )
+            right = self.convert(comparator)
+            term = {"type": "binary", "op": op, "left": left, "right": right}
+            result = (
+                term
+                if result is None
+                else {"type": "binary", "op": "and", "left": result, "right": term}
+            )
+            left = right
+        assert result is not None
+        return result
+
+    def visit_IfExp(self, node: ast.IfExp) -> dict:
+        return {
+            "type": "cond",
+            "test": self.convert(node.test),
+            "then": self.convert(node.body),
+            "else": self.convert(node.orelse),
+        }
+
+    def visit_Call(self, node: ast.Call) -> dict:
+        if node.keywords:
+            raise ExpressionError("Keyword arguments are not supported")
+        fn = self.function_name(node.func)
+        args = [self.convert(arg) for arg in node.args]
+        return make_call(fn, args)
+
+    def function_name(self, func: ast.AST) -> str:
+        if isinstance(func, ast.Name):
+            return func.id
+        raise ExpressionError("Only simple function calls are supported")
+
+
+def _subscript_key(node: ast.Subscript) -> str:
+    """Return the string key of ``x["key"]``."""
+    key = node.slice
+    # Python 3.8 wraps subscript keys in ast.Index
+    if type(key).__name__ == "Index":
+        key = key.value  # type: ignore[attr-defined]
+    if isinstance(key, ast.Constant) and isinstance(key.value, str):
+        return key.value
+    raise ExpressionError("Field subscripts must be string literals")
+
+
+def make_call(fn: str, args: List[dict]) -> dict:
+    """Build a call or aggregate node, validating the function and arity."""
+    if fn in AGGREGATES and len(args) == 1:
+        return {"type": "aggregate", "fn": fn, "arg": args[0]}
+    arities = FUNCTIONS.get(fn)
+    if arities is None:
+        raise ExpressionError(f"Unknown function: {fn}")
+    if len(args) not in arities:
+        raise ExpressionError(f"{fn}() takes {sorted(arities)} argument(s)")
+    return {"type": "call", "fn": fn, "args": args}
+
+
+def parse(expr: str) -> dict:
+    """
+    Parse an expression string into its IR tree.
+
+    Args:
+        expr: Expression source, e.g. ``"people / sum(people)"``
+
+    Returns:
+        JSON-serializable expression tree
+
+    Raises:
+        ExpressionError: If the expression is malformed or unsupported
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+    except SyntaxError as exc:
+        raise ExpressionError(f"Invalid expression {expr!r}: {exc.msg}") from exc
+    return _Converter().convert(tree)
+
+
+def fields(node: dict) -> Set[str]:
+    """Return the set of field names an expression tree reads."""
+    kind = node["type"]
+    if kind == "field":
+        return {node["name"]}
+    if kind == "literal":
+        return set()
+    result: Set[str] = set()
+    for child in _children(node):
+        result |= fields(child)
+    return result
+
+
+def _children(node: dict) -> List[dict]:
+    kind = node["type"]
+    if kind == "unary" or kind == "aggregate":
+        return [node["arg"]]
+    if kind == "binary":
+        return [node["left"], node["right"]]
+    if kind == "call":
+        return list(node["args"])
+    if kind == "cond":
+        return [node["test"], node["then"], node["else"]]
+    return []
+
+
+# ---------------------------------------------------------------------------
+# pyarrow evaluation
+# ---------------------------------------------------------------------------
+
+_PC_BINARY = {
+    "+": "add",
+    "-": "subtract",
+    "*": "multiply",
+    "==": "equal",
+    "!=": "not_equal",
+    "<": "less",
+    "<=": "less_equal",
+    ">": "greater",
+    ">=": "greater_equal",
+    "and": "and_kleene",
+    "or": "or_kleene",
+}
+
+_PC_FUNCTIONS: Dict[str, str] = {
+    "abs": "abs",
+    "sqrt": "sqrt",
+    "exp": "exp",
+    "log": "ln",
+    "log10": "log10",
+    "log2": "log2",
+    "floor": "floor",
+    "ceil": "ceil",
+    "pow": "power",
+}
+
+
+def evaluate(node: dict, table: Any) -> Any:
+    """
+    Evaluate an expression tree over a pyarrow Table.
+
+    Args:
+        node: Expression tree from :func:`parse`
+        table: pyarrow Table providing the referenced fields
+
+    Returns:
+        pyarrow Array (or ChunkedArray) with one value per row
+    """
+    import pyarrow as pa
+
+    result = _eval(node, table)
+    if isinstance(result, pa.Scalar):
+        return pa.repeat(result, table.num_rows)
+    return result
+
+
+def _eval(node: dict, table: Any) -> Any:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    kind = node["type"]
+    if kind == "literal":
+        return pa.scalar(node["value"])
+    if kind == "field":
+        name = node["name"]
+        if name not in table.column_names:
+            raise KeyError(f"Unknown field in expression: {name}")
+        return table.column(name)
+    if kind == "unary":
+        arg = _eval(node["arg"], table)
+        return pc.negate(arg) if node["op"] == "-" else pc.invert(arg)
+    if kind == "binary":
+        left = _eval(node["left"], table)
+        right = _eval(node["right"], table)
+        op = node["op"]
+        if op == "/":
+            return pc.divide(_as_float(left), _as_float(right))
+        if op == "**":
+            return pc.power(_as_float(left), _as_float(right))
+        if op == "+" and (_is_string(left) or _is_string(right)):
+            return pc.binary_join_element_wise(
+                _as_string(left), _as_string(right), ""
+            )
+        if op == "%":
+            # Floored modulo: a - floor(a / b) * b
+            quotient = pc.floor(pc.divide(_as_float(left), _as_float(right)))
+            return pc.subtract(left, pc.multiply(quotient, right))
+        return getattr(pc, _PC_BINARY[op])(left, right)
+    if kind == "cond":
+        return pc.if_else(
+            _eval(node["test"], table),
+            _eval(node["then"], table),
+            _eval(node["else"], table),
+        )
+    if kind == "call":
+        args = [_eval(arg, table) for arg in node["args"]]
+        fn = node["fn"]
+        if fn == "round":
+            return pc.round(args[0], round_mode="half_up")
+        if fn in ("min", "max"):
+            # Null if either argument is null, like the other functions
+            return getattr(pc, f"{fn}_element_wise")(*args, skip_nulls=False)
+        if fn in ("sqrt", "exp", "log", "log10", "log2", "pow"):
+            args = [_as_float(arg) for arg in args]
+        return getattr(pc, _PC_FUNCTIONS[fn])(*args)
+    if kind == "aggregate":
+        arg = _eval(node["arg"], table)
+        if isinstance(arg, pa.Scalar):
+            arg = pa.repeat(arg, table.num_rows)
+        fn = node["fn"]
+        if fn == "count":
+            return pc.count(arg)
+        if fn == "sum":
+            # 0 over no (non-null) values, like Python's sum()
+            return pc.sum(arg, min_count=0)
+        return getattr(pc, fn)(arg)
+    raise ExpressionError(f"Unknown expression node: {kind}")
+
+
+def _as_float(value: Any) -> Any:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    return pc.cast(value, pa.float64())
+
+
+
+def _is_string(value: Any) -> bool:
+    import pyarrow as pa
+
+    return pa.types.is_string(value.type) or pa.types.is_large_string(value.type)
+
+
+def _as_string(value: Any) -> Any:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    return value if _is_string(value) else pc.cast(value, pa.string())
@@ -0,0 +1,230 @@
+"""Per-lambda derive instrumentation and render timing aggregates.
+
+Every derive request is measured: rows and Arrow bytes in and out, and the
+time spent decoding the input, in the user function and encoding the
+result. Measurements are aggregated per lambda ID on the widget that ran
+them (``widget.derive_stats``) and for the whole session (``gofish.stats()``).
+
+A derive can also be run under cProfile or tracemalloc on request, e.g.
+``widget.profile_derive(lambda_id)``; the report is attached to the widget.
+
+Widgets report the stage timings of each render (``widget.timings``); they
+are aggregated for the session as well.
+"""
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+PROFILERS = ("cprofile", "tracemalloc")
+
+# Fields summed across calls, in snapshot order
+_COUNTERS = (
+    "calls",
+    "errors",
+    "rows_in",
+    "rows_out",
+    "bytes_in",
+    "bytes_out",
+    "decode_s",
+    "fn_s",
+    "encode_s",
+)
+
+
+class DeriveMeasurement:
+    """Measurements of a single derive call."""
+
+    def __init__(self):
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decode_s = 0.0
+        self.fn_s = 0.0
+        self.encode_s = 0.0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Add the time spent in the block to ``<name>_s``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            field = f"{name}_s"
+            setattr(self, field, getattr(self, field) + time.perf_counter() - start)
+
+    def encoded(self, arrow_bytes: bytes) -> bytes:
+        """Count an encoded output and pass it through."""
+        self.bytes_out += len(arrow_bytes)
+        return arrow_bytes
+
+
+class DeriveStats:
+    """Thread-safe per-lambda aggregate of derive measurements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_lambda: Dict[str, Dict[str, Any]] = {}
+        # lambda_id -> {profiler kind: latest report}
+        self.profiles: Dict[str, Dict[str, str]] = {}
+
+    def record(
+        self,
+        lambda_id: str,
+        measurement: DeriveMeasurement,
+        *,
+        name: Optional[str] = None,
+        error: bool = False,
+    ) -> None:
+        """Add one derive call to the aggregate."""
+        with self._lock:
+            entry = self._by_lambda.get(lambda_id)
+            if entry is None:
+                entry = {"name": name, **{field: 0 for field in _COUNTERS}}
+                self._by_lambda[lambda_id] = entry
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            for field in _COUNTERS[2:]:
+                entry[field] += getattr(measurement, field)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Aggregates by lambda ID.
+
+        Each entry has the function ``name``, ``calls``, ``errors``,
+        ``rows_in``/``rows_out``, ``bytes_in``/``bytes_out``, the phase times
+        ``decode_s``/``fn_s``/``encode_s`` and their sum ``total_s``.
+        """
+        with self._lock:
+            return {
+                lambda_id: {
+                    **entry,
+                    "total_s": entry["decode_s"] + entry["fn_s"] + entry["encode_s"],
+                }
+                for lambda_id, entry in self._by_lambda.items()
+            }
+
+    def attach_profile(self, lambda_id: str, kind: str, report: str) -> None:
+        """Keep the latest profiler report for a lambda."""
+        with self._lock:
+            self.profiles.setdefault(lambda_id, {})[kind] = report
+
+    def reset(self) -> None:
+        """Forget all measurements and profiles."""
+        with self._lock:
+            self._by_lambda.clear()
+            self.profiles.clear()
+
+
+class RenderTimingStats:
+    """Thread-safe aggregate of per-render stage timings from the widget."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self.renders = 0
+
+    def record(self, timings: Dict[str, float]) -> None:
+        """Add one render's ``timings`` (stage -> value) to the aggregate."""
+        with self._lock:
+            self.renders += 1
+            for stage, value in timings.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                entry = self._stages.setdefault(
+                    stage, {"count": 0, "total": 0.0, "max": float("-inf")}
+                )
+                entry["count"] += 1
+                entry["total"] += value
+                entry["max"] = max(entry["max"], value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Render count and per-stage ``count``, ``mean``, ``max``, ``total``."""
+        with self._lock:
+            return {
+                "renders": self.renders,
+                "stages": {
+                    stage: {**entry, "mean": entry["total"] / entry["count"]}
+                    for stage, entry in self._stages.items()
+                },
+            }
+
+    def reset(self) -> None:
+        """Forget all timings."""
+        with self._lock:
+            self._stages.clear()
+            self.renders = 0
+
+
+# Aggregates over every widget in the session
+session_stats = DeriveStats()
+session_render_timings = RenderTimingStats()
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Session-wide GoFish statistics.
+
+    Returns:
+        Dict with ``derives`` (per-lambda aggregates, see
+        DeriveStats.snapshot), ``renders`` (widget render timings, see
+        RenderTimingStats.snapshot) and ``scheduler`` (current derive queue
+        load)
+    """
+    from .executor import get_scheduler
+
+    return {
+        "derives": session_stats.snapshot(),
+        "renders": session_render_timings.snapshot(),
+        "scheduler": get_scheduler().stats(),
+    }
+
+
+def profile_call(kind: str, call: Callable[[], Any]) -> Tuple[Any, str]:
+    """
+    Run ``call`` under a profiler and return its result and a text report.
+
+    Args:
+        kind: ``"cprofile"`` (top functions by cumulative time) or
+            ``"tracemalloc"`` (peak memory and top allocation sites)
+        call: Zero-argument callable to profile
+
+    Returns:
+        Tuple of (call result, report)
+    """
+    if kind == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(call)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(25)
+        return result, out.getvalue()
+    if kind == "tracemalloc":
+        # tracemalloc is process-wide: concurrent derives show up too
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        # reset_peak() is Python 3.9+; on 3.8 an already running trace
+        # reports its peak since it started
+        peak_since_call = started or hasattr(tracemalloc, "reset_peak")
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        try:
+            result = call()
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+        since = "" if peak_since_call else " (since tracing started)"
+        lines = [f"peak traced memory{since}: {peak / 1024:.1f} KiB"]
+        for stat in after.compare_to(before, "lineno")[:15]:
+            lines.append(str(stat))
+        return result, "\n".join(lines)
+    raise ValueError(f"Unknown profiler {kind!r}; expected one of {PROFILERS}")
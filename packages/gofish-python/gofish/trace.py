@@ -0,0 +1,288 @@
+"""Chrome trace-event export of the render pipeline.
+
+``with gofish.trace("run.json"):`` records spans from the kernel (render,
+Arrow encoding, derive execution, derive responses) and from every widget
+created inside the block (decode, build, resolve, layout, DOM render and each
+derive round trip), and writes them as a ``chrome://tracing`` / Perfetto
+JSON file.
+
+Widgets render in the browser after the cell that created them finishes, so
+their spans usually arrive after the block has exited. Spans recorded after
+the block are written in batches: the file is rewritten ``SAVE_DELAY``
+seconds after the first of them (on a timer thread, never on the thread that
+recorded the span), and when a traced widget is closed.
+"""
+
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Process IDs of the two sides in the trace viewer
+KERNEL_PID = os.getpid()
+WIDGET_PID = 0
+
+# Seconds spans recorded after trace() exits wait before the file is
+# rewritten, so a burst of them costs one write
+SAVE_DELAY = 1.0
+
+_active: Optional["Tracer"] = None
+# Tracer of the widget whose derive is running on this thread or task
+_widget_tracer: ContextVar[Optional["Tracer"]] = ContextVar(
+    "gofish_widget_tracer", default=None
+)
+
+
+def _now_us() -> float:
+    """Wall-clock microseconds, comparable with the browser's clock."""
+    return time.time_ns() / 1000
+
+
+class Tracer:
+    """
+    Collects trace events and writes them to a JSON file.
+
+    Args:
+        path: File to write the trace to
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._widgets: Dict[str, int] = {}
+        self._async_ids = itertools.count()
+        self._save_timer: Optional[threading.Timer] = None
+        self.closed = False
+
+    @contextmanager
+    def span(
+        self, name: str, cat: str = "kernel", concurrent: bool = False, **args
+    ) -> Iterator[None]:
+        """
+        Record the block as a span on the current thread.
+
+        Args:
+            name: Span name
+            cat: Category shown in the viewer
+            concurrent: Emit an async span, for work that overlaps other
+                spans on the same thread (e.g. awaited derives)
+            **args: Extra fields shown with the span
+        """
+        thread = threading.current_thread()
+        tid = thread.ident or 0
+        start = _now_us()
+        try:
+            yield
+        finally:
+            end = _now_us()
+            with self._lock:
+                self._threads.setdefault(tid, thread.name)
+                if concurrent:
+                    common = {
+                        "name": name,
+                        "cat": cat,
+                        "id": next(self._async_ids),
+                        "pid": KERNEL_PID,
+                        "tid": tid,
+                    }
+                    begin = {**common, "ph": "b", "ts": start, "args": args}
+                    self._events += [begin, {**common, "ph": "e", "ts": end}]
+                else:
+                    self._events.append(
+                        {
+                            "name": name,
+                            "cat": cat,
+                            "ph": "X",
+                            "ts": start,
+                            "dur": end - start,
+                            "pid": KERNEL_PID,
+                            "tid": tid,
+                            "args": args,
+                        }
+                    )
+            self._recorded()
+
+    def instant(self, name: str, cat: str = "kernel", **args) -> None:
+        """Record a point in time on the current thread."""
+        thread = threading.current_thread()
+        tid = thread.ident or 0
+        with self._lock:
+            self._threads.setdefault(tid, thread.name)
+            self._events.append(
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "i",
+                    "s": "t",
+                    "ts": _now_us(),
+                    "pid": KERNEL_PID,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        self._recorded()
+
+    def add_widget_spans(self, widget_id: str, spans: List[Dict[str, Any]]) -> None:
+        """
+        Add spans reported by a widget.
+
+        Each span has ``name``, ``start`` (epoch ms), ``dur`` (ms) and
+        optionally ``cat``, ``args`` and ``async`` (overlapping spans such as
+        derive round trips).
+        """
+        with self._lock:
+            tid = self._widgets.setdefault(widget_id, len(self._widgets) + 1)
+            for span in spans:
+                start = float(span["start"]) * 1000
+                dur = float(span.get("dur", 0)) * 1000
+                common = {
+                    "name": span["name"],
+                    "cat": span.get("cat", "widget"),
+                    "pid": WIDGET_PID,
+                    "tid": tid,
+                }
+                args = span.get("args", {})
+                if span.get("async"):
+                    common["id"] = next(self._async_ids)
+                    begin = {**common, "ph": "b", "ts": start, "args": args}
+                    end = {**common, "ph": "e", "ts": start + dur}
+                    self._events += [begin, end]
+                else:
+                    self._events.append(
+                        {
+                            **common,
+                            "ph": "X",
+                            "ts": start,
+                            "dur": dur,
+                            "args": args,
+                        }
+                    )
+        self._recorded()
+
+    def _recorded(self) -> None:
+        """Schedule a save for events recorded after trace() exited."""
+        if not self.closed:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self) -> None:
+        """Write events recorded after trace() exited now, if there are any."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def to_json(self) -> Dict[str, Any]:
+        """The trace in Chrome's JSON object format."""
+        with self._lock:
+            metadata = [
+                _metadata("process_name", KERNEL_PID, 0, "kernel"),
+                _metadata("process_name", WIDGET_PID, 0, "widgets"),
+            ]
+            metadata += [
+                _metadata("thread_name", KERNEL_PID, tid, name)
+                for tid, name in self._threads.items()
+            ]
+            metadata += [
+                _metadata("thread_name", WIDGET_PID, tid, widget_id)
+                for widget_id, tid in self._widgets.items()
+            ]
+            events = sorted(self._events, key=lambda e: e["ts"])
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def save(self) -> None:
+        """Write the trace file."""
+        data = self.to_json()
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+
+def _metadata(kind: str, pid: int, tid: int, name: str) -> Dict[str, Any]:
+    return {"name": kind, "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+
+
+@contextmanager
+def trace(path: str = "gofish-trace.json") -> Iterator[Tracer]:
+    """
+    Record a trace of everything GoFish does inside the block.
+
+    Open the file in chrome://tracing or https://ui.perfetto.dev.
+
+    Args:
+        path: File to write the trace to
+
+    Example:
+        >>> with gofish.trace("report.json"):
+        ...     for c in charts:
+        ...         display(c.render())
+    """
+    global _active
+    previous, tracer = _active, Tracer(path)
+    _active = tracer
+    try:
+        yield tracer
+    finally:
+        _active = previous
+        tracer.closed = True
+        tracer.save()
+
+
+def current_tracer() -> Optional[Tracer]:
+    """The tracer spans currently go to, if any."""
+    return _widget_tracer.get() or _active
+
+
+@contextmanager
+def use_tracer(tracer: Optional[Tracer]) -> Iterator[None]:
+    """
+    Send spans in the block to ``tracer``.
+
+    Widgets created inside ``trace()`` run their derives later, from worker
+    threads or tasks; this keeps those spans in the widget's trace.
+    """
+    if tracer is None:
+        yield
+        return
+    token = _widget_tracer.set(tracer)
+    try:
+        yield
+    finally:
+        _widget_tracer.reset(token)
+
+
+def span(name: str, cat: str = "kernel", concurrent: bool = False, **args):
+    """Record a span in the active trace; does nothing outside ``trace()``."""
+    tracer = current_tracer()
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, cat, concurrent, **args)
+
+
+def traced(name: str, cat: str = "kernel") -> Callable[[Callable], Callable]:
+    """Decorator recording each call of a function as a span."""
+
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = current_tracer()
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with tracer.span(name, cat):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,401 @@
+"""Columnar statistical transforms behind bin_(), density(), quantile(), etc.
+
+Every kernel takes a pyarrow Table and returns a new, usually much smaller,
+pyarrow Table. Work happens on whole columns with NumPy and pyarrow.compute,
+never on per-row Python dicts. Kernels accept an optional ``groupby`` list:
+the transform then runs once per group and the group keys are carried into
+the output rows.
+"""
+
+import math
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .executor import check_cancelled
+
+# Above this many points, density() bins the data before smoothing
+_KDE_EXACT_LIMIT = 4096
+_KDE_GRID = 2048
+
+_BOX_FIELDS = [
+    "count", "min", "lower", "q1", "median", "q3", "upper", "max", "outliers"
+]
+
+
+def _values(table: pa.Table, field: str) -> np.ndarray:
+    """Return the non-null values of a numeric column as float64."""
+    column = pc.drop_null(table.column(field))
+    return np.asarray(pc.cast(column, pa.float64()).to_numpy(zero_copy_only=False))
+
+
+def _groups(
+    table: pa.Table, groupby: Optional[Sequence[str]]
+) -> List[Tuple[Dict[str, Any], pa.Table]]:
+    """Split a table into (group key values, sub-table) pairs."""
+    if not groupby:
+        return [({}, table)]
+    if table.num_rows == 0:
+        # Still run the kernel once so the output has its columns
+        return [({field: None for field in groupby}, table)]
+    codes = np.zeros(table.num_rows, dtype=np.int64)
+    for field in groupby:
+        encoded = pc.dictionary_encode(table.column(field)).combine_chunks()
+        size = len(encoded.dictionary)
+        # Nulls become their own group after the dictionary values
+        indices = pc.fill_null(encoded.indices, size).to_numpy()
+        codes = codes * (size + 1) + indices.astype(np.int64)
+
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_codes)) + 1))
+    ends = np.concatenate((starts[1:], [len(order)]))
+
+    result = []
+    for start, end in zip(starts, ends):
+        indices = order[start:end]
+        first = int(indices[0])
+        key = {field: table.column(field)[first].as_py() for field in groupby}
+        result.append((key, table.take(pa.array(indices))))
+    return result
+
+
+def _grouped(
+    table: pa.Table,
+    groupby: Optional[Sequence[str]],
+    kernel: Callable[[pa.Table], Dict[str, Any]],
+) -> pa.Table:
+    """Run a kernel per group and concatenate its column dicts."""
+    columns: Dict[str, List[Any]] = {}
+    group_columns: Dict[str, List[Any]] = {field: [] for field in groupby or []}
+    for key, group in _groups(table, groupby):
+        check_cancelled()
+        out = kernel(group)
+        length = len(next(iter(out.values()))) if out else 0
+        for field, value in key.items():
+            group_columns[field].extend([value] * length)
+        for name, values in out.items():
+            columns.setdefault(name, []).extend(np.asarray(values).tolist())
+    data: Dict[str, Any] = {**group_columns, **columns}
+    return pa.table(data)
+
+
+def nice_step(span: float, maxbins: int) -> float:
+    """Pick a 1/2/5 x 10^k bin step giving at most ``maxbins`` bins."""
+    if span <= 0 or not math.isfinite(span):
+        return 1.0
+    raw = span / maxbins
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for multiple in (1, 2, 5, 10):
+        step = multiple * magnitude
+        if span / step <= maxbins:
+            return step
+    return 10 * magnitude
+
+
+def bin_table(
+    table: pa.Table,
+    field: str,
+    *,
+    maxbins: int = 10,
+    step: Optional[float] = None,
+    extent: Optional[Tuple[float, float]] = None,
+    groupby: Optional[Sequence[str]] = None,
+    as_: Tuple[str, str] = ("bin_start", "bin_end"),
+    count: str = "count",
+) -> pa.Table:
+    """Histogram ``field`` into equal-width bins and count rows per bin."""
+    all_values = _values(table, field)
+    if extent is None:
+        if len(all_values) == 0:
+            empty = {as_[0]: [], as_[1]: [], count: []}
+            return _grouped(table, groupby, lambda _: empty)
+        extent = (float(all_values.min()), float(all_values.max()))
+    lo, hi = extent
+    if step is None:
+        step = nice_step(hi - lo, maxbins)
+    # Align bins to multiples of the step, like Vega's nice binning
+    start = math.floor(lo / step) * step
+    nbins = max(1, int(math.ceil((hi - start) / step)))
+    if start + nbins * step <= hi:
+        nbins += 1
+
+    def kernel(group: pa.Table) -> Dict[str, Any]:
+        values = _values(group, field)
+        values = values[(values >= lo) & (values <= hi)]
+        index = np.floor((values - start) / step).astype(np.int64)
+        index = np.clip(index, 0, nbins - 1)
+        counts = np.bincount(index, minlength=nbins)
+        edges = start + step * np.arange(nbins + 1)
+        keep = counts > 0
+        return {
+            as_[0]: edges[:-1][keep],
+            as_[1]: edges[1:][keep],
+            count: counts[keep],
+        }
+
+    return _grouped(table, groupby, kernel)
+
+
+def density_table(
+    table: pa.Table,
+    field: str,
+    *,
+    bandwidth: Optional[float] = None,
+    extent: Optional[Tuple[float, float]] = None,
+    steps: int = 100,
+    groupby: Optional[Sequence[str]] = None,
+    as_: Tuple[str, str] = ("value", "density"),
+) -> pa.Table:
+    """Gaussian kernel density estimate of ``field`` sampled on a grid."""
+
+    def kernel(group: pa.Table) -> Dict[str, Any]:
+        values = _values(group, field)
+        n = len(values)
+        if n == 0:
+            return {as_[0]: [], as_[1]: []}
+        bw = bandwidth
+        if bw is None:
+            # Scott's rule of thumb
+            std = float(values.std(ddof=1)) if n > 1 else 0.0
+            bw = 1.06 * std * n ** (-1 / 5) if std > 0 else 1.0
+        lo, hi = extent if extent is not None else (values.min(), values.max())
+        grid = np.linspace(lo, hi, steps)
+
+        if n > _KDE_EXACT_LIMIT:
+            # Linear-time approximation: smooth a fine histogram instead
+            counts, edges = np.histogram(
+                values, bins=_KDE_GRID, range=(values.min(), values.max())
+            )
+            points = (edges[:-1] + edges[1:]) / 2
+            weights = counts.astype(np.float64)
+        else:
+            points = values
+            weights = np.ones(n)
+
+        z = (grid[:, None] - points[None, :]) / bw
+        kde = (np.exp(-0.5 * z * z) * weights[None, :]).sum(axis=1)
+        kde /= n * bw * math.sqrt(2 * math.pi)
+        return {as_[0]: grid, as_[1]: kde}
+
+    return _grouped(table, groupby, kernel)
+
+
+def quantile_table(
+    table: pa.Table,
+    field: str,
+    *,
+    probs: Sequence[float] = (0.25, 0.5, 0.75),
+    groupby: Optional[Sequence[str]] = None,
+    as_: Tuple[str, str] = ("prob", "value"),
+) -> pa.Table:
+    """One row per probability with the matching quantile of ``field``."""
+
+    def kernel(group: pa.Table) -> Dict[str, Any]:
+        values = _values(group, field)
+        if len(values) == 0:
+            return {as_[0]: [], as_[1]: []}
+        return {as_[0]: list(probs), as_[1]: np.quantile(values, list(probs))}
+
+    return _grouped(table, groupby, kernel)
+
+
+def box_summary_table(
+    table: pa.Table,
+    field: str,
+    *,
+    extent: float = 1.5,
+    groupby: Optional[Sequence[str]] = None,
+) -> pa.Table:
+    """Box-plot summary of ``field``: quartiles, whiskers and outlier count.
+
+    Whiskers extend to the most extreme values within ``extent`` times the
+    interquartile range of the box (Tukey's rule).
+    """
+
+    def kernel(group: pa.Table) -> Dict[str, Any]:
+        values = _values(group, field)
+        if len(values) == 0:
+            return {name: [] for name in _BOX_FIELDS}
+        q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        inside = values[(values >= q1 - extent * iqr) & (values <= q3 + extent * iqr)]
+        return {
+            "count": [len(values)],
+            "min": [values.min()],
+            "lower": [inside.min()],
+            "q1": [q1],
+            "median": [median],
+            "q3": [q3],
+            "upper": [inside.max()],
+            "max": [values.max()],
+            "outliers": [len(values) - len(inside)],
+        }
+
+    return _grouped(table, groupby, kernel)
+
+
+def regress_table(
+    table: pa.Table,
+    x: str,
+    y: str,
+    *,
+    method: str = "linear",
+    order: int = 2,
+    bandwidth: float = 0.3,
+    steps: Optional[int] = None,
+    groupby: Optional[Sequence[str]] = None,
+) -> pa.Table:
+    """Fit ``y`` against ``x`` and sample the fitted curve.
+
+    ``method`` is "linear", "poly" (of degree ``order``) or "loess" (locally
+    weighted linear regression over a ``bandwidth`` fraction of the points).
+    """
+    if method not in ("linear", "poly", "loess"):
+        raise ValueError(f"Unknown regression method: {method}")
+    if steps is None:
+        steps = 2 if method == "linear" else 100
+
+    def kernel(group: pa.Table) -> Dict[str, Any]:
+        group = group.filter(
+            pc.and_(pc.is_valid(group.column(x)), pc.is_valid(group.column(y)))
+        )
+        xs = _values(group, x)
+        ys = _values(group, y)
+        if len(xs) < 2:
+            return {x: [], y: []}
+        grid = np.linspace(xs.min(), xs.max(), steps)
+        if method == "loess":
+            fitted = _loess(xs, ys, grid, bandwidth)
+        else:
+            degree = 1 if method == "linear" else order
+            coeffs = np.polyfit(xs, ys, min(degree, len(xs) - 1))
+            fitted = np.polyval(coeffs, grid)
+        return {x: grid, y: fitted}
+
+    return _grouped(table, groupby, kernel)
+
+
+def _loess(
+    xs: np.ndarray, ys: np.ndarray, grid: np.ndarray, bandwidth: float
+) -> np.ndarray:
+    """Locally weighted linear regression with tricube weights."""
+    n = len(xs)
+    k = min(n, max(2, int(math.ceil(bandwidth * n))))
+    fitted = np.empty(len(grid))
+    for i, x0 in enumerate(grid):
+        dist = np.abs(xs - x0)
+        # Distance to the k-th nearest point (O(n) partial sort)
+        radius = np.partition(dist, k - 1)[k - 1]
+        if radius <= 0:
+            radius = dist.max() or 1.0
+        u = np.clip(dist / radius, 0, 1)
+        w = (1 - u ** 3) ** 3
+        sw = w.sum()
+        if sw <= 0:
+            fitted[i] = ys.mean()
+            continue
+        mx = (w * xs).sum() / sw
+        my = (w * ys).sum() / sw
+        var = (w * (xs - mx) ** 2).sum()
+        slope = (w * (xs - mx) * (ys - my)).sum() / var if var > 0 else 0.0
+        fitted[i] = my + slope * (x0 - mx)
+    return fitted
+
+
+TIME_UNITS = (
+    "year",
+    "quarter",
+    "month",
+    "week",
+    "day",
+    "hour",
+    "minute",
+    "second",
+    "millisecond",
+)
+
+
+def to_timestamp(column: Any) -> Any:
+    """Coerce a date, timestamp or ISO-8601 string column to timestamps."""
+    if pa.types.is_timestamp(column.type):
+        return column
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return pc.cast(column, pa.timestamp("ms"))
+    if pa.types.is_date(column.type):
+        return pc.cast(column, pa.timestamp("ms"))
+    raise TypeError(f"Cannot use column of type {column.type} as a time field")
+
+
+def time_unit_table(
+    table: pa.Table,
+    field: str,
+    *,
+    unit: str = "month",
+    step: int = 1,
+    format: Optional[str] = None,
+    as_: Optional[str] = None,
+) -> pa.Table:
+    """Truncate a time field to ``step`` x ``unit`` boundaries.
+
+    The truncated values are written to ``as_`` (default: ``field``) as
+    millisecond timestamps, or as strings when ``format`` (a strftime
+    pattern such as "%b" or "%Y-%m") is given.
+    """
+    from .arrow_utils import with_column
+
+    timestamps = to_timestamp(table.column(field))
+    truncated = pc.floor_temporal(
+        timestamps, multiple=step, unit=unit, week_starts_monday=False
+    )
+    if format is not None:
+        values = pc.strftime(truncated, format=format)
+    else:
+        values = pc.cast(truncated, pa.timestamp("ms", tz=timestamps.type.tz))
+    return with_column(table, as_ or field, values)
+
+
+def lookup_table(
+    table: pa.Table,
+    other: pa.Table,
+    *,
+    left: str,
+    right: str,
+    fields: Sequence[str],
+    default: Any = None,
+) -> pa.Table:
+    """Copy ``fields`` from the first ``other`` row whose ``right`` key matches.
+
+    Row order is preserved and unmatched rows get ``default``, like a left
+    join against a table with unique keys. Null keys never match, as in the
+    widget's hash index.
+    """
+    from .arrow_utils import with_column
+
+    # index_in hashes other[right] once and returns first-match positions
+    positions = pc.index_in(
+        table.column(left), value_set=other.column(right), skip_nulls=True
+    )
+    for name in fields:
+        values = other.column(name).take(positions)
+        if default is not None:
+            values = pc.fill_null(values, default)
+        table = with_column(table, name, values)
+    return table
+
+
+def repeat_table(table: pa.Table, field: str) -> pa.Table:
+    """Repeat each row ``field`` times with a single index-vector take().
+
+    Fractional counts are truncated towards zero; null and NaN count as 0.
+    """
+    column = pc.fill_null(table.column(field), 0)
+    if pa.types.is_floating(column.type):
+        values = np.nan_to_num(column.to_numpy(zero_copy_only=False), nan=0.0)
+        counts = values.astype(np.int64)
+    else:
+        counts = pc.cast(column, pa.int64()).to_numpy(zero_copy_only=False)
+    index = np.repeat(np.arange(table.num_rows), np.maximum(counts, 0))
+    return table.take(pa.array(index))
@@ -0,0 +1,409 @@
+"""Transpile simple derive() lambdas into declarative IR operators.
+
+Many derive callbacks follow a handful of shapes that the widget can run
+natively. When a lambda matches one of them, its DeriveOperator serializes to
+the equivalent IR operator instead of an RPC call back into the kernel:
+
+    lambda d: sorted(d, key=lambda r: r["count"])          -> sort
+    lambda d: [{**row, "x": f(row["y"])} for row in d]     -> calculate
+    lambda d: [row for row in d if row["x"] > 0]           -> filter
+
+Anything else (or any lambda whose source cannot be recovered) returns None and
+keeps using the derive RPC.
+
+Free names are only inlined into the IR when they cannot change after the spec
+is built: module globals annotated ``Final`` (``LIMIT: Final = 5``). Any other
+global or closure variable keeps the lambda on the RPC, which reads its value
+at call time.
+"""
+
+import ast
+import builtins
+import inspect
+import linecache
+import math
+import operator
+import os
+import textwrap
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from .expr import ExpressionError, _Converter, _subscript_key, make_call
+
+_MISSING = object()
+
+# Parsed source files by (filename, mtime); bounded, cleared when full
+_MODULE_CACHE: Dict[Tuple[str, Optional[int]], Optional[ast.AST]] = {}
+_MODULE_CACHE_SIZE = 64
+
+# Python callables that map onto expression-language functions
+_FUNCTIONS: Dict[Any, str] = {
+    abs: "abs",
+    min: "min",
+    max: "max",
+    pow: "pow",
+    math.sqrt: "sqrt",
+    math.exp: "exp",
+    math.log: "log",
+    math.log10: "log10",
+    math.log2: "log2",
+    math.floor: "floor",
+    math.ceil: "ceil",
+    math.pow: "pow",
+    math.fabs: "abs",
+}
+
+
+def transpile(fn: Callable) -> Optional[dict]:
+    """
+    Translate a derive lambda into a declarative IR operator if possible.
+
+    Args:
+        fn: Function passed to derive()
+
+    Returns:
+        IR operator dict (``sort``, ``calculate`` or ``filter``), or None when
+        the function does not match a supported pattern
+    """
+    found = _find_lambda(fn)
+    if found is None:
+        return None
+    node, finals = found
+    args = node.args
+    if (
+        len(args.args) != 1
+        or args.vararg
+        or args.kwarg
+        or args.kwonlyargs
+        or args.defaults
+    ):
+        return None
+    data_name = args.args[0].arg
+    try:
+        return _Transpiler(fn, data_name, finals).transpile(node.body)
+    except ExpressionError:
+        return None
+
+
+def _find_lambda(fn: Callable) -> Optional[Tuple[ast.Lambda, FrozenSet[str]]]:
+    """Locate the ast.Lambda node that compiled to ``fn``, and its module's
+    ``Final`` names."""
+    code = getattr(fn, "__code__", None)
+    if code is None or code.co_name != "<lambda>":
+        return None
+
+    tree = _parse_source(fn, code)
+    if tree is None:
+        return None
+
+    arg_names = code.co_varnames[: code.co_argcount]
+    candidates: List[ast.Lambda] = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Lambda):
+            continue
+        if node.lineno != code.co_firstlineno:
+            continue
+        if tuple(a.arg for a in node.args.args) != arg_names:
+            continue
+        candidates.append(node)
+    # Several identical-looking lambdas on one line: give up rather than guess
+    if len(candidates) != 1:
+        return None
+    return candidates[0], _final_names(tree)
+
+
+def _parse_source(fn: Callable, code: Any) -> Optional[ast.AST]:
+    """Parse the source file (or notebook cell) that defines ``fn``."""
+    tree = _parse_module(code.co_filename, getattr(fn, "__globals__", None))
+    if tree is not None:
+        return tree
+    # Fall back to the enclosing statement only; renumber to match the code
+    try:
+        source_lines, start = inspect.getsourcelines(fn)
+    except (OSError, TypeError):
+        return None
+    source = textwrap.dedent("".join(source_lines)).strip().rstrip(",")
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    ast.increment_lineno(tree, max(start, 1) - 1)
+    return tree
+
+
+def _parse_module(filename: str, module_globals: Any) -> Optional[ast.AST]:
+    """Parse a whole source file, cached until its mtime changes."""
+    try:
+        stamp: Optional[int] = os.stat(filename).st_mtime_ns
+    except OSError:
+        # Notebook cells: IPython gives every cell source its own filename
+        stamp = None
+    key = (filename, stamp)
+    if key in _MODULE_CACHE:
+        return _MODULE_CACHE[key]
+    if stamp is not None:
+        linecache.checkcache(filename)
+    lines = linecache.getlines(filename, module_globals)
+    tree: Optional[ast.AST] = None
+    if lines:
+        try:
+            tree = ast.parse("".join(lines))
+        except SyntaxError:
+            pass
+    if len(_MODULE_CACHE) >= _MODULE_CACHE_SIZE:
+        _MODULE_CACHE.clear()
+    _MODULE_CACHE[key] = tree
+    return tree
+
+
+def _final_names(tree: ast.AST) -> FrozenSet[str]:
+    """Module-level names annotated ``Final`` / ``typing.Final[...]``."""
+    names = set()
+    for node in getattr(tree, "body", ()):
+        if not (isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name)):
+            continue
+        annotation = node.annotation
+        if isinstance(annotation, ast.Subscript):
+            annotation = annotation.value
+        if (isinstance(annotation, ast.Name) and annotation.id == "Final") or (
+            isinstance(annotation, ast.Attribute) and annotation.attr == "Final"
+        ):
+            names.add(node.target.id)
+    return frozenset(names)
+
+
+class _Transpiler:
+    """Pattern-matches a lambda body against the supported derive shapes."""
+
+    def __init__(self, fn: Callable, data_name: str, finals: FrozenSet[str]):
+        self.fn = fn
+        self.data_name = data_name
+        # Globals that may be inlined as literals
+        self.finals = finals
+
+    def resolve(self, name: str) -> Any:
+        """Resolve a free name the way the lambda would at call time."""
+        code = self.fn.__code__
+        if code.co_freevars and self.fn.__closure__:
+            cells = dict(zip(code.co_freevars, self.fn.__closure__))
+            if name in cells:
+                try:
+                    return cells[name].cell_contents
+                except ValueError:
+                    return _MISSING
+        globals_ = getattr(self.fn, "__globals__", {})
+        if name in globals_:
+            return globals_[name]
+        return getattr(builtins, name, _MISSING)
+
+    def is_data(self, node: ast.AST) -> bool:
+        return isinstance(node, ast.Name) and node.id == self.data_name
+
+    def transpile(self, body: ast.AST) -> Optional[dict]:
+        if isinstance(body, ast.Call):
+            return self._sorted(body)
+        if isinstance(body, ast.ListComp):
+            return self._comprehension(body)
+        return None
+
+    # -- sorted(d, key=..., reverse=...) ---------------------------------
+
+    def _sorted(self, call: ast.Call) -> Optional[dict]:
+        func = call.func
+        if not (isinstance(func, ast.Name) and self.resolve(func.id) is sorted):
+            return None
+        if len(call.args) != 1 or not self.is_data(call.args[0]):
+            return None
+        key_node: Optional[ast.AST] = None
+        reverse = False
+        for kw in call.keywords:
+            if kw.arg == "key":
+                key_node = kw.value
+            elif kw.arg == "reverse":
+                value = self._constant(kw.value)
+                if not isinstance(value, bool):
+                    return None
+                reverse = value
+            else:
+                return None
+        if key_node is None:
+            return None
+
+        keys = self._sort_keys(key_node)
+        if not keys:
+            return None
+        by = [field for field, _ in keys]
+        order = [
+            "descending" if descending != reverse else "ascending"
+            for _, descending in keys
+        ]
+        return {"type": "sort", "by": by, "order": order}
+
+    def _sort_keys(self, key: ast.AST) -> Optional[List[tuple]]:
+        """Return [(field, descending)] for a sort key, or None."""
+        # key=operator.itemgetter("a", "b")
+        if isinstance(key, ast.Call) and not key.keywords:
+            target = self._callable(key.func)
+            if target is operator.itemgetter and key.args:
+                names = [self._constant(arg) for arg in key.args]
+                if all(isinstance(n, str) for n in names):
+                    return [(n, False) for n in names]
+            return None
+        # key=lambda r: r["a"] / (r["a"], -r["b"])
+        if not isinstance(key, ast.Lambda) or len(key.args.args) != 1:
+            return None
+        row = key.args.args[0].arg
+        parts = key.body.elts if isinstance(key.body, ast.Tuple) else [key.body]
+        keys = []
+        for part in parts:
+            descending = False
+            if isinstance(part, ast.UnaryOp) and isinstance(part.op, ast.USub):
+                descending = True
+                part = part.operand
+            field = _row_field(part, row)
+            if field is None:
+                return None
+            keys.append((field, descending))
+        return keys
+
+    # -- list comprehensions over d ---------------------------------------
+
+    def _comprehension(self, comp: ast.ListComp) -> Optional[dict]:
+        if len(comp.generators) != 1:
+            return None
+        gen = comp.generators[0]
+        if (
+            getattr(gen, "is_async", 0)
+            or not isinstance(gen.target, ast.Name)
+            or not self.is_data(gen.iter)
+        ):
+            return None
+        row = gen.target.id
+
+        # [row for row in d if cond]
+        if isinstance(comp.elt, ast.Name) and comp.elt.id == row:
+            if not gen.ifs:
+                return None
+            converter = _RowConverter(self, row, allow_bool=True)
+            tests = [converter.convert(cond) for cond in gen.ifs]
+            expr = tests[0]
+            for test in tests[1:]:
+                expr = {"type": "binary", "op": "and", "left": expr, "right": test}
+            return {"type": "filter", "expr": expr}
+
+        # [{**row, "x": expr} for row in d]
+        if isinstance(comp.elt, ast.Dict) and not gen.ifs:
+            keys, values = comp.elt.keys, comp.elt.values
+            if (
+                len(keys) != 2
+                or keys[0] is not None
+                or not (isinstance(values[0], ast.Name) and values[0].id == row)
+            ):
+                return None
+            name = self._constant(keys[1])
+            if not isinstance(name, str):
+                return None
+            converter = _RowConverter(self, row, allow_bool=False)
+            return {
+                "type": "calculate",
+                "name": name,
+                "expr": converter.convert(values[1]),
+            }
+        return None
+
+    # -- helpers ----------------------------------------------------------
+
+    def _constant(self, node: ast.AST) -> Any:
+        """Literal value of a node: a constant, or a ``Final`` module global."""
+        if isinstance(node, ast.Constant):
+            return node.value
+        if (
+            isinstance(node, ast.Name)
+            and node.id in self.finals
+            and node.id not in self.fn.__code__.co_freevars
+        ):
+            value = getattr(self.fn, "__globals__", {}).get(node.id, _MISSING)
+            if isinstance(value, (bool, int, float, str)):
+                return value
+        return _MISSING
+
+    def _callable(self, node: ast.AST) -> Any:
+        if isinstance(node, ast.Name):
+            return self.resolve(node.id)
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            owner = self.resolve(node.value.id)
+            if owner is _MISSING:
+                return _MISSING
+            return getattr(owner, node.attr, _MISSING)
+        return _MISSING
+
+
+def _row_field(node: ast.AST, row: str) -> Optional[str]:
+    """Return the field name for ``row["f"]`` / ``row.get("f")``, else None."""
+    if (
+        isinstance(node, ast.Subscript)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == row
+    ):
+        try:
+            return _subscript_key(node)
+        except ExpressionError:
+            return None
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "get"
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == row
+        and len(node.args) == 1
+        and not node.keywords
+        and isinstance(node.args[0], ast.Constant)
+        and isinstance(node.args[0].value, str)
+    ):
+        return node.args[0].value
+    return None
+
+
+class _RowConverter(_Converter):
+    """Converts per-row expressions from a lambda body into expression IR."""
+
+    def __init__(self, transpiler: _Transpiler, row: str, allow_bool: bool):
+        self.transpiler = transpiler
+        self.row = row
+        # Python's and/or return operands, not booleans; only safe in filters
+        self.allow_bool = allow_bool
+
+    def visit_Name(self, node: ast.Name) -> dict:
+        value = self.transpiler._constant(node)
+        if value is _MISSING:
+            raise ExpressionError(f"Cannot inline name: {node.id}")
+        return {"type": "literal", "value": value}
+
+    def visit_Subscript(self, node: ast.Subscript) -> dict:
+        field = _row_field(node, self.row)
+        if field is None:
+            raise ExpressionError("Unsupported subscript")
+        return {"type": "field", "name": field}
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> dict:
+        if not self.allow_bool:
+            raise ExpressionError("and/or only supported in filters")
+        return super().visit_BoolOp(node)
+
+    def visit_Call(self, node: ast.Call) -> dict:
+        field = _row_field(node, self.row)
+        if field is not None:
+            return {"type": "field", "name": field}
+        if node.keywords:
+            raise ExpressionError("Keyword arguments are not supported")
+        target = self.transpiler._callable(node.func)
+        try:
+            fn = _FUNCTIONS.get(target)
+        except TypeError:  # unhashable
+            fn = None
+        if fn is None:
+            raise ExpressionError("Unsupported function call")
+        # min(x)/max(x) of a scalar would be an aggregate in the expression
+        # language; Python only allows the element-wise form here
+        if fn in ("min", "max") and len(node.args) != 2:
+            raise ExpressionError(f"{fn}() needs two arguments")
+        return make_call(fn, [self.convert(arg) for arg in node.args])
@@ -1,14 +1,495 @@
 """AnyWidget-based chart rendering for GoFish."""
 
+import asyncio
 import base64
+import inspect
+import threading
 import uuid
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import anywidget
 import traitlets
 
-from .arrow_utils import arrow_to_dataframe, dataframe_to_arrow
+from .arrow_utils import (
+    arrow_to_dataframe,
+    arrow_to_table,
+    concat_tables,
+    dataframe_to_arrow,
+    table_to_arrow,
+    to_arrow_table,
+)
+from .executor import DeriveCancelled, DeriveExecutor, check_cancelled
+from .trace import current_tracer, span, use_tracer
+from .stats import (
+    PROFILERS,
+    DeriveMeasurement,
+    DeriveStats,
+    profile_call,
+    session_render_timings,
+    session_stats,
+)
+
+
+# Version of the widget <-> kernel derive protocol, reported by _derive_hello
+DERIVE_PROTOCOL = 4
+
+
+# Receives each encoded chunk of a streamed derive result
+ChunkSink = Callable[[bytes], None]
+
+
+def run_derive(
+    fn: Callable,
+    arrow_bytes: bytes,
+    emit: Optional[ChunkSink] = None,
+    measure: Optional[DeriveMeasurement] = None,
+) -> Optional[bytes]:
+    """
+    Run a derive function on Arrow IPC input and return Arrow IPC output.
+
+    Columnar transforms receive the decoded pyarrow Table directly; other
+    functions receive a list of row dicts, matching the JS convention.
+
+    Generator functions stream their result: each yielded chunk (a list of
+    row dicts, DataFrame, pyarrow Table or RecordBatch) is encoded on its own
+    and passed to ``emit`` as soon as it is produced, so the full result is
+    never held in memory. Without ``emit`` the chunks are concatenated.
+
+    Args:
+        fn: Registered derive function
+        arrow_bytes: Arrow IPC stream with the input rows
+        emit: Callback receiving the Arrow IPC bytes of each streamed chunk
+        measure: Receives row and byte counts and decode/fn/encode times
+
+    Returns:
+        Arrow IPC bytes of the result, or None if it was streamed to ``emit``
+    """
+    from .ast import ColumnarFunction
+
+    m = measure or DeriveMeasurement()
+    m.bytes_in += len(arrow_bytes)
+    if isinstance(fn, ColumnarFunction):
+        with m.phase("decode"):
+            table = arrow_to_table(arrow_bytes)
+        m.rows_in += table.num_rows
+        with m.phase("fn"):
+            out = fn.transform(table)
+        m.rows_out += out.num_rows
+        with m.phase("encode"):
+            return m.encoded(table_to_arrow(out))
+
+    with m.phase("decode"):
+        rows = _decode_rows(arrow_bytes)
+    m.rows_in += len(rows)
+    check_cancelled()
+    with m.phase("fn"):
+        result = fn(rows)
+        # Async derives called outside the kernel's event loop
+        if inspect.isasyncgen(result):
+            result = _ChunkList(asyncio.run(_collect(result)))
+        elif inspect.isawaitable(result):
+            result = asyncio.run(_awaited(result))
+    if _is_stream(result):
+        return _stream_chunks(result, emit, m)
+    check_cancelled()
+    with m.phase("encode"):
+        frame = _result_frame(result)
+        m.rows_out += len(frame)
+        return m.encoded(dataframe_to_arrow(frame))
+
+
+async def run_derive_async(
+    fn: Callable,
+    arrow_bytes: bytes,
+    emit: Optional[ChunkSink] = None,
+    measure: Optional[DeriveMeasurement] = None,
+) -> Optional[bytes]:
+    """
+    Run an ``async def`` derive function on Arrow IPC input.
+
+    Decoding and encoding run on the loop's default executor, so the event
+    loop only does the awaiting. Async generators stream like generators in
+    run_derive().
+
+    Args:
+        fn: Registered coroutine or async generator function
+        arrow_bytes: Arrow IPC stream with the input rows
+        emit: Callback receiving the Arrow IPC bytes of each streamed chunk
+        measure: Receives row and byte counts and decode/fn/encode times;
+            fn time includes the awaits
+
+    Returns:
+        Arrow IPC bytes of the result, or None if it was streamed to ``emit``
+    """
+    loop = asyncio.get_running_loop()
+    m = measure or DeriveMeasurement()
+    m.bytes_in += len(arrow_bytes)
+    with m.phase("decode"):
+        rows = await loop.run_in_executor(None, _decode_rows, arrow_bytes)
+    m.rows_in += len(rows)
+    result = fn(rows)
+    if inspect.isasyncgen(result):
+        tables = []
+        chunks = result.__aiter__()
+        while True:
+            with m.phase("fn"):
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+            with m.phase("encode"):
+                table = await loop.run_in_executor(None, _chunk_table, chunk)
+                m.rows_out += table.num_rows
+                if emit is None:
+                    tables.append(table)
+                else:
+                    chunk_arrow = await loop.run_in_executor(
+                        None, table_to_arrow, table
+                    )
+                    emit(m.encoded(chunk_arrow))
+        if emit is not None:
+            return None
+        with m.phase("encode"):
+            return m.encoded(_concat_chunks(tables))
+    with m.phase("fn"):
+        result = await result
+    if _is_stream(result):
+        return await loop.run_in_executor(None, _stream_chunks, result, emit, m)
+    with m.phase("encode"):
+        frame = await loop.run_in_executor(None, _result_frame, result)
+        m.rows_out += len(frame)
+        return m.encoded(
+            await loop.run_in_executor(None, dataframe_to_arrow, frame)
+        )
+
+
+async def _awaited(awaitable):
+    return await awaitable
+
+
+async def _collect(chunks) -> list:
+    return [chunk async for chunk in chunks]
+
+
+def _is_stream(result: Any) -> bool:
+    """Whether a derive result is a stream of chunks rather than rows."""
+    import pyarrow as pa
+
+    return inspect.isgenerator(result) or isinstance(
+        result, (pa.RecordBatchReader, _ChunkList)
+    )
+
+
+class _ChunkList(list):
+    """Chunks of an async generator drained outside an event loop."""
+
+
+_END = object()
+
+
+def _stream_chunks(
+    chunks: Any, emit: Optional[ChunkSink], m: DeriveMeasurement
+) -> Optional[bytes]:
+    """Encode each chunk as it is produced; concatenate them without emit."""
+    tables = []
+    chunks = iter(chunks)
+    while True:
+        check_cancelled()
+        # Generators do their work when the next chunk is requested
+        with m.phase("fn"):
+            chunk = next(chunks, _END)
+        if chunk is _END:
+            break
+        with m.phase("encode"):
+            table = _chunk_table(chunk)
+            m.rows_out += table.num_rows
+            if emit is None:
+                tables.append(table)
+            else:
+                emit(m.encoded(table_to_arrow(table)))
+    if emit is not None:
+        return None
+    with m.phase("encode"):
+        return m.encoded(_concat_chunks(tables))
+
+
+def _chunk_table(chunk: Any) -> Any:
+    """Convert one streamed chunk to a pyarrow Table."""
+    import pyarrow as pa
+
+    if isinstance(chunk, pa.RecordBatch):
+        return pa.Table.from_batches([chunk])
+    return to_arrow_table(chunk)
+
+
+def _concat_chunks(tables: List[Any]) -> bytes:
+    if not tables:
+        return dataframe_to_arrow(_result_frame(None))
+    return table_to_arrow(concat_tables(tables))
+
+
+def _decode_rows(arrow_bytes: bytes) -> List[dict]:
+    """Decode Arrow IPC input into the row dicts derive functions receive."""
+    return arrow_to_dataframe(arrow_bytes).to_dict("records")
+
+
+def _result_frame(result: Any) -> Any:
+    """Normalize a derive function's result (rows, DataFrame or None)."""
+    try:
+        import pandas as pd
+    except Exception as exc:  # pragma: no cover - import guard
+        raise RuntimeError("pandas is required for derive execution") from exc
+
+    if result is None:
+        return pd.DataFrame()
+    if isinstance(result, pd.DataFrame):
+        return result
+    return pd.DataFrame(result)
+
+
+class ResponseBatch:
+    """
+    Final responses of one ``derive_requests`` batch, published together.
+
+    Each request settles once: with its response, or without one when its
+    render generation is cancelled. When the last request settles, the
+    collected responses are returned so the caller can send them in a single
+    sync.
+    """
+
+    def __init__(self, requests: List[dict]):
+        self._lock = threading.Lock()
+        # requestId -> generation of the requests still running
+        self._waiting = {r.get("requestId"): r.get("generation") for r in requests}
+        self._responses: List[dict] = []
+        self._done = False
+
+    def settle(
+        self, request_id: str, response: Optional[dict]
+    ) -> Optional[List[dict]]:
+        """Record a request's response (None if cancelled).
+
+        Returns:
+            The batch's responses once every request has settled, else None
+        """
+        with self._lock:
+            if request_id not in self._waiting:
+                return None
+            del self._waiting[request_id]
+            if response is not None:
+                self._responses.append(response)
+            return self._finish()
+
+    def cancel(self, generations: Iterable[Any]) -> Optional[List[dict]]:
+        """Settle the requests of cancelled generations; see settle()."""
+        targets = set(generations)
+        with self._lock:
+            for request_id, generation in list(self._waiting.items()):
+                if generation in targets:
+                    del self._waiting[request_id]
+            return self._finish()
+
+    def _finish(self) -> Optional[List[dict]]:
+        if self._waiting or self._done:
+            return None
+        self._done = True
+        return self._responses
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def call_on_loop(
+    loop: Optional[asyncio.AbstractEventLoop], fn: Callable, *args
+) -> None:
+    """
+    Call ``fn(*args)`` on ``loop``'s thread.
+
+    Traitlets and ipykernel comms are not thread-safe, so derive workers hand
+    responses back to the kernel's event loop instead of touching the widget
+    themselves. Without a loop, or on the loop's own thread, ``fn`` runs now.
+    """
+    if loop is None or _running_loop() is loop:
+        fn(*args)
+        return
+    try:
+        loop.call_soon_threadsafe(fn, *args)
+    except RuntimeError:
+        # The loop is closed: the kernel is shutting down and nobody reads
+        # the comm any more
+        pass
+
+
+def is_async_derive(fn: Callable) -> bool:
+    """Whether a derive function is an ``async def`` function or generator."""
+    return inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn)
+
+
+def answer_derive_request(
+    derive_functions: Dict[str, Callable],
+    request: dict,
+    emit: Optional[Callable[[dict], None]] = None,
+    stats: Optional[DeriveStats] = None,
+    profiler: Optional[str] = None,
+) -> dict:
+    """
+    Run one queued derive request and build its response.
+
+    Failures are reported in the response instead of raised, so one bad
+    request does not drop the rest of its batch. Every call is recorded in
+    the session stats (and ``stats``, if given).
+
+    Args:
+        derive_functions: Map of lambda_id -> derive function
+        request: Dict with requestId, lambdaId and arrowB64
+        emit: Callback receiving partial responses (requestId, chunkB64,
+            seq) of a streamed result as they are produced
+        stats: Per-widget stats to record the call in
+        profiler: Run the derive under ``"cprofile"`` or ``"tracemalloc"``
+            and attach the report to ``stats``
+
+    Returns:
+        Dict with requestId and either resultB64, error, or the number of
+        streamed chunks
+    """
+    fn, error_response = _resolve_derive(derive_functions, request)
+    if fn is None:
+        return error_response
+    chunks = _ChunkEmitter(request, emit)
+    measure = DeriveMeasurement()
+
+    def call():
+        arrow_bytes = base64.b64decode(request["arrowB64"])
+        return run_derive(fn, arrow_bytes, chunks.sink, measure)
+
+    try:
+        with span("derive", "derive", lambda_id=request["lambdaId"], fn=_name(fn)):
+            if profiler is None:
+                result_arrow = call()
+            else:
+                result_arrow, report = profile_call(profiler, call)
+                if stats is not None:
+                    stats.attach_profile(request["lambdaId"], profiler, report)
+    except DeriveCancelled:
+        raise
+    except Exception as exc:
+        _record(request, fn, measure, True, stats)
+        return _error_response(request, exc)
+    _record(request, fn, measure, False, stats)
+    return _result_response(request, result_arrow, chunks.count)
+
+
+async def answer_derive_request_async(
+    derive_functions: Dict[str, Callable],
+    request: dict,
+    emit: Optional[Callable[[dict], None]] = None,
+    stats: Optional[DeriveStats] = None,
+) -> dict:
+    """Like answer_derive_request(), awaiting an ``async def`` derive."""
+    fn, error_response = _resolve_derive(derive_functions, request)
+    if fn is None:
+        return error_response
+    chunks = _ChunkEmitter(request, emit)
+    measure = DeriveMeasurement()
+    try:
+        with span(
+            "derive",
+            "derive",
+            concurrent=True,
+            lambda_id=request["lambdaId"],
+            fn=_name(fn),
+        ):
+            result_arrow = await run_derive_async(
+                fn, base64.b64decode(request["arrowB64"]), chunks.sink, measure
+            )
+    except (DeriveCancelled, asyncio.CancelledError):
+        raise
+    except Exception as exc:
+        _record(request, fn, measure, True, stats)
+        return _error_response(request, exc)
+    _record(request, fn, measure, False, stats)
+    return _result_response(request, result_arrow, chunks.count)
+
+
+def _record(
+    request: dict,
+    fn: Callable,
+    measure: DeriveMeasurement,
+    error: bool,
+    stats: Optional[DeriveStats],
+) -> None:
+    """Record a finished derive call in the session and widget stats."""
+    for target in (session_stats, stats):
+        if target is not None:
+            target.record(request["lambdaId"], measure, name=_name(fn), error=error)
+
+
+def _name(fn: Callable) -> str:
+    return getattr(fn, "__qualname__", type(fn).__name__)
+
+
+class _ChunkEmitter:
+    """Wraps streamed result chunks in numbered partial responses."""
+
+    def __init__(self, request: dict, emit: Optional[Callable[[dict], None]]):
+        self.request_id = request.get("requestId")
+        self.emit = emit
+        self.count = 0
+        self.sink: Optional[ChunkSink] = self._send if emit is not None else None
+
+    def _send(self, chunk_arrow: bytes) -> None:
+        self.emit(
+            {
+                "requestId": self.request_id,
+                "chunkB64": base64.b64encode(chunk_arrow).decode("utf-8"),
+                "seq": self.count,
+            }
+        )
+        self.count += 1
+
+
+def _resolve_derive(
+    derive_functions: Dict[str, Callable], request: dict
+) -> Tuple[Optional[Callable], Optional[dict]]:
+    """Look up a request's derive function, or build its error response."""
+    request_id = request.get("requestId")
+    lambda_id = request.get("lambdaId")
+    if not lambda_id or not request.get("arrowB64"):
+        return None, {
+            "requestId": request_id,
+            "error": "Missing lambdaId or arrowB64",
+        }
+    fn = derive_functions.get(lambda_id)
+    if fn is None:
+        return None, {
+            "requestId": request_id,
+            "error": f"Derive function with ID {lambda_id} not found",
+        }
+    return fn, None
+
+
+def _error_response(request: dict, exc: BaseException) -> dict:
+    return {
+        "requestId": request.get("requestId"),
+        "error": f"{type(exc).__name__}: {exc}",
+    }
+
+
+def _result_response(
+    request: dict, result_arrow: Optional[bytes], chunks: int = 0
+) -> dict:
+    if result_arrow is None:
+        # The rows already went out as partial responses
+        return {"requestId": request.get("requestId"), "chunks": chunks}
+    return {
+        "requestId": request.get("requestId"),
+        "resultB64": base64.b64encode(result_arrow).decode("utf-8"),
+    }
 
 
 class GoFishChartWidget(anywidget.AnyWidget):
@@ -23,9 +504,21 @@ class GoFishChartWidget(anywidget.AnyWidget):
     axes = traitlets.Bool(False).tag(sync=True)
     debug = traitlets.Bool(False).tag(sync=True)
     container_id = traitlets.Unicode().tag(sync=True)
-    # Traitlet-based derive protocol (for marimo compatibility)
-    derive_request = traitlets.Dict({}).tag(sync=True)
-    derive_response = traitlets.Dict({}).tag(sync=True)
+    # Queued derive protocol (for hosts without commands, e.g. marimo): each
+    # sync carries a batch of requests or responses
+    derive_requests = traitlets.List([]).tag(sync=True)
+    derive_responses = traitlets.List([]).tag(sync=True)
+    # Render generations whose derive requests the frontend no longer needs
+    derive_cancel = traitlets.List([]).tag(sync=True)
+    # Whether any view of the widget is on screen; visible widgets' derives
+    # are scheduled first
+    visible = traitlets.Bool(False).tag(sync=True)
+    # Kernel-side render stages (encode time, send timestamp, payload size)
+    kernel_timings = traitlets.Dict({}).tag(sync=True)
+    # Per-stage timings (ms) of the latest render, reported by the frontend
+    timings = traitlets.Dict({}).tag(sync=True)
+    # Whether the frontend should send its render spans to a gofish.trace()
+    tracing = traitlets.Bool(False).tag(sync=True)
 
     def __init__(
         self,
@@ -36,6 +529,7 @@ class GoFishChartWidget(anywidget.AnyWidget):
         height: int = 600,
         axes: bool = False,
         debug: bool = False,
+        kernel_timings: Optional[Dict[str, float]] = None,
         **kwargs,
     ):
         """Initialize the GoFish chart widget.
@@ -48,6 +542,7 @@ class GoFishChartWidget(anywidget.AnyWidget):
             axes: Whether to show axes
             debug: Whether to enable debug mode
             derive_functions: Map of lambda_id -> Python callable for derive
+            kernel_timings: Kernel-side render stages, completed by the widget
             **kwargs: Additional widget arguments
         """
         # Generate unique container ID
@@ -55,6 +550,15 @@ class GoFishChartWidget(anywidget.AnyWidget):
 
         # Store derive registry locally (not synced to the frontend)
         self.derive_functions = derive_functions or {}
+        self._derive_lock = threading.Lock()
+        self._derive_executor = DeriveExecutor()
+        self._derive_stats = DeriveStats()
+        # lambda_id (None for any) -> profiler for its next sync call
+        self._profile_next: Dict[Optional[str], str] = {}
+        # Trace this widget's spans go to, if created inside gofish.trace()
+        self._tracer = current_tracer()
+        # derive_requests batches whose responses are still being collected
+        self._response_batches: List[ResponseBatch] = []
 
         # Load the self-contained widget bundle
         # The bundle includes all dependencies (gofish-graphics, solid-js, apache-arrow)
@@ -88,91 +592,226 @@ class GoFishChartWidget(anywidget.AnyWidget):
             axes=axes,
             debug=debug,
             container_id=container_id,
+            kernel_timings=kernel_timings or {},
+            tracing=self._tracer is not None,
             **kwargs,
         )
+        self.on_msg(self._on_custom_msg)
+
+    def _on_custom_msg(self, widget, content, buffers):
+        """Collect render spans the frontend reports while tracing."""
+        if content.get("type") == "trace_spans" and self._tracer is not None:
+            self._tracer.add_widget_spans(self.container_id, content.get("spans", []))
 
     @anywidget.experimental.command
-    def _execute_derive(self, msg: dict, buffers: list):
-        """Execute a derive function and return Arrow data as base64.
+    def _derive_hello(self, msg: dict, buffers: list):
+        """Capability handshake sent by the frontend at render time.
+
+        A successful reply tells the widget that commands work in this host;
+        otherwise it falls back to the derive_requests queue.
+        """
+        return {"protocol": DERIVE_PROTOCOL, "transports": ["invoke", "queue"]}, []
+
+    @anywidget.experimental.command
+    def _submit_derive(self, msg: dict, buffers: list):
+        """Queue a derive request; the result is sent as a custom message.
+
+        Returning immediately keeps the kernel free to receive cancellations
+        while the derive runs on a worker thread.
 
         Args:
-            msg: Message containing lambdaId and arrowB64
+            msg: Message containing requestId, lambdaId, arrowB64, generation
             buffers: Optional buffers (not used for derive)
 
         Returns:
-            Tuple of (response dict, buffers list)
+            Tuple of (acknowledgement dict, buffers list)
         """
-        lambda_id = msg.get("lambdaId")
-        arrow_b64 = msg.get("arrowB64")
-
-        if not lambda_id or not arrow_b64:
-            raise ValueError(f"Missing required fields: lambdaId and arrowB64")
-
-        # Locate Python function for this lambda_id
-        fn = self.derive_functions.get(lambda_id)
-        if fn is None:
-            raise ValueError(f"Derive function with ID {lambda_id} not found")
-
-        # Decode Arrow to list of row dicts
-        arrow_bytes = base64.b64decode(arrow_b64)
-        df = arrow_to_dataframe(arrow_bytes)
-
-        # Execute user function (receives list of dicts, matching JS convention)
-        result = fn(df.to_dict("records"))
-
-        # Normalize result to DataFrame
-        try:
-            import pandas as pd
-        except Exception as exc:  # pragma: no cover - import guard
-            raise RuntimeError("pandas is required for derive execution") from exc
-
-        if result is None:
-            result_df = pd.DataFrame()
-        elif isinstance(result, pd.DataFrame):
-            result_df = result
-        else:
-            result_df = pd.DataFrame(result)
-
-        # Encode result back to Arrow base64
-        result_arrow = dataframe_to_arrow(result_df)
-        result_b64 = base64.b64encode(result_arrow).decode("utf-8")
-
-        return {"resultB64": result_b64}, buffers
-
-    @traitlets.observe("derive_request")
-    def _on_derive_request(self, change):
-        """Handle derive requests via traitlet sync (for marimo compatibility)."""
-        msg = change["new"]
-        if not msg:
-            return
-        request_id = msg.get("requestId")
-        lambda_id = msg.get("lambdaId")
-        arrow_b64 = msg.get("arrowB64")
+        self._submit_derive_request(msg, via="message")
+        return {"accepted": True}, []
 
-        if not request_id or not lambda_id or not arrow_b64:
-            return
+    @traitlets.observe("derive_requests")
+    def _on_derive_requests(self, change):
+        """Queue a batch of derive requests from the traitlet transport.
 
-        fn = self.derive_functions.get(lambda_id)
-        if fn is None:
+        Their final responses are published together, in one sync, once the
+        whole batch has been answered.
+        """
+        requests = change["new"] or []
+        if not requests:
             return
+        batch = ResponseBatch(requests)
+        with self._derive_lock:
+            self._response_batches.append(batch)
+        for request in requests:
+            self._submit_derive_request(request, via="queue", batch=batch)
+
+    @traitlets.observe("derive_cancel")
+    def _on_derive_cancel(self, change):
+        """Cancel derive work from render generations the frontend dropped."""
+        generations = change["new"] or []
+        if generations:
+            self._derive_executor.cancel(generations)
+            with self._derive_lock:
+                batches = list(self._response_batches)
+            for batch in batches:
+                self._finish_batch(batch, batch.cancel(generations))
+
+    @traitlets.observe("visible")
+    def _on_visible(self, change):
+        """Reprioritize this widget's queued derives."""
+        self._derive_executor.visible = change["new"]
+
+    @traitlets.observe("timings")
+    def _on_timings(self, change):
+        """Add the frontend's render timings to the session aggregate."""
+        if change["new"]:
+            session_render_timings.record(change["new"])
+
+    @property
+    def derive_queue_depth(self) -> int:
+        """Number of this widget's derive requests waiting for a worker."""
+        return self._derive_executor.queue_depth
+
+    @property
+    def derive_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-lambda derive statistics of this widget (see DeriveStats)."""
+        return self._derive_stats.snapshot()
+
+    @property
+    def derive_profiles(self) -> Dict[str, Dict[str, str]]:
+        """Latest profiler reports by lambda ID and profiler kind."""
+        return {k: dict(v) for k, v in self._derive_stats.profiles.items()}
+
+    def profile_derive(
+        self, lambda_id: Optional[str] = None, kind: str = "cprofile"
+    ) -> None:
+        """
+        Profile the next call of a derive function.
 
-        arrow_bytes = base64.b64decode(arrow_b64)
-        df = arrow_to_dataframe(arrow_bytes)
-        result = fn(df.to_dict("records"))
+        The report appears in ``derive_profiles`` once the chart re-renders
+        (or the derive next runs). Async derives are not profiled.
 
-        try:
-            import pandas as pd
-        except Exception as exc:  # pragma: no cover - import guard
-            raise RuntimeError("pandas is required for derive execution") from exc
+        Args:
+            lambda_id: Derive to profile; None profiles the next call of any
+            kind: ``"cprofile"`` or ``"tracemalloc"``
+        """
+        if kind not in PROFILERS:
+            raise ValueError(f"Unknown profiler {kind!r}; expected one of {PROFILERS}")
+        with self._derive_lock:
+            self._profile_next[lambda_id] = kind
+
+    def _take_profiler(self, lambda_id: Optional[str]) -> Optional[str]:
+        with self._derive_lock:
+            kind = self._profile_next.pop(lambda_id, None)
+            if kind is None:
+                kind = self._profile_next.pop(None, None)
+            return kind
+
+    def _submit_derive_request(
+        self, request: dict, via: str, batch: Optional[ResponseBatch] = None
+    ) -> None:
+        """Run a derive request on the executor and publish its response.
+
+        With a ``batch``, the final response is held until the rest of the
+        batch is answered; streamed chunks are always sent as produced.
+        Responses are published on the event loop the request arrived on.
+        """
+        # Requests arrive on the kernel's thread, where its loop runs
+        loop = _running_loop()
+
+        def on_done(task, response, error):
+            if task.cancel_event.is_set() or isinstance(error, DeriveCancelled):
+                # Nobody is waiting for cancelled work
+                response = None
+            elif error is not None:
+                response = {
+                    "requestId": task.request_id,
+                    "error": f"{type(error).__name__}: {error}",
+                }
+            if batch is not None:
+                responses = batch.settle(task.request_id, response)
+                call_on_loop(loop, self._finish_batch, batch, responses)
+            elif response is not None:
+                call_on_loop(loop, self._publish_derive_responses, [response], via)
+
+        def emit(partial):
+            call_on_loop(loop, self._publish_derive_responses, [partial], via)
+
+        request_id, generation = request.get("requestId"), request.get("generation")
+        tracer = self._tracer or current_tracer()
+        if tracer is not None:
+            tracer.instant("derive request", "comm", lambda_id=request.get("lambdaId"))
+        fn = self.derive_functions.get(request.get("lambdaId"))
+        if fn is not None and is_async_derive(fn):
+            if loop is not None:
+                # I/O-bound: await on the kernel's loop instead of a worker
+                self._derive_executor.submit_async(
+                    request_id,
+                    generation,
+                    lambda: self._traced_async(
+                        answer_derive_request_async(
+                            self.derive_functions, request, emit, self._derive_stats
+                        )
+                    ),
+                    on_done,
+                    loop,
+                )
+                return
+        profiler = self._take_profiler(request.get("lambdaId"))
+        self._derive_executor.submit(
+            request_id,
+            generation,
+            lambda: self._traced(
+                answer_derive_request,
+                self.derive_functions,
+                request,
+                emit,
+                self._derive_stats,
+                profiler,
+            ),
+            on_done,
+        )
 
-        if result is None:
-            result_df = pd.DataFrame()
-        elif isinstance(result, pd.DataFrame):
-            result_df = result
-        else:
-            result_df = pd.DataFrame(result)
+    def _traced(self, fn: Callable, *args):
+        """Call ``fn`` with spans going to this widget's trace."""
+        with use_tracer(self._tracer):
+            return fn(*args)
+
+    async def _traced_async(self, awaitable):
+        """Await with spans going to this widget's trace."""
+        with use_tracer(self._tracer):
+            return await awaitable
+
+    def _finish_batch(
+        self, batch: ResponseBatch, responses: Optional[List[dict]]
+    ) -> None:
+        """Publish a fully answered batch in one sync."""
+        if responses is None:
+            return
+        with self._derive_lock:
+            if batch in self._response_batches:
+                self._response_batches.remove(batch)
+        if responses:
+            self._publish_derive_responses(responses, "queue")
 
-        result_arrow = dataframe_to_arrow(result_df)
-        result_b64 = base64.b64encode(result_arrow).decode("utf-8")
+    def _publish_derive_responses(self, responses: List[dict], via: str) -> None:
+        """Send derive responses over the transport their requests used.
 
-        self.derive_response = {"requestId": request_id, "resultB64": result_b64}
+        Called on the kernel's event loop (see ``call_on_loop``), or directly
+        when there is no loop.
+        """
+        # Without a loop, worker threads publish concurrently
+        with use_tracer(self._tracer), self._derive_lock:
+            with span("send derive responses", "comm", via=via):
+                if via == "queue":
+                    self.derive_responses = responses
+                else:
+                    self.send({"type": "derive_results", "responses": responses})
+
+    def close(self):
+        """Cancel outstanding derive work and close the widget."""
+        self._derive_executor.shutdown()
+        if self._tracer is not None:
+            # Write this widget's late spans without waiting for the timer
+            self._tracer.flush()
+        super().close()
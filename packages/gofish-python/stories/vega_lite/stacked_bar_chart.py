@@ -5,13 +5,10 @@ https://vega.github.io/vega-lite/examples/stacked_bar_weather.html
 Seattle weather data: count of days per weather type per month.
 """
 
-from gofish import chart, spread, stack, derive, rect, palette
+from gofish import chart, spread, stack, derive, rect, palette, timeUnit
 
 TITLE = "Vega-Lite/Stacked Bar Chart"
 
-MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
-          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-
 WEATHER_ORDER = ["sun", "fog", "drizzle", "rain", "snow"]
 
 _COLOR = palette({
@@ -28,14 +25,6 @@ def load_data():
     return load_seattle_weather()
 
 
-def _add_month(data):
-    from datetime import datetime
-    return [
-        {**r, "month": MONTHS[datetime.strptime(r["date"], "%Y-%m-%d").month - 1]}
-        for r in data
-    ]
-
-
 def _sort_weather(data):
     if data and "weather" in data[0]:
         return sorted(data, key=lambda r: WEATHER_ORDER.index(r["weather"])
@@ -53,7 +42,7 @@ def default(data=None, w=600, h=300):
     return (
         chart(data, {"color": _COLOR})
         .flow(
-            derive(_add_month),
+            timeUnit("date", "month", format="%b", as_="month"),
             spread(by="month", dir="x"),
             derive(_sort_weather),
             stack(by="weather", dir="y"),
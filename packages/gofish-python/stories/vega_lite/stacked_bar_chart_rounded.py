@@ -6,8 +6,8 @@ Note: rx/ry applies the same radius to all corners. Per-corner radius
 (cornerRadiusTopLeft etc.) is not yet supported — same limitation as JS story.
 """
 
-from collections import defaultdict
-from gofish import chart, spread, stack, derive, rect, palette
+from collections import Counter
+from gofish import chart, spread, stack, derive, rect, palette, timeUnit
 
 TITLE = "Vega-Lite/Stacked Bar Chart (Rounded Corners)"
 
@@ -28,23 +28,14 @@ def load_data():
     return load_seattle_weather()
 
 
-def _aggregate_by_month_weather(data):
-    from datetime import datetime
-    result = []
-    by_month = defaultdict(list)
-    for row in data:
-        month = MONTHS[datetime.strptime(row["date"], "%Y-%m-%d").month - 1]
-        by_month[month].append(row["weather"])
-
-    for month in MONTHS:
-        if month not in by_month:
-            continue
-        by_weather = defaultdict(int)
-        for w in by_month[month]:
-            by_weather[w] += 1
-        for weather, count in by_weather.items():
-            result.append({"month": month, "weather": weather, "count": count})
-    return result
+def _count_by_month_weather(data):
+    counts = Counter((row["month"], row["weather"]) for row in data)
+    return [
+        {"month": month, "weather": weather, "count": count}
+        for month in MONTHS
+        for (m, weather), count in counts.items()
+        if m == month
+    ]
 
 
 def default(data=None, w=600, h=300):
@@ -53,7 +44,8 @@ def default(data=None, w=600, h=300):
     return (
         chart(data, {"color": _COLOR})
         .flow(
-            derive(_aggregate_by_month_weather),
+            timeUnit("date", "month", format="%b", as_="month"),
+            derive(_count_by_month_weather),
             spread(by="month", dir="x"),
             stack(by="weather", dir="y"),
         )
@@ -8,6 +8,7 @@ from gofish import (
     spread,
     stack,
     derive,
+    calculate,
     log,
     clock,
     select,
@@ -56,6 +57,24 @@ class TestOperators:
         op2 = derive(fn)
         assert op1.lambda_id != op2.lambda_id
 
+    def test_calculate_operator(self):
+        """Test calculate operator serializes a parsed expression."""
+        op = calculate(name="proportion", expr="people / sum(people)")
+        d = op.to_dict()
+        assert d["type"] == "calculate"
+        assert d["name"] == "proportion"
+        assert d["expr"]["type"] == "binary"
+        assert d["expr"]["right"] == {
+            "type": "aggregate",
+            "fn": "sum",
+            "arg": {"type": "field", "name": "people"},
+        }
+
+    def test_calculate_operator_invalid_expr(self):
+        """Test calculate rejects unsupported expressions at build time."""
+        with pytest.raises(ValueError, match="Unknown function"):
+            calculate(name="y", expr="foo(x)")
+
     def test_log_operator_no_label(self):
         """Test log operator without label."""
         op = log()
@@ -186,6 +205,59 @@ class TestDataUtilities:
         result = repeat(row, "count")
         assert result == []
 
+    def test_normalize_table(self):
+        """Test normalize() divides a pyarrow column in one step."""
+        import pyarrow as pa
+
+        result = normalize(pa.table({"v": [1, 3]}), "v")
+        assert result.column("v").to_pylist() == [0.25, 0.75]
+
+    def test_normalize_dataframe(self):
+        """Test normalize() on a pandas DataFrame."""
+        import pandas as pd
+
+        result = normalize(pd.DataFrame({"v": [1, 3]}), "v")
+        assert result["v"].tolist() == [0.25, 0.75]
+
+    def test_repeat_table(self):
+        """Test repeat() expands a table with take()."""
+        import pyarrow as pa
+
+        table = pa.table({"item": ["a", "b", "c"], "count": [2, 0, 1]})
+        result = repeat(table, "count")
+        assert result.column("item").to_pylist() == ["a", "a", "c"]
+
+    def test_repeat_dataframe(self):
+        """Test repeat() expands a DataFrame by index."""
+        import pandas as pd
+
+        result = repeat(pd.DataFrame({"item": ["a", "b"], "count": [1, 2]}), "count")
+        assert result["item"].tolist() == ["a", "b", "b"]
+
+    def test_repeat_row_keyword(self):
+        """Test repeat(row=..., field=...) keyword calls keep working."""
+        assert repeat(row={"count": 2}, field="count") == [{"count": 2}] * 2
+        assert repeat(field="count").to_dict() == {"type": "repeat", "field": "count"}
+
+    def test_repeat_float_counts_truncate(self):
+        """Test fractional counts truncate alike for rows, Tables and frames."""
+        import pyarrow as pa
+
+        counts = [2.7, 0.5, 1.0, float("nan")]
+        table = pa.table({"item": ["a", "b", "c", "d"], "count": counts})
+        assert repeat(table, "count").column("item").to_pylist() == ["a", "a", "c"]
+        frame = repeat(table.to_pandas(), "count")
+        assert frame["item"].tolist() == ["a", "a", "c"]
+        rows = [r for row in table.to_pylist()[:3] for r in repeat(row, "count")]
+        assert [r["item"] for r in rows] == ["a", "a", "c"]
+
+    def test_repeat_operator(self):
+        """Test repeat(field) is a declarative operator the widget expands."""
+        c = chart([{"count": 3}]).flow(repeat("count"), spread(dir="x"))
+        c = c.mark(rect(w=8, h=8))
+        _, spec, _ = c._prepare_render()
+        assert spec["operators"][0] == {"type": "repeat", "field": "count"}
+
 
 class TestConvenienceMethods:
     """Test ChartBuilder.facet() and .stack() convenience methods."""
@@ -423,3 +495,41 @@ class TestChartBuilder:
         ir = c.to_ir()
         assert ir["data"] == {"type": "select", "layer": "bars"}
         assert ir["mark"]["type"] == "line"
+
+
+class TestEagerTableOperators:
+    """Test leading table operators run in the kernel at render time."""
+
+    def test_leading_calculate_runs_eagerly(self):
+        """Test a leading calculate is applied to the data and dropped from IR."""
+        from gofish.arrow_utils import arrow_to_table
+
+        data = [{"x": 1}, {"x": 4}]
+        c = chart(data).flow(
+            calculate(name="y", expr="sqrt(x)"),
+            spread(by="x", dir="x"),
+            calculate(name="z", expr="x * 2"),
+        ).mark(rect(h="y"))
+        arrow_data, spec, derive_functions = c._prepare_render()
+
+        assert [op["type"] for op in spec["operators"]] == ["spread", "calculate"]
+        assert arrow_to_table(arrow_data).column("y").to_pylist() == [1.0, 2.0]
+        assert derive_functions == {}
+        # to_ir() still describes the full pipeline
+        assert len(c.to_ir()["operators"]) == 3
+
+    def test_apply_must_be_overridden(self):
+        """Test a table operator without apply() cannot be created."""
+        from gofish.ast import TableOperator
+
+        class Incomplete(TableOperator):
+            pass
+
+        with pytest.raises(TypeError, match="apply"):
+            Incomplete("incomplete")
+
+    def test_select_data_is_not_eager(self):
+        """Test charts over select() keep their table operators in the IR."""
+        c = chart(select("bars")).flow(calculate(name="y", expr="x")).mark(line())
+        _, spec, _ = c._prepare_render()
+        assert [op["type"] for op in spec["operators"]] == ["calculate"]
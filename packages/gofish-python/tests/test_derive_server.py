@@ -0,0 +1,356 @@
+"""Tests for the visual-test derive server (tests/scripts/derive-server.py)."""
+
+import http.client
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pandas as pd
+import pytest
+
+from gofish.arrow_utils import arrow_to_table, dataframe_to_arrow
+
+SERVER = Path(__file__).resolve().parents[3] / "tests" / "scripts" / "derive-server.py"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+pytestmark = pytest.mark.skipif(
+    not SERVER.exists(), reason="derive server script is not in this checkout"
+)
+
+STORY = '''
+import time
+
+from gofish import chart, derive, rect, spread
+
+
+def double(rows):
+    return [{**r, "v": r["v"] * 2} for r in rows]
+
+
+def slow(rows):
+    time.sleep(0.5)
+    return rows
+
+
+def story_double():
+    data = [{"g": "a", "v": 1}, {"g": "b", "v": 2}]
+    return (
+        chart(data).flow(spread(by="g", dir="x"), derive(double)).mark(rect(h="v")),
+        {"w": 100},
+    )
+
+
+def story_slow():
+    data = [{"g": "a", "v": 1}]
+    return chart(data).flow(derive(slow), derive(slow)).mark(rect(h="v")), {}
+'''
+
+
+class DeriveServer:
+    """A derive server subprocess and a keep-alive connection to it."""
+
+    def __init__(self, *args: str):
+        self.process = subprocess.Popen(
+            [sys.executable, str(SERVER), "0", *args],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for line in self.process.stdout:
+            if "listening on" in line:
+                self.url = line.rsplit(" ", 1)[1].strip()
+                break
+        else:
+            raise RuntimeError("derive server did not start")
+        # Keep draining stdout (reload messages) so the server never blocks
+        threading.Thread(target=self.process.stdout.read, daemon=True).start()
+        parsed = urlparse(self.url)
+        self.host, self.port = parsed.hostname, parsed.port
+        self.connection = self.connect()
+
+    def connect(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def request(self, method, path, body=b"", headers=None, connection=None):
+        """Send a request; returns (status, headers, body)."""
+        conn = connection or self.connection
+        conn.request(method, path, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        return resp.status, dict(resp.getheaders()), resp.read()
+
+    def json(self, method, path, payload=None, connection=None):
+        """Send a JSON request; returns (status, decoded body)."""
+        body = json.dumps(payload).encode() if payload is not None else b""
+        status, _, data = self.request(
+            method, path, body, {"Content-Type": "application/json"}, connection
+        )
+        return status, json.loads(data)
+
+    def story(self, path: Path, function: str) -> dict:
+        status, body = self.json(
+            "POST", "/story", {"file": str(path), "function": function}
+        )
+        assert status == 200, body
+        return body
+
+    def close(self):
+        self.connection.close()
+        self.process.terminate()
+        self.process.wait(10)
+
+
+@pytest.fixture
+def story_file(tmp_path):
+    path = tmp_path / "test_story.py"
+    path.write_text(STORY)
+    return path
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = DeriveServer("--cache-dir", str(tmp_path / "cache"))
+    yield server
+    server.close()
+
+
+def _load_derive_cache():
+    spec = importlib.util.spec_from_file_location(
+        "derive_cache", SERVER.parent / "derive_cache.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _touch_later(path: Path):
+    """Move a file's mtime forward, so an edit in the same tick is seen."""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def _arrow_body(rows) -> bytes:
+    return dataframe_to_arrow(pd.DataFrame(rows))
+
+
+class TestDeriveServer:
+    """Test registering stories and calling their derives."""
+
+    def test_health(self, server):
+        """Test the health check reports the registry and worker count."""
+        status, body = server.json("GET", "/health")
+        assert status == 200
+        assert body["status"] == "ok"
+        assert body["workers"] == 1
+
+    def test_story_registers_derives(self, server, story_file):
+        """Test /story registers derives callable over one kept-alive connection."""
+        (lambda_id,) = server.story(story_file, "story_double")["deriveIds"]
+        for _ in range(2):
+            status, result = server.json("POST", f"/derive/{lambda_id}", [{"v": 3}])
+            assert status == 200
+            assert result == [{"v": 6}]
+
+    def test_arrow_negotiation(self, server, story_file):
+        """Test Arrow requests get Arrow responses."""
+        (lambda_id,) = server.story(story_file, "story_double")["deriveIds"]
+        status, headers, body = server.request(
+            "POST",
+            f"/derive/{lambda_id}",
+            _arrow_body([{"v": 1}, {"v": 2}]),
+            {"Content-Type": ARROW_STREAM, "Accept": ARROW_STREAM},
+        )
+        assert status == 200
+        assert headers["Content-Type"] == ARROW_STREAM
+        assert arrow_to_table(body).column("v").to_pylist() == [2, 4]
+
+    def test_unknown_lambda(self, server):
+        """Test calling an unregistered lambda is a 404."""
+        status, body = server.json("POST", "/derive/nope", [])
+        assert status == 404
+        assert "nope" in body["error"]
+
+    def test_different_lambdas_run_concurrently(self, server, story_file):
+        """Test calls to different lambdas overlap on separate connections."""
+        first, second = server.story(story_file, "story_slow")["deriveIds"]
+
+        def call(lambda_id):
+            conn = server.connect()
+            server.json("POST", f"/derive/{lambda_id}", [{"v": 1}], conn)
+            conn.close()
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=call, args=(i,)) for i in (first, second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Each call sleeps 0.5s
+        assert time.perf_counter() - start < 0.95
+
+    def test_cache_hit_then_miss_after_edit(self, server, story_file):
+        """Test a repeated call hits the cache and an edited story misses."""
+
+        def call():
+            (lambda_id,) = server.story(story_file, "story_double")["deriveIds"]
+            status, headers, _ = server.request(
+                "POST",
+                f"/derive/{lambda_id}",
+                b'[{"v": 3}]',
+                {"Content-Type": "application/json"},
+            )
+            assert status == 200
+            return headers["X-Cache"]
+
+        assert call() == "miss"
+        assert call() == "hit"
+        story_file.write_text(STORY.replace('r["v"] * 2', 'r["v"] * 3'))
+        _touch_later(story_file)
+        assert call() == "miss"
+
+
+class TestDeriveMetrics:
+    """Test the /metrics endpoint."""
+
+    def metrics(self, server) -> str:
+        status, headers, body = server.request("GET", "/metrics")
+        assert status == 200
+        assert headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        return body.decode()
+
+    def test_prometheus_format(self, server, story_file):
+        """Test counters and histogram buckets are labelled by story derive."""
+        (lambda_id,) = server.story(story_file, "story_double")["deriveIds"]
+        for _ in range(2):
+            server.json("POST", f"/derive/{lambda_id}", [{"v": 1}])
+        text = self.metrics(server)
+        # Module labels are relative to tests/
+        module = os.path.relpath(story_file, SERVER.parents[1])
+        labels = f'module="{module}",lambda="{module}::story_double#0"'
+        for kind, name in [
+            ("counter", "derive_requests_total"),
+            ("counter", "derive_errors_total"),
+            ("histogram", "derive_duration_seconds"),
+            ("counter", "derive_cache_requests_total"),
+        ]:
+            assert f"# TYPE {name} {kind}" in text
+        assert f"derive_requests_total{{{labels}}} 2" in text
+        assert f"derive_errors_total{{{labels}}} 0" in text
+        assert f'derive_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+        assert f"derive_duration_seconds_count{{{labels}}} 2" in text
+        assert f'derive_cache_requests_total{{{labels},result="hit"}} 1' in text
+        assert f'derive_cache_requests_total{{{labels},result="miss"}} 1' in text
+
+    def test_batch_unknown_lambda_counted(self, server):
+        """Test a batch entry for an unknown lambda is a counted error."""
+        status, body = server.json(
+            "POST", "/derive/batch", {"requests": [{"id": 0, "lambdaId": "nope"}]}
+        )
+        assert status == 200
+        assert "Unknown lambda_id" in body["results"][0]["error"]
+        text = self.metrics(server)
+        assert 'derive_requests_total{module="nope",lambda="nope"} 1' in text
+        assert 'derive_errors_total{module="nope",lambda="nope"} 1' in text
+
+
+class TestDeriveWorkers:
+    """Test running story derives in worker processes (--workers)."""
+
+    @pytest.fixture
+    def workers(self, tmp_path):
+        server = DeriveServer("--workers", "2", "--cache-dir", str(tmp_path / "cache"))
+        yield server
+        server.close()
+
+    def test_same_results_as_in_process(self, server, workers, story_file):
+        """Test workers return what the server process itself returns."""
+        rows = [{"v": 1}, {"v": 2}, {"v": 3}]
+        results = []
+        for srv in (server, workers):
+            (lambda_id,) = srv.story(story_file, "story_double")["deriveIds"]
+            _, result = srv.json("POST", f"/derive/{lambda_id}", rows)
+            _, _, arrow = srv.request(
+                "POST",
+                f"/derive/{lambda_id}",
+                _arrow_body(rows),
+                {"Content-Type": ARROW_STREAM, "Accept": ARROW_STREAM},
+            )
+            results.append((result, arrow_to_table(arrow).to_pylist()))
+        assert workers.json("GET", "/health")[1]["workers"] == 2
+        assert results[0] == results[1] == ([{"v": 2}, {"v": 4}, {"v": 6}],) * 2
+
+    def test_story_edited_after_registration(self, workers, story_file):
+        """Test a worker refuses a derive whose story no longer matches."""
+        (lambda_id,) = workers.story(story_file, "story_double")["deriveIds"]
+        story_file.write_text(STORY.replace('r["v"] * 2', 'r["v"] * 3'))
+        _touch_later(story_file)
+        status, body = workers.json("POST", f"/derive/{lambda_id}", [{"v": 1}])
+        assert status == 500
+        assert "changed since its derives were registered" in body["error"]
+
+
+class TestDeriveCacheKey:
+    """Test what the derive cache's function key depends on."""
+
+    @pytest.fixture
+    def derive_cache(self):
+        return _load_derive_cache()
+
+    def test_same_function_same_key(self, derive_cache):
+        """Test the key is stable, so repeated calls hit."""
+
+        def fn(rows):
+            return rows
+
+        assert derive_cache.function_key(fn) is not None
+        assert derive_cache.function_key(fn) == derive_cache.function_key(fn)
+
+    def test_edited_helper_module_changes_key(self, derive_cache, tmp_path):
+        """Test editing a helper imported from another file changes the key."""
+        helper = tmp_path / "derive_helpers.py"
+        helper.write_text("def scale(v):\n    return v * 2\n")
+        spec = importlib.util.spec_from_file_location("derive_helpers", helper)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        scale = module.scale
+
+        def fn(rows):
+            return [scale(r) for r in rows]
+
+        before = derive_cache.function_key(fn)
+        helper.write_text("def scale(v):\n    return v * 3\n")
+        _touch_later(helper)
+        assert derive_cache.function_key(fn) != before
+
+    def test_closure_dataframes_hashed_by_content(self, derive_cache):
+        """Test large DataFrames that repr() the same give different keys."""
+        big = pd.DataFrame({"x": range(10_000)})
+        edited = big.copy()
+        edited.loc[5_000, "x"] = -1
+        assert repr(big) == repr(edited)
+
+        def make(df):
+            return lambda rows: [r for r in rows if r["x"] in df["x"].values]
+
+        assert derive_cache.function_key(make(big)) == derive_cache.function_key(
+            make(big.copy())
+        )
+        assert derive_cache.function_key(make(big)) != derive_cache.function_key(
+            make(edited)
+        )
+
+    def test_unhashable_closure_bypasses_cache(self, derive_cache, tmp_path):
+        """Test a function reading an unpicklable value is never cached."""
+        lock = threading.Lock()
+
+        def fn(rows):
+            with lock:
+                return rows
+
+        assert derive_cache.function_key(fn) is None
+        cache = derive_cache.DeriveCache(str(tmp_path), 1 << 20, renderer="")
+        assert cache.call(fn, [{"v": 1}]) == ([{"v": 1}], "bypass")
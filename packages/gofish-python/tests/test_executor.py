@@ -0,0 +1,237 @@
+"""Tests for background derive execution and cancellation."""
+
+import asyncio
+import threading
+
+from gofish import DeriveCancelled, check_cancelled
+from gofish import executor
+from gofish.executor import DeriveExecutor, DeriveScheduler
+
+
+def _collect():
+    done = []
+    finished = threading.Event()
+
+    def on_done(task, result, error):
+        done.append((task.request_id, result, error))
+        finished.set()
+
+    return done, finished, on_done
+
+
+class TestDeriveExecutor:
+    """Test running and cancelling derive tasks by generation."""
+
+    def test_runs_task(self):
+        """Test a submitted task reports its result."""
+        executor = DeriveExecutor(DeriveScheduler())
+        done, finished, on_done = _collect()
+        executor.submit("r1", "g1", lambda: 42, on_done)
+        assert finished.wait(5)
+        assert done == [("r1", 42, None)]
+        executor.shutdown()
+
+    def test_failing_callback_keeps_worker_running(self, caplog):
+        """Test a callback that raises is logged and the next task still runs."""
+        executor = DeriveExecutor(DeriveScheduler())
+        done, finished, on_done = _collect()
+
+        def broken(task, result, error):
+            raise RuntimeError("comm closed")
+
+        executor.submit("r1", "g1", lambda: 1, broken)
+        executor.submit("r2", "g1", lambda: 2, on_done)
+        assert finished.wait(5)
+        assert done == [("r2", 2, None)]
+        assert executor.queue_depth == 0
+        assert "r1" in caplog.text and "comm closed" in caplog.text
+        executor.shutdown()
+
+    def test_cancel_drops_queued_tasks(self):
+        """Test queued tasks of a cancelled generation never run."""
+        executor = DeriveExecutor(DeriveScheduler(max_workers=1))
+        release = threading.Event()
+        done, finished, on_done = _collect()
+        executor.submit("blocker", "g1", lambda: release.wait(5), on_done)
+        ran = []
+        executor.submit("stale", "g1", lambda: ran.append(1), on_done)
+        assert executor.cancel(["g1"]) == 2
+        release.set()
+        executor.shutdown()
+        assert ran == []
+        assert all(request_id != "stale" for request_id, _, _ in done)
+
+    def test_cancel_interrupts_cooperative_task(self):
+        """Test check_cancelled() raises inside a cancelled running task."""
+        executor = DeriveExecutor(DeriveScheduler())
+        started = threading.Event()
+        done, finished, on_done = _collect()
+
+        def work():
+            started.set()
+            while True:
+                check_cancelled()
+
+        executor.submit("r1", "g1", work, on_done)
+        assert started.wait(5)
+        executor.cancel(["g1"])
+        assert finished.wait(5)
+        assert isinstance(done[0][2], DeriveCancelled)
+        assert executor.pending == 0
+        executor.shutdown()
+
+    def test_other_generations_unaffected(self):
+        """Test cancelling one generation leaves the others alone."""
+        executor = DeriveExecutor(DeriveScheduler())
+        done, finished, on_done = _collect()
+        executor.submit("r1", "g2", lambda: "ok", on_done)
+        executor.cancel(["g1"])
+        assert finished.wait(5)
+        assert done == [("r1", "ok", None)]
+        executor.shutdown()
+
+
+def test_check_cancelled_outside_task():
+    """Test check_cancelled() is a no-op outside a derive request."""
+    check_cancelled()
+
+
+class TestDeriveScheduler:
+    """Test ordering of derive tasks across widgets."""
+
+    def _run_order(self, scheduler, submissions):
+        """Submit tasks behind a blocker and return the order they ran in."""
+        started, release = threading.Event(), threading.Event()
+        blocker = DeriveExecutor(scheduler)
+        blocker.submit(
+            "blocker",
+            "g",
+            lambda: (started.set(), release.wait(5)),
+            lambda *a: None,
+        )
+        assert started.wait(5)
+        order = []
+        finished = threading.Event()
+
+        def on_done(task, result, error):
+            if len(order) == len(submissions):
+                finished.set()
+
+        for executor, request_id in submissions:
+            executor.submit(
+                request_id, "g", lambda r=request_id: order.append(r), on_done
+            )
+        assert scheduler.queue_depth() == len(submissions)
+        release.set()
+        assert finished.wait(5)
+        return order
+
+    def test_visible_widgets_first(self):
+        """Test a visible widget's tasks run before offscreen ones."""
+        scheduler = DeriveScheduler(max_workers=1)
+        offscreen = DeriveExecutor(scheduler)
+        onscreen = DeriveExecutor(scheduler)
+        onscreen.visible = True
+        order = self._run_order(
+            scheduler, [(offscreen, "a1"), (offscreen, "a2"), (onscreen, "b1")]
+        )
+        assert order == ["b1", "a1", "a2"]
+
+    def test_widgets_take_turns(self):
+        """Test widgets of equal visibility share the workers fairly."""
+        scheduler = DeriveScheduler(max_workers=1)
+        first = DeriveExecutor(scheduler)
+        second = DeriveExecutor(scheduler)
+        order = self._run_order(
+            scheduler,
+            [(first, "a1"), (first, "a2"), (first, "a3"), (second, "b1")],
+        )
+        assert order.index("b1") < order.index("a3")
+
+    def test_stats(self):
+        """Test the scheduler reports its load."""
+        stats = DeriveScheduler(max_workers=3).stats()
+        assert stats == {
+            "queued": 0,
+            "running": 0,
+            "widgets": 0,
+            "visible_widgets": 0,
+            "max_workers": 3,
+        }
+
+    def test_one_worker_by_default(self, monkeypatch):
+        """Test derives run one at a time unless configured otherwise."""
+        assert DeriveScheduler().max_workers == 1
+        monkeypatch.delenv("GOFISH_DERIVE_WORKERS", raising=False)
+        assert executor._configured_workers() == 1
+        monkeypatch.setenv("GOFISH_DERIVE_WORKERS", "4")
+        assert executor._configured_workers() == 4
+
+    def test_set_max_workers(self):
+        """Test the concurrency cap can be raised and lowered."""
+        scheduler = DeriveScheduler()
+        owner = DeriveExecutor(scheduler)
+        release = threading.Event()
+        both_running = threading.Barrier(3, timeout=5)
+        scheduler.set_max_workers(2)
+        for request_id in ("a", "b"):
+            owner.submit(
+                request_id,
+                "g",
+                lambda: (both_running.wait(), release.wait(5)),
+                lambda *a: None,
+            )
+        both_running.wait()
+        assert scheduler.running() == 2
+        release.set()
+        scheduler.set_max_workers(1)
+        assert scheduler.stats()["max_workers"] == 1
+
+
+class TestAsyncTasks:
+    """Test derive tasks awaited on an event loop."""
+
+    def test_async_task_completes(self):
+        """Test an async task reports its result from the loop."""
+
+        async def main():
+            executor = DeriveExecutor(DeriveScheduler())
+            done = asyncio.get_running_loop().create_future()
+
+            async def work():
+                await asyncio.sleep(0)
+                return "ok"
+
+            executor.submit_async(
+                "r1",
+                "g1",
+                work,
+                lambda task, result, error: done.set_result((result, error)),
+                asyncio.get_running_loop(),
+            )
+            return await asyncio.wait_for(done, 5)
+
+        assert asyncio.run(main()) == ("ok", None)
+
+    def test_cancel_async_task(self):
+        """Test cancelling a generation cancels its awaiting tasks."""
+
+        async def main():
+            executor = DeriveExecutor(DeriveScheduler())
+            calls = []
+            task = executor.submit_async(
+                "r1",
+                "g1",
+                lambda: asyncio.sleep(10),
+                lambda *args: calls.append(args),
+                asyncio.get_running_loop(),
+            )
+            await asyncio.sleep(0.01)
+            assert executor.cancel(["g1"]) == 1
+            await asyncio.sleep(0.01)
+            return calls, task, executor.pending
+
+        calls, task, pending = asyncio.run(main())
+        assert calls == []
+        assert task.cancel_event.is_set()
+        assert pending == 0
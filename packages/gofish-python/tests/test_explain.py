@@ -0,0 +1,99 @@
+"""Tests for the explain() cost advisor."""
+
+import pandas as pd
+
+from gofish import Layer, calculate, chart, derive, line, rect, spread
+from gofish.ast import CalculateOperator
+
+
+def _codes(explanation):
+    return [f.code for f in explanation.findings]
+
+
+def _frame(n, groups):
+    return pd.DataFrame(
+        {"id": [i % groups for i in range(n)], "y": range(n), "junk": [0.5] * n}
+    )
+
+
+class TestExplain:
+    """Test findings reported before rendering."""
+
+    def test_small_chart_is_clean(self):
+        """Test a small chart with every column used has no findings."""
+        explanation = (
+            chart(_frame(10, 5)[["id", "y"]])
+            .flow(spread(by="id", dir="x"))
+            .mark(rect(h="y"))
+            .explain()
+        )
+        assert explanation.findings == []
+        summary = explanation.charts[0]
+        assert summary["rows"] == 10
+        assert summary["columns"] == 2
+        assert summary["bytes"] > 0
+        assert "No issues found." in str(explanation)
+
+    def test_unused_columns(self):
+        """Test columns no operator or channel mentions are reported."""
+        explanation = (
+            chart(_frame(10, 5)).flow(spread(by="id", dir="x")).mark(rect(h="y"))
+        ).explain()
+        assert explanation.charts[0]["unused_columns"] == ["junk"]
+        assert "unused-columns" in _codes(explanation)
+
+    def test_eager_operators_run_once(self, monkeypatch):
+        """Test eager operators are applied once and the payload measured."""
+        applied = []
+        apply = CalculateOperator.apply
+        monkeypatch.setattr(
+            CalculateOperator,
+            "apply",
+            lambda self, table: applied.append(self.name) or apply(self, table),
+        )
+        builder = (
+            chart(_frame(10, 5))
+            .flow(calculate(name="z", expr="y * 2"), spread(by="id", dir="x"))
+            .mark(rect(h="z"))
+        )
+        summary = builder.explain().charts[0]
+        assert applied == ["z"]
+        assert summary["columns"] == 4
+        assert summary["bytes"] == len(builder._prepare_render()[0])
+
+    def test_derive_after_high_cardinality_spread(self):
+        """Test a derive after a wide spread counts one RPC per partition."""
+
+        def keep(d):
+            return d
+
+        explanation = (
+            chart(_frame(400, 200))
+            .flow(spread(by="id", dir="x"), derive(keep))
+            .mark(rect(h="y"))
+            .explain()
+        )
+        assert explanation.charts[0]["derive_rpcs"] == 200
+        codes = _codes(explanation)
+        assert "derive-after-spread" in codes
+        assert "high-cardinality-by" in codes
+        # The derive may read any column
+        assert "unused-columns" not in codes
+        assert all(f.suggestion for f in explanation.findings)
+
+    def test_mark_count(self):
+        """Test rect marks count rows and line marks count series."""
+        df = _frame(25_000, 10)[["id", "y"]]
+        rects = chart(df).flow(spread(by="id", dir="x")).mark(rect(h="y"))
+        assert "too-many-marks" in _codes(rects.explain())
+        lines = chart(df).flow(spread(by="id", dir="x")).mark(line())
+        assert lines.explain().charts[0]["marks"] == 10
+
+    def test_layer(self):
+        """Test a layer reports every chart."""
+        df = _frame(10, 5)
+        explanation = Layer(
+            [chart(df).mark(rect(h="y")), chart(df).mark(rect(h="id"))]
+        ).explain()
+        assert [c["chart"] for c in explanation.charts] == ["chart 0", "chart 1"]
+        assert explanation.to_dict()["findings"]
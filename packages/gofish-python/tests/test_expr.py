@@ -0,0 +1,165 @@
+"""Tests for the calculate() expression language."""
+
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+from gofish.expr import ExpressionError, evaluate, fields, parse
+
+
+class TestParse:
+    """Test expression parsing into IR trees."""
+
+    def test_field_and_literal(self):
+        """Test identifiers become fields and numbers literals."""
+        assert parse("x * 2") == {
+            "type": "binary",
+            "op": "*",
+            "left": {"type": "field", "name": "x"},
+            "right": {"type": "literal", "value": 2},
+        }
+
+    def test_datum_subscript(self):
+        """Test datum["..."] refers to fields that are not identifiers."""
+        assert parse('datum["Miles per Gallon"]') == {
+            "type": "field",
+            "name": "Miles per Gallon",
+        }
+
+    def test_aggregate_vs_elementwise(self):
+        """Test one-arg min is an aggregate and two-arg min element-wise."""
+        assert parse("min(x)")["type"] == "aggregate"
+        assert parse("min(x, 0)")["type"] == "call"
+
+    def test_chained_comparison(self):
+        """Test a < b < c expands to a conjunction."""
+        tree = parse("0 < x < 10")
+        assert tree["op"] == "and"
+        assert tree["left"]["op"] == "<"
+        assert tree["right"]["op"] == "<"
+
+    def test_conditional(self):
+        """Test Python conditional expressions."""
+        tree = parse('"big" if x > 1 else "small"')
+        assert tree["type"] == "cond"
+
+    def test_fields(self):
+        """Test fields() collects referenced field names."""
+        assert fields(parse("people / sum(people) + age")) == {"people", "age"}
+
+    @pytest.mark.parametrize(
+        "expr", ["x.y", "foo(x)", "sqrt(x, y)", "x[0]", "lambda: 1", "x +"]
+    )
+    def test_unsupported(self, expr):
+        """Test unsupported syntax raises ExpressionError."""
+        with pytest.raises(ExpressionError):
+            parse(expr)
+
+
+class TestEvaluate:
+    """Test pyarrow evaluation of expression trees."""
+
+    def test_proportion(self):
+        """Test an aggregate broadcasts over the rows."""
+        table = pa.table({"people": [1, 3]})
+        result = evaluate(parse("people / sum(people)"), table)
+        assert result.to_pylist() == [0.25, 0.75]
+
+    def test_sqrt(self):
+        """Test element-wise functions on integer columns."""
+        table = pa.table({"Death": [4, 9]})
+        assert evaluate(parse("sqrt(Death)"), table).to_pylist() == [2.0, 3.0]
+
+    def test_conditional(self):
+        """Test conditionals and comparisons."""
+        table = pa.table({"x": [1, 5]})
+        result = evaluate(parse('"big" if x > 2 else "small"'), table)
+        assert result.to_pylist() == ["small", "big"]
+
+    def test_modulo_and_round(self):
+        """Test floored modulo and half-up rounding."""
+        table = pa.table({"x": [-3, 7], "y": [2.5, -2.5]})
+        assert evaluate(parse("x % 5"), table).to_pylist() == [2, 2]
+        assert evaluate(parse("round(y)"), table).to_pylist() == [3, -2]
+
+    def test_literal_broadcast(self):
+        """Test constant expressions produce one value per row."""
+        table = pa.table({"x": [1, 2, 3]})
+        assert evaluate(parse("1"), table).to_pylist() == [1, 1, 1]
+
+    def test_unknown_field(self):
+        """Test referencing a missing field raises KeyError."""
+        with pytest.raises(KeyError, match="nope"):
+            evaluate(parse("nope + 1"), pa.table({"x": [1]}))
+
+
+# Cases where a naive evaluator would differ between pyarrow and JavaScript,
+# with the result both must give
+PARITY_CASES = [
+    ("min(a, b)", [{"a": 1, "b": None}, {"a": 1, "b": 2}], [None, 1]),
+    ("max(a, b)", [{"a": 1, "b": None}, {"a": 1, "b": 2}], [None, 2]),
+    ("sum(a)", [{"a": None}, {"a": None}], [0, 0]),
+    ("sum(a) + b", [{"a": None, "b": 1}], [1]),
+    ("a ** b", [{"a": 2, "b": -1}, {"a": 2, "b": 3}], [0.5, 8]),
+    ("pow(a, b)", [{"a": 4, "b": -2}], [0.0625]),
+    ("a + b", [{"a": "x", "b": "y"}, {"a": "x", "b": None}], ["xy", None]),
+    ('a + "!"', [{"a": "hi"}], ["hi!"]),
+    ("a + b", [{"a": "n", "b": 2}], ["n2"]),
+]
+
+EXPR_TS = Path(__file__).resolve().parents[1] / "widget-src" / "expr.ts"
+
+RUNNER = """
+import { readFileSync } from "node:fs";
+import { evaluateExpression } from "%s";
+
+const cases = JSON.parse(readFileSync(0, "utf-8"));
+const results = cases.map(([tree, rows]) =>
+  Array.from(evaluateExpression(tree, rows))
+);
+process.stdout.write(JSON.stringify(results));
+"""
+
+
+def _typescript_node():
+    """A node that runs .ts files (22.6+), or None."""
+    node = os.environ.get("GOFISH_TEST_NODE") or shutil.which("node")
+    if node is None:
+        return None
+    check = subprocess.run(
+        [node, "--experimental-strip-types", "-e", "0"], capture_output=True
+    )
+    return node if check.returncode == 0 else None
+
+
+class TestWidgetParity:
+    """Test the kernel and widget evaluators agree on the same expressions."""
+
+    @pytest.mark.parametrize("expr,rows,expected", PARITY_CASES)
+    def test_kernel(self, expr, rows, expected):
+        """Test the pyarrow evaluator gives the shared result."""
+        table = pa.Table.from_pylist(rows)
+        assert evaluate(parse(expr), table).to_pylist() == expected
+
+    def test_widget(self, tmp_path):
+        """Test widget-src/expr.ts gives the same results as the kernel."""
+        node = _typescript_node()
+        if node is None:
+            pytest.skip("needs node 22.6+ (GOFISH_TEST_NODE) to run TypeScript")
+        runner = tmp_path / "runner.mjs"
+        runner.write_text(RUNNER % EXPR_TS.as_uri())
+        cases = [[parse(expr), rows] for expr, rows, _ in PARITY_CASES]
+        out = subprocess.run(
+            [node, "--experimental-strip-types", "--no-warnings", str(runner)],
+            input=json.dumps(cases),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results = json.loads(out.stdout)
+        assert results == [expected for _, _, expected in PARITY_CASES]
@@ -0,0 +1,164 @@
+"""Tests for per-lambda derive instrumentation."""
+
+import base64
+
+import pandas as pd
+import pytest
+
+import gofish
+from gofish.arrow_utils import dataframe_to_arrow
+from gofish.ast import _timed_prepare
+from gofish.stats import (
+    DeriveStats,
+    RenderTimingStats,
+    profile_call,
+    session_stats,
+)
+from gofish.widget import answer_derive_request
+
+
+def _request(lambda_id, rows):
+    arrow = dataframe_to_arrow(pd.DataFrame(rows))
+    return {
+        "requestId": "r1",
+        "lambdaId": lambda_id,
+        "arrowB64": base64.b64encode(arrow).decode("utf-8"),
+    }
+
+
+def _double(d):
+    return [{"x": r["x"] * 2} for r in d]
+
+
+class TestDeriveStats:
+    """Test aggregation of derive measurements."""
+
+    def test_counts_rows_bytes_and_phases(self):
+        """Test a call records rows, bytes and phase times."""
+        stats = DeriveStats()
+        answer_derive_request(
+            {"double": _double},
+            _request("double", [{"x": 1}, {"x": 2}, {"x": 3}]),
+            stats=stats,
+        )
+        entry = stats.snapshot()["double"]
+        assert entry["name"] == "_double"
+        assert entry["calls"] == 1
+        assert entry["errors"] == 0
+        assert entry["rows_in"] == 3
+        assert entry["rows_out"] == 3
+        assert entry["bytes_in"] > 0 and entry["bytes_out"] > 0
+        assert entry["total_s"] == pytest.approx(
+            entry["decode_s"] + entry["fn_s"] + entry["encode_s"]
+        )
+
+    def test_errors_and_repeated_calls(self):
+        """Test failed calls are counted as errors and calls accumulate."""
+        stats = DeriveStats()
+        functions = {"boom": lambda d: 1 / 0}
+        for _ in range(2):
+            answer_derive_request(functions, _request("boom", [{"x": 1}]), stats=stats)
+        entry = stats.snapshot()["boom"]
+        assert (entry["calls"], entry["errors"]) == (2, 2)
+
+    def test_streamed_rows(self):
+        """Test rows of streamed chunks are counted."""
+
+        def explode(d):
+            for row in d:
+                yield [{"x": row["x"]}] * 3
+
+        stats = DeriveStats()
+        answer_derive_request(
+            {"explode": explode},
+            _request("explode", [{"x": 1}, {"x": 2}]),
+            lambda partial: None,
+            stats=stats,
+        )
+        assert stats.snapshot()["explode"]["rows_out"] == 6
+
+    def test_session_stats(self):
+        """Test every call also lands in gofish.stats()."""
+        session_stats.reset()
+        answer_derive_request({"double": _double}, _request("double", [{"x": 1}]))
+        report = gofish.stats()
+        assert report["derives"]["double"]["calls"] == 1
+        assert "queued" in report["scheduler"]
+        assert "renders" in report
+
+    def test_profile_is_attached(self):
+        """Test a profiled call attaches its report."""
+        stats = DeriveStats()
+        answer_derive_request(
+            {"double": _double},
+            _request("double", [{"x": 1}]),
+            stats=stats,
+            profiler="cprofile",
+        )
+        assert "function calls" in stats.profiles["double"]["cprofile"]
+
+
+class TestProfileCall:
+    """Test running calls under a profiler."""
+
+    def test_cprofile(self):
+        """Test cProfile reports the profiled function."""
+        result, report = profile_call("cprofile", lambda: sorted(range(100)))
+        assert result == list(range(100))
+        assert "function calls" in report
+
+    def test_tracemalloc(self):
+        """Test tracemalloc reports peak memory."""
+        result, report = profile_call("tracemalloc", lambda: [0] * 100_000)
+        assert len(result) == 100_000
+        assert report.startswith("peak traced memory")
+
+    def test_tracemalloc_without_reset_peak(self, monkeypatch):
+        """Test Python 3.8, which has no tracemalloc.reset_peak()."""
+        import tracemalloc
+
+        monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+        tracemalloc.start()
+        try:
+            _, report = profile_call("tracemalloc", lambda: [0] * 1000)
+        finally:
+            tracemalloc.stop()
+        assert report.startswith("peak traced memory (since tracing started)")
+
+    def test_unknown(self):
+        """Test unknown profilers are rejected."""
+        with pytest.raises(ValueError):
+            profile_call("perf", lambda: None)
+
+
+class TestRenderTimings:
+    """Test aggregation of render timings reported by the widget."""
+
+    def test_aggregates_stages(self):
+        """Test stage timings are aggregated across renders."""
+        timings = RenderTimingStats()
+        timings.record({"build_chart_ms": 2.0, "layout_ms": 10.0})
+        timings.record({"build_chart_ms": 4.0})
+        snapshot = timings.snapshot()
+        assert snapshot["renders"] == 2
+        assert snapshot["stages"]["build_chart_ms"] == {
+            "count": 2,
+            "total": 6.0,
+            "max": 4.0,
+            "mean": 3.0,
+        }
+        assert snapshot["stages"]["layout_ms"]["count"] == 1
+
+    def test_ignores_non_numeric(self):
+        """Test non-numeric entries are skipped."""
+        timings = RenderTimingStats()
+        timings.record({"note": "x", "total_ms": 1})
+        assert list(timings.snapshot()["stages"]) == ["total_ms"]
+
+    def test_kernel_encode_is_timed(self):
+        """Test render preparation is timed for the kernel_encode stage."""
+        builder = gofish.chart([{"x": 1}]).mark(gofish.rect(h="x"))
+        (arrow_data, spec, _), seconds = _timed_prepare(builder)
+        assert isinstance(arrow_data, bytes)
+        assert spec["mark"]["type"] == "rect"
+        assert seconds >= 0
@@ -0,0 +1,96 @@
+"""Tests for Chrome trace-event export."""
+
+import base64
+import json
+import sys
+import time
+
+import pandas as pd
+
+import gofish
+from gofish.arrow_utils import dataframe_to_arrow
+from gofish.ast import _timed_prepare
+from gofish.trace import Tracer, current_tracer, use_tracer, WIDGET_PID
+from gofish.widget import answer_derive_request
+
+
+def _events(path):
+    with open(path) as f:
+        return json.load(f)["traceEvents"]
+
+
+def _names(events):
+    return [e["name"] for e in events if e["ph"] != "M"]
+
+
+class TestTrace:
+    """Test recording kernel and widget spans."""
+
+    def test_records_render_preparation(self, tmp_path):
+        """Test render preparation and Arrow encoding become spans."""
+        path = tmp_path / "trace.json"
+        builder = gofish.chart(pd.DataFrame({"x": [1, 2]})).mark(gofish.rect(h="x"))
+        with gofish.trace(str(path)):
+            _timed_prepare(builder)
+        names = _names(_events(path))
+        assert "ChartBuilder._prepare_render" in names
+        assert "table_to_arrow" in names
+
+    def test_derive_spans_use_widget_tracer(self, tmp_path):
+        """Test derives after the block still reach the widget's trace."""
+        tracer = Tracer(str(tmp_path / "trace.json"))
+        arrow = dataframe_to_arrow(pd.DataFrame({"x": [1]}))
+        request = {
+            "requestId": "r1",
+            "lambdaId": "id",
+            "arrowB64": base64.b64encode(arrow).decode("utf-8"),
+        }
+        with use_tracer(tracer):
+            answer_derive_request({"id": lambda d: d}, request)
+        events = tracer.to_json()["traceEvents"]
+        derive = next(e for e in events if e["name"] == "derive")
+        assert derive["ph"] == "X"
+        assert derive["args"]["lambda_id"] == "id"
+
+    def test_widget_spans_rewrite_closed_trace(self, tmp_path):
+        """Test widget spans arriving after the block update the file."""
+        path = tmp_path / "trace.json"
+        with gofish.trace(str(path)) as tracer:
+            pass
+        tracer.add_widget_spans(
+            "gofish-chart-1",
+            [
+                {"name": "layout", "start": 1000.0, "dur": 5.0},
+                {"name": "derive", "start": 1001.0, "dur": 2.0, "async": True},
+            ],
+        )
+        tracer.flush()
+        events = _events(path)
+        widget = [e for e in events if e["pid"] == WIDGET_PID and e["ph"] != "M"]
+        assert [e["ph"] for e in widget] == ["X", "b", "e"]
+        assert widget[0]["ts"] == 1_000_000.0
+        assert widget[0]["dur"] == 5000.0
+
+    def test_late_spans_saved_once_per_burst(self, tmp_path, monkeypatch):
+        """Test spans after the block are written together, off their thread."""
+        # gofish.trace is the function; patch the module
+        monkeypatch.setattr(sys.modules["gofish.trace"], "SAVE_DELAY", 0.05)
+        with gofish.trace(str(tmp_path / "trace.json")) as tracer:
+            pass
+        saves = []
+        monkeypatch.setattr(tracer, "save", lambda: saves.append(len(tracer._events)))
+        for i in range(20):
+            tracer.add_widget_spans("w", [{"name": "layout", "start": i, "dur": 1}])
+            with tracer.span("derive"):
+                pass
+        assert saves == []
+        deadline = time.time() + 5
+        while not saves and time.time() < deadline:
+            time.sleep(0.01)
+        assert saves == [40]
+        tracer.flush()
+        assert saves == [40]
+
+    def test_inactive_outside_block(self):
+        """Test nothing is traced outside trace()."""
+        assert current_tracer() is None
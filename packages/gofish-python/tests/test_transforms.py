@@ -0,0 +1,262 @@
+"""Tests for the columnar statistical transform operators."""
+
+import base64
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import gofish
+from gofish import (
+    bin_,
+    box_summary,
+    chart,
+    density,
+    lookup,
+    quantile,
+    rect,
+    regress,
+    spread,
+    timeUnit,
+)
+from gofish.ast import ColumnarFunction, DeriveOperator, TransformOperator
+from gofish.arrow_utils import arrow_to_table, dataframe_to_arrow, table_to_arrow
+from gofish.transforms import nice_step
+
+
+class TestBin:
+    """Test histogram binning."""
+
+    def test_counts(self):
+        """Test nice bin edges and per-bin counts, skipping empty bins."""
+        table = pa.table({"x": [0.0, 1.0, 1.5, 9.0, 10.0]})
+        out = bin_("x", maxbins=5).apply(table).to_pydict()
+        assert out == {
+            "bin_start": [0.0, 8.0, 10.0],
+            "bin_end": [2.0, 10.0, 12.0],
+            "count": [3, 1, 1],
+        }
+
+    def test_groupby(self):
+        """Test grouped binning keeps the group keys."""
+        table = pa.table({"g": ["a", "b", "a"], "x": [1, 1, 2]})
+        out = bin_("x", step=1, groupby=["g"]).apply(table).to_pylist()
+        assert out == [
+            {"g": "a", "bin_start": 1.0, "bin_end": 2.0, "count": 1},
+            {"g": "a", "bin_start": 2.0, "bin_end": 3.0, "count": 1},
+            {"g": "b", "bin_start": 1.0, "bin_end": 2.0, "count": 1},
+        ]
+
+    def test_nice_step(self):
+        """Test steps are 1/2/5 multiples of a power of ten."""
+        assert nice_step(100, 10) == 10
+        assert nice_step(0.9, 10) == 0.1
+        assert nice_step(37, 5) == 10
+
+
+class TestSummaries:
+    """Test density, quantile, box summary and regression kernels."""
+
+    def test_density_integrates_to_one(self):
+        """Test the KDE is a density over a padded grid."""
+        values = np.random.default_rng(0).normal(size=500)
+        table = pa.table({"x": values})
+        out = density("x", extent=(-6, 6), steps=200).apply(table)
+        grid = np.asarray(out.column("value"))
+        kde = np.asarray(out.column("density"))
+        assert kde.sum() * (grid[1] - grid[0]) == pytest.approx(1.0, abs=1e-2)
+
+    def test_density_binned_large_input(self):
+        """Test the pre-binned path for large inputs agrees with the exact one."""
+        values = np.random.default_rng(1).normal(size=20_000)
+        table = pa.table({"x": values})
+        out = density("x", bandwidth=0.3, extent=(-2, 2), steps=5).apply(table)
+        exact = np.exp(-0.5 * ((np.linspace(-2, 2, 5)[:, None] - values) / 0.3) ** 2)
+        exact = exact.sum(axis=1) / (len(values) * 0.3 * np.sqrt(2 * np.pi))
+        assert out.column("density").to_pylist() == pytest.approx(exact, rel=1e-2)
+
+    def test_quantile(self):
+        """Test one row per probability."""
+        table = pa.table({"x": list(range(101))})
+        out = quantile("x", probs=[0.1, 0.5]).apply(table).to_pydict()
+        assert out == {"prob": [0.1, 0.5], "value": [10.0, 50.0]}
+
+    def test_box_summary(self):
+        """Test whiskers stop at 1.5 IQR and outliers are counted."""
+        table = pa.table({"x": [1, 2, 3, 4, 5, 100]})
+        row = box_summary("x").apply(table).to_pylist()[0]
+        assert row["median"] == 3.5
+        assert row["upper"] == 5
+        assert row["max"] == 100
+        assert row["outliers"] == 1
+
+    def test_linear_regression(self):
+        """Test a linear fit emits the two end points."""
+        table = pa.table({"x": [0, 1, 2, None], "y": [1, 3, 5, 7]})
+        out = regress("x", "y").apply(table).to_pydict()
+        assert out["x"] == [0.0, 2.0]
+        assert out["y"] == pytest.approx([1.0, 5.0])
+
+    def test_loess_follows_curve(self):
+        """Test loess tracks a non-linear trend."""
+        x = np.linspace(0, 3, 200)
+        table = pa.table({"x": x, "y": x**2})
+        out = regress("x", "y", method="loess", steps=4).apply(table).to_pydict()
+        assert out["y"] == pytest.approx(np.linspace(0, 3, 4) ** 2, abs=0.1)
+
+    def test_unknown_method(self):
+        """Test invalid regression methods are rejected."""
+        with pytest.raises(ValueError, match="method"):
+            regress("x", "y", method="spline")
+
+
+class TestTimeUnit:
+    """Test temporal truncation and timestamp transport."""
+
+    def test_month_name_from_strings(self):
+        """Test ISO date strings are parsed and formatted on the whole column."""
+        table = pa.table({"date": ["2012-01-05", "2012-03-31"]})
+        op = timeUnit("date", "month", format="%b", as_="month")
+        assert op.apply(table).column("month").to_pylist() == ["Jan", "Mar"]
+
+    def test_step_truncation(self):
+        """Test truncating timestamps to 15-minute bins."""
+        times = pa.array([0, 14 * 60_000, 16 * 60_000], pa.timestamp("ms"))
+        out = timeUnit("t", "minute", step=15).apply(pa.table({"t": times}))
+        assert out.column("t").cast(pa.int64()).to_pylist() == [0, 0, 15 * 60_000]
+
+    def test_unknown_unit(self):
+        """Test invalid units are rejected."""
+        with pytest.raises(ValueError, match="unit"):
+            timeUnit("date", "fortnight")
+
+    def test_rows_receive_epoch_millis(self):
+        """Test row-dict callers get epoch milliseconds, like the widget."""
+        rows = timeUnit("date", "year").fn([{"date": "2012-06-01"}])
+        assert rows == [{"date": 1325376000000}]
+
+    def test_native_timestamp_transport(self):
+        """Test datetime columns are sent as millisecond timestamps."""
+        df = pd.DataFrame(
+            {"t": pd.to_datetime(["2012-01-01"]), "d": [date(2012, 1, 2)]}
+        )
+        schema = arrow_to_table(dataframe_to_arrow(df)).schema
+        assert schema.field("t").type == pa.timestamp("ms")
+        assert schema.field("d").type == pa.date32()
+
+
+class TestTransformOperator:
+    """Test how transform operators are placed in the rendered pipeline."""
+
+    def test_leading_transform_is_eager(self):
+        """Test a leading transform runs in the kernel and only sends summaries."""
+        data = [{"x": float(i)} for i in range(1000)]
+        builder = chart(data).flow(bin_("x", step=250), spread(by="bin_start", dir="x"))
+        builder = builder.mark(rect(h="count"))
+        arrow_data, spec, derive_functions = builder._prepare_render()
+        assert [op["type"] for op in spec["operators"]] == ["spread"]
+        assert derive_functions == {}
+        assert arrow_to_table(arrow_data).num_rows == 4
+
+    def test_nested_transform_is_derive(self):
+        """Test a transform after spread is a derive with a columnar callable."""
+        op = bin_("x", maxbins=4)
+        assert isinstance(op, TransformOperator)
+        assert isinstance(op, DeriveOperator)
+        builder = chart([{"g": "a", "x": 1}]).flow(spread(by="g", dir="x"), op)
+        _, spec, derive_functions = builder.mark(rect(h="count"))._prepare_render()
+        assert spec["operators"][1] == {
+            "type": "derive",
+            "lambdaId": op.lambda_id,
+            "transform": "bin",
+            "field": "x",
+            "maxbins": 4,
+            "as": ["bin_start", "bin_end"],
+        }
+        assert isinstance(derive_functions[op.lambda_id], ColumnarFunction)
+
+    def test_columnar_function_accepts_rows(self):
+        """Test the callable also works with row dicts (derive server)."""
+        fn = bin_("x", step=1).fn
+        assert fn([{"x": 0.5}, {"x": 0.7}]) == [
+            {"bin_start": 0.0, "bin_end": 1.0, "count": 2}
+        ]
+
+    def test_partitions_run_in_one_call(self):
+        """Test a batched call runs the kernel per _partition and tags results."""
+        table = pa.table({"x": [0.5, 1.5, 1.7, 9.0], "_partition": [0, 0, 1, 1]})
+        out = bin_("x", step=1).fn.transform(table).to_pylist()
+        assert out == [
+            {"bin_start": 0.0, "bin_end": 1.0, "count": 1, "_partition": 0},
+            {"bin_start": 1.0, "bin_end": 2.0, "count": 1, "_partition": 0},
+            {"bin_start": 1.0, "bin_end": 2.0, "count": 1, "_partition": 1},
+            {"bin_start": 9.0, "bin_end": 10.0, "count": 1, "_partition": 1},
+        ]
+
+    def test_bin_not_star_exported(self):
+        """Test from gofish import * does not shadow the bin builtin."""
+        assert "bin" not in gofish.__all__
+        assert "bin_" in gofish.__all__
+
+
+class TestLookup:
+    """Test the lookup (hash join) operator."""
+
+    STORES = [
+        {"id": 1, "region": "north", "size": 10},
+        {"id": 2, "region": "south", "size": 20},
+        {"id": 1, "region": "duplicate", "size": 0},
+    ]
+
+    def test_eager_join_preserves_order(self):
+        """Test the pyarrow join keeps row order and first matches."""
+        sales = pa.table({"store": [2, 1, 3], "amount": [5, 6, 7]})
+        op = lookup(self.STORES, on=("store", "id"), fields=["region"], default="?")
+        out = op.apply(sales).to_pylist()
+        assert out == [
+            {"store": 2, "amount": 5, "region": "south"},
+            {"store": 1, "amount": 6, "region": "north"},
+            {"store": 3, "amount": 7, "region": "?"},
+        ]
+
+    def test_null_keys_never_match(self):
+        """Test null keys get the default, like the widget's hash index."""
+        sales = pa.table({"store": pa.array([None, 1], pa.int64())})
+        stores = [{"id": None, "region": "unknown"}, *self.STORES]
+        op = lookup(stores, on=("store", "id"), fields=["region"], default="?")
+        assert op.apply(sales).column("region").to_pylist() == ["?", "north"]
+
+    def test_ships_lookup_table_in_ir(self):
+        """Test the lookup is not eager by default and carries its table."""
+        op = lookup(self.STORES, on="id")
+        builder = chart([{"id": 1}]).flow(op, spread(by="region", dir="x"))
+        arrow_data, spec, _ = builder.mark(rect(h=1))._prepare_render()
+        ir = spec["operators"][0]
+        assert ir["type"] == "lookup"
+        assert ir["on"] == ["id", "id"]
+        assert ir["fields"] == ["region", "size"]
+        shipped = arrow_to_table(base64.b64decode(ir["arrowB64"]))
+        assert shipped.column_names == ["id", "region", "size"]
+        assert arrow_to_table(arrow_data).column_names == ["id"]
+
+    def test_eager_opt_in(self):
+        """Test eager=True joins in the kernel when leading."""
+        op = lookup(self.STORES, on="id", fields=["size"], eager=True)
+        builder = chart([{"id": 2}]).flow(op, spread(by="id", dir="x"))
+        arrow_data, spec, _ = builder.mark(rect(h="size"))._prepare_render()
+        assert [o["type"] for o in spec["operators"]] == ["spread"]
+        assert arrow_to_table(arrow_data).to_pylist() == [{"id": 2, "size": 20}]
+
+    def test_unknown_field(self):
+        """Test requesting a missing lookup field fails early."""
+        with pytest.raises(ValueError, match="nope"):
+            lookup(self.STORES, on="id", fields=["nope"])
+
+    def test_dictionary_encoding(self):
+        """Test repeated strings are dictionary-encoded for transfer."""
+        table = pa.table({"s": ["a", "b", "a", "a"], "u": ["w", "x", "y", "z"]})
+        schema = arrow_to_table(table_to_arrow(table, dictionary=True)).schema
+        assert pa.types.is_dictionary(schema.field("s").type)
+        assert pa.types.is_string(schema.field("u").type)
@@ -0,0 +1,112 @@
+"""Tests for transpiling derive() lambdas into declarative IR operators."""
+
+import math
+import operator
+import os
+from typing import Final
+
+from gofish import derive
+from gofish import transpile as transpile_module
+from gofish.transpile import transpile
+
+THRESHOLD: Final = 5
+LIMIT = 5
+
+
+class TestTranspile:
+    """Test supported lambda shapes and RPC fallbacks."""
+
+    def test_sorted_by_field(self):
+        """Test sorted(d, key=lambda r: r["f"]) becomes a sort operator."""
+        op = transpile(lambda d: sorted(d, key=lambda r: r["count"]))
+        assert op == {"type": "sort", "by": ["count"], "order": ["ascending"]}
+
+    def test_sorted_tuple_key_reverse(self):
+        """Test tuple keys, negated fields and reverse=True."""
+        op = transpile(
+            lambda d: sorted(d, key=lambda r: (r["a"], -r["b"]), reverse=True)
+        )
+        assert op == {
+            "type": "sort",
+            "by": ["a", "b"],
+            "order": ["descending", "ascending"],
+        }
+
+    def test_sorted_itemgetter(self):
+        """Test key=operator.itemgetter(...)."""
+        op = transpile(lambda d: sorted(d, key=operator.itemgetter("x")))
+        assert op == {"type": "sort", "by": ["x"], "order": ["ascending"]}
+
+    def test_dict_spread_comprehension(self):
+        """Test [{**row, "x": f(row["y"])} for row in d] becomes calculate."""
+        op = transpile(lambda d: [{**row, "Death": math.sqrt(row["Death"])} for row in d])
+        assert op == {
+            "type": "calculate",
+            "name": "Death",
+            "expr": {
+                "type": "call",
+                "fn": "sqrt",
+                "args": [{"type": "field", "name": "Death"}],
+            },
+        }
+
+    def test_filter_comprehension_inlines_constants(self):
+        """Test filter comprehensions, with globals inlined as literals."""
+        op = transpile(lambda d: [r for r in d if r["x"] > THRESHOLD and r.get("y")])
+        assert op["type"] == "filter"
+        assert op["expr"]["op"] == "and"
+        assert op["expr"]["left"]["right"] == {"type": "literal", "value": 5}
+        assert op["expr"]["right"] == {"type": "field", "name": "y"}
+
+    def test_mutable_names_fall_back(self):
+        """Test plain globals and closure variables are read at call time."""
+        scale = 2
+
+        assert transpile(lambda d: [{**r, "y": r["x"] * scale} for r in d]) is None
+        assert transpile(lambda d: [r for r in d if r["x"] > LIMIT]) is None
+        assert transpile(lambda d: sorted(d, key=operator.itemgetter(FIELD))) is None
+
+    def test_parsed_module_cached(self):
+        """Test the source file is parsed once per mtime."""
+        transpile(lambda d: sorted(d, key=lambda r: r["count"]))
+        stamp = os.stat(__file__).st_mtime_ns
+        assert (__file__, stamp) in transpile_module._MODULE_CACHE
+
+    def test_unsupported_falls_back(self):
+        """Test lambdas outside the supported subset are not transpiled."""
+        assert transpile(lambda d: d) is None
+        assert transpile(lambda d: [d[i : i + 5] for i in range(0, len(d), 5)]) is None
+        assert transpile(lambda d: [{**r, "x": r["x"] or 1} for r in d]) is None
+        assert transpile(lambda d: [{**r, "x": round(r["x"])} for r in d]) is None
+        assert transpile(lambda d: [{**r, "x": helper(r)} for r in d]) is None
+
+    def test_named_functions_not_transpiled(self):
+        """Test def functions keep using the RPC."""
+
+        def sort_rows(d):
+            return sorted(d, key=lambda r: r["count"])
+
+        assert transpile(sort_rows) is None
+
+
+class TestDeriveOperatorTranspile:
+    """Test DeriveOperator serialization with transpiled lambdas."""
+
+    def test_to_dict_uses_transpiled_op(self):
+        """Test transpiled derives serialize as IR ops with a fallback lambdaId."""
+        op = derive(lambda d: sorted(d, key=lambda r: r["count"]))
+        d = op.to_dict()
+        assert d["type"] == "sort"
+        assert d["lambdaId"] == op.lambda_id
+
+    def test_transpile_opt_out(self):
+        """Test derive(..., transpile=False) always uses the RPC."""
+        op = derive(lambda d: sorted(d, key=lambda r: r["count"]), transpile=False)
+        assert op.to_dict() == {"type": "derive", "lambdaId": op.lambda_id}
+
+
+def helper(row):
+    return row
+
+
+FIELD = "x"
@@ -0,0 +1,244 @@
+"""Tests for the kernel side of the widget derive protocol."""
+
+import asyncio
+import base64
+import threading
+
+import pandas as pd
+import pytest
+
+from gofish import chart
+from gofish.arrow_utils import arrow_to_table, dataframe_to_arrow
+from gofish.widget import (
+    ResponseBatch,
+    answer_derive_request,
+    answer_derive_request_async,
+    call_on_loop,
+)
+
+
+def _request(request_id, lambda_id, rows):
+    arrow = dataframe_to_arrow(pd.DataFrame(rows))
+    return {
+        "requestId": request_id,
+        "lambdaId": lambda_id,
+        "arrowB64": base64.b64encode(arrow).decode("utf-8"),
+    }
+
+
+def _rows(response):
+    return arrow_to_table(base64.b64decode(response["resultB64"])).to_pylist()
+
+
+class TestQueuedDerive:
+    """Test answering queued derive requests."""
+
+    def test_answers_request(self):
+        """Test a request is answered with its id and an Arrow result."""
+        functions = {"double": lambda d: [{"x": r["x"] * 2} for r in d]}
+        response = answer_derive_request(
+            functions, _request("r1", "double", [{"x": 1}, {"x": 2}])
+        )
+        assert response["requestId"] == "r1"
+        assert _rows(response) == [{"x": 2}, {"x": 4}]
+
+    def test_errors_are_reported_per_request(self):
+        """Test failures become error responses instead of exceptions."""
+        functions = {"boom": lambda d: 1 / 0}
+        response = answer_derive_request(
+            functions, _request("r2", "boom", [{"x": 1}])
+        )
+        assert response == {
+            "requestId": "r2",
+            "error": "ZeroDivisionError: division by zero",
+        }
+
+    def test_unknown_lambda(self):
+        """Test an unknown lambda ID is an error response."""
+        response = answer_derive_request({}, _request("r3", "missing", [{"x": 1}]))
+        assert "not found" in response["error"]
+
+
+async def _double_later(d):
+    await asyncio.sleep(0)
+    return [{"x": r["x"] * 2} for r in d]
+
+
+class TestResponseBatch:
+    """Test collecting a derive_requests batch's responses for one sync."""
+
+    def test_published_when_all_settled(self):
+        """Test responses are released together after the last request."""
+        batch = ResponseBatch([{"requestId": "a"}, {"requestId": "b"}])
+        assert batch.settle("b", {"requestId": "b"}) is None
+        assert batch.settle("a", {"requestId": "a"}) == [
+            {"requestId": "b"},
+            {"requestId": "a"},
+        ]
+        # Settling again does not publish twice
+        assert batch.settle("a", {"requestId": "a"}) is None
+
+    def test_cancelled_generation_settles(self):
+        """Test cancelled requests do not hold back the rest of the batch."""
+        batch = ResponseBatch(
+            [
+                {"requestId": "a", "generation": "g1"},
+                {"requestId": "b", "generation": "g2"},
+            ]
+        )
+        assert batch.settle("b", {"requestId": "b"}) is None
+        assert batch.cancel(["g1"]) == [{"requestId": "b"}]
+
+
+class TestCallOnLoop:
+    """Test handing derive responses back to the kernel's event loop."""
+
+    def test_worker_thread_hands_off_to_loop(self):
+        """Test a call from a worker thread runs on the loop's thread."""
+        ran_on = []
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            done = asyncio.Event()
+
+            def publish():
+                ran_on.append(threading.get_ident())
+                done.set()
+
+            worker = threading.Thread(target=call_on_loop, args=(loop, publish))
+            worker.start()
+            worker.join()
+            # Scheduled, not run on the worker
+            assert ran_on == []
+            await asyncio.wait_for(done.wait(), 5)
+            return threading.get_ident()
+
+        assert ran_on == [asyncio.run(main())]
+
+    def test_runs_now_without_loop_or_on_loop(self):
+        """Test calls run immediately without a loop or on its thread."""
+        calls = []
+        call_on_loop(None, calls.append, 1)
+
+        async def main():
+            call_on_loop(asyncio.get_running_loop(), calls.append, 2)
+
+        asyncio.run(main())
+        assert calls == [1, 2]
+
+    def test_closed_loop_drops_call(self):
+        """Test a closed loop (kernel shutting down) drops the call."""
+        loop = asyncio.new_event_loop()
+        loop.close()
+        calls = []
+        call_on_loop(loop, calls.append, 1)
+        assert calls == []
+
+
+class TestAsyncDerive:
+    """Test ``async def`` derive functions."""
+
+    def test_awaited_on_loop(self):
+        """Test an async derive is awaited by the async request path."""
+        response = asyncio.run(
+            answer_derive_request_async(
+                {"double": _double_later}, _request("r1", "double", [{"x": 3}])
+            )
+        )
+        assert _rows(response) == [{"x": 6}]
+
+    def test_runs_without_loop(self):
+        """Test an async derive also works from a worker thread."""
+        response = answer_derive_request(
+            {"double": _double_later}, _request("r1", "double", [{"x": 3}])
+        )
+        assert _rows(response) == [{"x": 6}]
+
+    def test_errors_are_reported(self):
+        """Test async failures become error responses."""
+
+        async def boom(d):
+            raise KeyError("x")
+
+        response = asyncio.run(
+            answer_derive_request_async(
+                {"boom": boom}, _request("r2", "boom", [{"x": 1}])
+            )
+        )
+        assert response["error"] == "KeyError: 'x'"
+
+    def test_render_async_requires_mark(self):
+        """Test render_async() validates like render()."""
+        with pytest.raises(ValueError, match="mark"):
+            asyncio.run(chart([{"x": 1}]).render_async())
+
+
+def _explode(d):
+    for row in d:
+        yield [{"x": row["x"], "i": i} for i in range(row["n"])]
+
+
+class TestStreamingDerive:
+    """Test derive functions that yield their result in chunks."""
+
+    def test_chunks_are_emitted_in_order(self):
+        """Test each yielded chunk becomes a numbered partial response."""
+        partials = []
+        response = answer_derive_request(
+            {"explode": _explode},
+            _request("r1", "explode", [{"x": 1, "n": 2}, {"x": 2, "n": 1}]),
+            partials.append,
+        )
+        assert response == {"requestId": "r1", "chunks": 2}
+        assert [p["seq"] for p in partials] == [0, 1]
+        rows = [
+            row
+            for p in partials
+            for row in arrow_to_table(base64.b64decode(p["chunkB64"])).to_pylist()
+        ]
+        assert rows == [{"x": 1, "i": 0}, {"x": 1, "i": 1}, {"x": 2, "i": 0}]
+
+    def test_chunks_concatenated_without_emit(self):
+        """Test a streamed result is one response when nobody streams it."""
+        response = answer_derive_request(
+            {"explode": _explode},
+            _request("r1", "explode", [{"x": 1, "n": 2}, {"x": 2, "n": 1}]),
+        )
+        assert _rows(response) == [
+            {"x": 1, "i": 0},
+            {"x": 1, "i": 1},
+            {"x": 2, "i": 0},
+        ]
+
+    def test_record_batches(self):
+        """Test chunks may be pyarrow record batches."""
+        import pyarrow as pa
+
+        def batches(d):
+            for row in d:
+                yield pa.record_batch({"y": [row["x"] * 10]})
+
+        partials = []
+        answer_derive_request(
+            {"b": batches}, _request("r1", "b", [{"x": 1}, {"x": 2}]), partials.append
+        )
+        assert len(partials) == 2
+
+    def test_async_generator(self):
+        """Test async generators stream on the event loop."""
+
+        async def explode(d):
+            for row in d:
+                await asyncio.sleep(0)
+                yield [{"x": row["x"]}]
+
+        partials = []
+        response = asyncio.run(
+            answer_derive_request_async(
+                {"e": explode},
+                _request("r1", "e", [{"x": 1}, {"x": 2}]),
+                partials.append,
+            )
+        )
+        assert response == {"requestId": "r1", "chunks": 2}
+        assert len(partials) == 2
@@ -0,0 +1,168 @@
+/**
+ * Conversions between Arrow IPC tables and the row objects GoFish operators
+ * work on.
+ *
+ * Shared by the widget bundle and the visual-test harness.
+ */
+
+import * as Arrow from "apache-arrow";
+
+/**
+ * Reads a date or timestamp column as epoch milliseconds (null for nulls).
+ * toArray() would expose the raw storage (days, or 64-bit units).
+ */
+function temporalToMillis(column: Arrow.Vector): (number | null)[] {
+  const values: (number | null)[] = new Array(column.length);
+  for (let i = 0; i < column.length; i++) {
+    const value = column.get(i);
+    if (value === null || value === undefined) {
+      values[i] = null;
+    } else if (value instanceof Date) {
+      values[i] = value.getTime();
+    } else {
+      values[i] = Number(value);
+    }
+  }
+  return values;
+}
+
+/**
+ * Converts Arrow IPC bytes to an array of plain objects.
+ * Dates and timestamps become epoch milliseconds.
+ */
+export function arrowTableToArray(table: Arrow.Table): Record<string, any>[] {
+  const numRows = table.numRows;
+  const columns = table.schema.fields.map((field, i) => {
+    const column = table.getChildAt(i)!;
+    const temporal =
+      Arrow.DataType.isDate(field.type) ||
+      Arrow.DataType.isTimestamp(field.type);
+    let values: any;
+    if (temporal) {
+      values = temporalToMillis(column);
+    } else if (Arrow.DataType.isDictionary(field.type)) {
+      // Dictionary-encoded strings: decode through the dictionary
+      values = Array.from({ length: column.length }, (_, j) => column.get(j));
+    } else {
+      values = column.toArray();
+    }
+    return {
+      name: field.name,
+      type: field.type,
+      values: values,
+    };
+  });
+
+  const data: Record<string, any>[] = [];
+  for (let i = 0; i < numRows; i++) {
+    const row: Record<string, any> = {};
+    columns.forEach((col) => {
+      let value = col.values[i];
+      // Convert BigInt to Number if needed
+      if (typeof value === "bigint") {
+        value = Number(value);
+      } else if (value !== null && value !== undefined) {
+        const typeStr = col.type ? col.type.toString() : "";
+        if (
+          typeStr.includes("Int64") ||
+          typeStr.includes("UInt64") ||
+          typeStr.includes("Int32") ||
+          typeStr.includes("UInt32")
+        ) {
+          value = Number(value);
+        }
+      }
+      row[col.name] = value;
+    });
+    data.push(row);
+  }
+  return data;
+}
+
+/**
+ * Converts an array of objects to Arrow IPC (Uint8Array).
+ * Requires at least one row; callers should guard empty arrays.
+ *
+ * This matches the implementation of Arrow's tableToIPC function:
+ * RecordBatchStreamWriter.writeAll(table).toUint8Array(true)
+ */
+export function arrayToArrow(rows: Record<string, any>[]): Uint8Array {
+  if (!rows || rows.length === 0) {
+    throw new Error("Cannot serialize empty data to Arrow");
+  }
+
+  const table = Arrow.tableFromJSON(rows);
+  let buffer: Uint8Array | ArrayBuffer | null = null;
+
+  try {
+    // Try tableToIPC if available (simplest method)
+    if (
+      (Arrow as any).tableToIPC &&
+      typeof (Arrow as any).tableToIPC === "function"
+    ) {
+      buffer = (Arrow as any).tableToIPC(table);
+      if (buffer && buffer.byteLength > 0) {
+        return buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
+      }
+    }
+  } catch (error) {
+    // Fall through to direct approach
+    console.warn("tableToIPC failed, trying direct approach:", error);
+  }
+
+  // Direct approach: RecordBatchStreamWriter.writeAll(table).toUint8Array(true)
+  // This is what tableToIPC does internally
+  try {
+    const writer = (Arrow as any).RecordBatchStreamWriter;
+    if (!writer || typeof writer.writeAll !== "function") {
+      throw new Error("RecordBatchStreamWriter.writeAll is not available");
+    }
+
+    // writeAll accepts the table directly and returns a stream
+    const stream = writer.writeAll(table);
+    if (!stream) {
+      throw new Error("writeAll returned null/undefined");
+    }
+
+    // The stream has a toUint8Array method that finishes the stream when passed true
+    if (typeof stream.toUint8Array === "function") {
+      buffer = stream.toUint8Array(true);
+    } else if (typeof stream.finish === "function") {
+      buffer = stream.finish();
+    } else {
+      throw new Error(
+        "Stream from writeAll has neither toUint8Array nor finish method"
+      );
+    }
+
+    if (!buffer || buffer.byteLength === 0) {
+      throw new Error("Serialized Arrow buffer is empty");
+    }
+
+    return buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
+  } catch (error) {
+    throw new Error(
+      `Failed to serialize Arrow table: ${error instanceof Error ? error.message : String(error)}`
+    );
+  }
+}
+
+/** Decodes Arrow IPC stream bytes into row objects. */
+export function arrowToArray(bytes: Uint8Array): Record<string, any>[] {
+  return arrowTableToArray(Arrow.tableFromIPC(bytes));
+}
+
+/** Encodes bytes (e.g. an Arrow IPC buffer) as base64. */
+export function bytesToB64(bytes: Uint8Array): string {
+  let binary = "";
+  // Chunked: spreading a large array into fromCharCode overflows the stack
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+}
+
+/** Decodes base64 into bytes. */
+export function b64ToBytes(b64: string): Uint8Array {
+  return Uint8Array.from(atob(b64), (c) => c.charCodeAt(0));
+}
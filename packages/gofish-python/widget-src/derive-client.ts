@@ -0,0 +1,276 @@
+/**
+ * Derive RPC client: sends derive requests to the Python kernel and resolves
+ * their Arrow results.
+ *
+ * The transport is negotiated once per widget, at render time:
+ *  - "invoke": anywidget `experimental.invoke` commands (Jupyter). The
+ *    command only queues the request; results come back as custom messages.
+ *  - "queue": synced request/response batches on the model (marimo, or any
+ *    host without invoke). All derive calls made in the same tick travel in
+ *    one sync, and the kernel answers a whole batch in one sync once every
+ *    request in it has finished (streamed chunks are sent as produced).
+ *
+ * Generator derives stream their result: partial responses carry numbered
+ * Arrow chunks, handed to the caller as they arrive, and the final response
+ * only reports how many chunks were sent.
+ *
+ * Every request carries the render generation that issued it. When a view
+ * re-renders or is removed it cancels its old generation: pending promises
+ * reject with DeriveCancelledError and the kernel drops the queued work.
+ */
+
+export interface DeriveModel {
+  get(key: string): any;
+  set(key: string, value: any): void;
+  save_changes(): void;
+  on(event: string, callback: (...args: any[]) => void): void;
+  off?(event: string, callback: (...args: any[]) => void): void;
+}
+
+export interface DeriveInvoker {
+  invoke<T = any>(
+    name: string,
+    msg?: any,
+    buffers?: DataView[]
+  ): Promise<[T, DataView[]]>;
+}
+
+export type DeriveTransport = "invoke" | "queue";
+
+interface DeriveRequest {
+  requestId: string;
+  lambdaId: string;
+  arrowB64: string;
+  generation: string;
+}
+
+interface DeriveResponse {
+  requestId: string;
+  resultB64?: string;
+  error?: string;
+  // Partial response of a streamed result
+  chunkB64?: string;
+  seq?: number;
+  // Final response of a streamed result
+  chunks?: number;
+}
+
+/** Receives each Arrow chunk (base64) of a streamed result, in order. */
+export type DeriveChunkHandler = (chunkB64: string, seq: number) => void;
+
+interface PendingRequest {
+  generation: string;
+  onChunk?: DeriveChunkHandler;
+  resolve: (resultB64: string | null) => void;
+  reject: (error: Error) => void;
+}
+
+/** Rejection for derive requests whose render generation was cancelled. */
+export class DeriveCancelledError extends Error {
+  constructor(generation: string) {
+    super(`GoFish derive cancelled (generation ${generation})`);
+    this.name = "DeriveCancelledError";
+  }
+}
+
+// How long to wait for the kernel to answer the capability handshake
+const HELLO_TIMEOUT_MS = 3000;
+
+function withTimeout<T>(promise: Promise<T>, ms: number): Promise<T> {
+  return new Promise<T>((resolve, reject) => {
+    const timer = setTimeout(() => reject(new Error("timed out")), ms);
+    promise.then(
+      (value) => {
+        clearTimeout(timer);
+        resolve(value);
+      },
+      (error) => {
+        clearTimeout(timer);
+        reject(error);
+      }
+    );
+  });
+}
+
+export class DeriveClient {
+  readonly transport: Promise<DeriveTransport>;
+  private pending = new Map<string, PendingRequest>();
+  private outbox: DeriveRequest[] = [];
+  private flushScheduled = false;
+  private nextId = 0;
+  private nextGeneration = 0;
+  private cancelled = new Set<string>();
+  // Distinguishes generations of several frontends attached to one kernel
+  private readonly clientId = Math.random().toString(36).slice(2, 8);
+
+  constructor(
+    private model: DeriveModel,
+    private experimental: DeriveInvoker | undefined
+  ) {
+    this.transport = this.negotiate();
+    // Guard: some hosts may not support model.on()
+    if (typeof (model as any).on === "function") {
+      model.on("change:derive_responses", () =>
+        this.settle(this.model.get("derive_responses") || [])
+      );
+      model.on("msg:custom", (msg: any) => {
+        if (msg?.type === "derive_results") this.settle(msg.responses || []);
+      });
+    }
+  }
+
+  // Generation of the render currently building its operators
+  currentGeneration = "";
+
+  /**
+   * Starts a render generation; its requests can be cancelled together.
+   * Derive operators built until the next call capture it.
+   */
+  beginGeneration(): string {
+    this.currentGeneration = `${this.clientId}-${this.nextGeneration++}`;
+    return this.currentGeneration;
+  }
+
+  /**
+   * Cancels a render generation: rejects its pending requests and asks the
+   * kernel to drop its queued and running derive work.
+   */
+  cancel(generation: string): void {
+    if (this.cancelled.has(generation)) return;
+    this.cancelled.add(generation);
+    for (const [requestId, handlers] of this.pending) {
+      if (handlers.generation !== generation) continue;
+      this.pending.delete(requestId);
+      handlers.reject(new DeriveCancelledError(generation));
+    }
+    this.outbox = this.outbox.filter((r) => r.generation !== generation);
+    if (
+      typeof (this.model as any).set === "function" &&
+      typeof (this.model as any).save_changes === "function"
+    ) {
+      this.model.set("derive_cancel", [generation]);
+      this.model.save_changes();
+    }
+  }
+
+  /**
+   * Picks a transport with a no-op `_derive_hello` command instead of
+   * failing the first real derive.
+   */
+  private async negotiate(): Promise<DeriveTransport> {
+    if (typeof this.experimental?.invoke === "function") {
+      try {
+        const [capabilities] = await withTimeout(
+          // Wrap so synchronous throws become rejections
+          Promise.resolve().then(() =>
+            this.experimental!.invoke<{ protocol?: number }>(
+              "_derive_hello",
+              {}
+            )
+          ),
+          HELLO_TIMEOUT_MS
+        );
+        if (capabilities?.protocol) return "invoke";
+      } catch {
+        // invoke is unavailable (e.g. marimo); use the queue
+      }
+    }
+    if (
+      typeof (this.model as any).set !== "function" ||
+      typeof (this.model as any).save_changes !== "function"
+    ) {
+      throw new Error(
+        "GoFish derive: neither experimental.invoke nor traitlet sync (model.set/save_changes) is available in this environment"
+      );
+    }
+    return "queue";
+  }
+
+  /**
+   * Runs the derive function `lambdaId` on Arrow IPC input (base64) and
+   * resolves with the Arrow IPC result (base64), or with null when the
+   * result was streamed to `onChunk`.
+   */
+  async request(
+    lambdaId: string,
+    arrowB64: string,
+    generation: string,
+    onChunk?: DeriveChunkHandler
+  ): Promise<string | null> {
+    const transport = await this.transport;
+    if (this.cancelled.has(generation)) {
+      throw new DeriveCancelledError(generation);
+    }
+    const requestId = `r${this.nextId++}-${Math.random().toString(36).slice(2, 8)}`;
+    const result = new Promise<string | null>((resolve, reject) => {
+      this.pending.set(requestId, { generation, onChunk, resolve, reject });
+    });
+    const request = { requestId, lambdaId, arrowB64, generation };
+    if (transport === "invoke") {
+      this.experimental!.invoke("_submit_derive", request).catch((error) =>
+        this.settle([{ requestId, error: String(error) }])
+      );
+    } else {
+      this.outbox.push(request);
+      this.scheduleFlush();
+    }
+    return result;
+  }
+
+  /** Sends every request queued during this tick as one batch. */
+  private scheduleFlush(): void {
+    if (this.flushScheduled) return;
+    this.flushScheduled = true;
+    queueMicrotask(() => {
+      this.flushScheduled = false;
+      if (this.outbox.length === 0) return;
+      const batch = this.outbox;
+      this.outbox = [];
+      this.model.set("derive_requests", batch);
+      this.model.save_changes();
+    });
+  }
+
+  private settle(responses: DeriveResponse[]): void {
+    for (const response of responses) {
+      const handlers = this.pending.get(response.requestId);
+      if (!handlers) continue;
+      if (typeof response.chunkB64 === "string") {
+        try {
+          handlers.onChunk?.(response.chunkB64, response.seq ?? 0);
+        } catch (error) {
+          this.pending.delete(response.requestId);
+          handlers.reject(
+            error instanceof Error ? error : new Error(String(error))
+          );
+        }
+        continue;
+      }
+      this.pending.delete(response.requestId);
+      if (typeof response.resultB64 === "string") {
+        handlers.resolve(response.resultB64);
+      } else if (typeof response.chunks === "number") {
+        handlers.resolve(null);
+      } else {
+        handlers.reject(
+          new Error(`GoFish derive failed: ${response.error ?? "no result"}`)
+        );
+      }
+    }
+  }
+}
+
+const clients = new WeakMap<object, DeriveClient>();
+
+/** Returns the derive client for a widget model, creating it on first use. */
+export function getDeriveClient(
+  model: DeriveModel,
+  experimental: DeriveInvoker | undefined
+): DeriveClient {
+  let client = clients.get(model);
+  if (!client) {
+    client = new DeriveClient(model, experimental);
+    clients.set(model, client);
+  }
+  return client;
+}
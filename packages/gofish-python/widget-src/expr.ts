@@ -0,0 +1,280 @@
+/**
+ * Expression evaluation for declarative IR operators (calculate, ...).
+ *
+ * Expression trees are produced by `gofish/expr.py`. They are compiled once
+ * per call into closures over column arrays, then evaluated in a single loop
+ * over the rows — no Python round trip is involved.
+ *
+ * Shared by the widget bundle and the visual-test harness.
+ */
+
+export type ExprNode =
+  | { type: "literal"; value: any }
+  | { type: "field"; name: string }
+  | { type: "unary"; op: "-" | "not"; arg: ExprNode }
+  | { type: "binary"; op: string; left: ExprNode; right: ExprNode }
+  | { type: "cond"; test: ExprNode; then: ExprNode; else: ExprNode }
+  | { type: "call"; fn: string; args: ExprNode[] }
+  | { type: "aggregate"; fn: string; arg: ExprNode };
+
+type Evaluator = (i: number) => any;
+
+// Same semantics as gofish/expr.py: null operands give null (except for
+// and/or), "/" and "**" are floating point, "+" concatenates strings
+const BINARY: Record<string, (a: any, b: any) => any> = {
+  "+": (a, b) =>
+    typeof a === "string" || typeof b === "string"
+      ? String(a) + String(b)
+      : a + b,
+  "-": (a, b) => a - b,
+  "*": (a, b) => a * b,
+  "/": (a, b) => a / b,
+  // Floored modulo, matching the Python-side semantics
+  "%": (a, b) => a - Math.floor(a / b) * b,
+  "**": (a, b) => Math.pow(a, b),
+  "==": (a, b) => a === b,
+  "!=": (a, b) => a !== b,
+  "<": (a, b) => a < b,
+  "<=": (a, b) => a <= b,
+  ">": (a, b) => a > b,
+  ">=": (a, b) => a >= b,
+  and: (a, b) => Boolean(a) && Boolean(b),
+  or: (a, b) => Boolean(a) || Boolean(b),
+};
+
+const FUNCTIONS: Record<string, (...args: any[]) => any> = {
+  abs: Math.abs,
+  sqrt: Math.sqrt,
+  exp: Math.exp,
+  log: Math.log,
+  log10: Math.log10,
+  log2: Math.log2,
+  floor: Math.floor,
+  ceil: Math.ceil,
+  round: Math.round,
+  pow: Math.pow,
+  min: Math.min,
+  max: Math.max,
+};
+
+/**
+ * Extracts a column from row objects, as a Float64Array when every value is
+ * numeric (the common case) and a plain array otherwise.
+ */
+function columnOf(
+  rows: Record<string, any>[],
+  name: string
+): Float64Array | any[] {
+  const n = rows.length;
+  const numeric = new Float64Array(n);
+  for (let i = 0; i < n; i++) {
+    const v = rows[i][name];
+    if (typeof v !== "number") {
+      return rows.map((row) => row[name]);
+    }
+    numeric[i] = v;
+  }
+  return numeric;
+}
+
+function aggregate(fn: string, values: ArrayLike<any>): any {
+  const n = values.length;
+  let count = 0;
+  let sum = 0;
+  let min = Infinity;
+  let max = -Infinity;
+  for (let i = 0; i < n; i++) {
+    const v = values[i];
+    if (v === null || v === undefined) continue;
+    count++;
+    sum += v;
+    if (v < min) min = v;
+    if (v > max) max = v;
+  }
+  switch (fn) {
+    case "sum":
+      return sum;
+    case "mean":
+      return count > 0 ? sum / count : null;
+    case "count":
+      return count;
+    case "min":
+      return count > 0 ? min : null;
+    case "max":
+      return count > 0 ? max : null;
+    default:
+      throw new Error(`Unknown aggregate: ${fn}`);
+  }
+}
+
+/**
+ * Compiles an expression tree against a set of rows into a per-row evaluator.
+ * Field columns and aggregates are materialized once up front.
+ */
+export function compileExpression(
+  node: ExprNode,
+  rows: Record<string, any>[]
+): Evaluator {
+  const columns = new Map<string, Float64Array | any[]>();
+
+  const compile = (n: ExprNode): Evaluator => {
+    switch (n.type) {
+      case "literal": {
+        const value = n.value;
+        return () => value;
+      }
+      case "field": {
+        let column = columns.get(n.name);
+        if (!column) {
+          column = columnOf(rows, n.name);
+          columns.set(n.name, column);
+        }
+        const col = column;
+        return (i) => col[i];
+      }
+      case "unary": {
+        const arg = compile(n.arg);
+        return n.op === "-" ? (i) => -arg(i) : (i) => !arg(i);
+      }
+      case "binary": {
+        const op = BINARY[n.op];
+        if (!op) throw new Error(`Unknown operator: ${n.op}`);
+        const left = compile(n.left);
+        const right = compile(n.right);
+        return (i) => {
+          const a = left(i);
+          const b = right(i);
+          if (
+            (a === null || a === undefined || b === null || b === undefined) &&
+            n.op !== "and" &&
+            n.op !== "or"
+          ) {
+            return null;
+          }
+          return op(a, b);
+        };
+      }
+      case "cond": {
+        const test = compile(n.test);
+        const then = compile(n.then);
+        const otherwise = compile(n.else);
+        return (i) => (test(i) ? then(i) : otherwise(i));
+      }
+      case "call": {
+        const fn = FUNCTIONS[n.fn];
+        if (!fn) throw new Error(`Unknown function: ${n.fn}`);
+        const args = n.args.map(compile);
+        if (args.length === 1) {
+          const arg = args[0];
+          return (i) => {
+            const v = arg(i);
+            return v === null || v === undefined ? null : fn(v);
+          };
+        }
+        // Null if any argument is null (Math.min(null, 1) would be 0)
+        return (i) => {
+          const values = args.map((arg) => arg(i));
+          return values.some((v) => v === null || v === undefined)
+            ? null
+            : fn(...values);
+        };
+      }
+      case "aggregate": {
+        const arg = compile(n.arg);
+        const values = new Array(rows.length);
+        for (let i = 0; i < rows.length; i++) values[i] = arg(i);
+        const result = aggregate(n.fn, values);
+        return () => result;
+      }
+      default:
+        throw new Error(`Unknown expression node: ${(n as any).type}`);
+    }
+  };
+
+  return compile(node);
+}
+
+/**
+ * Evaluates an expression for every row, returning a Float64Array when all
+ * results are numbers.
+ */
+export function evaluateExpression(
+  node: ExprNode,
+  rows: Record<string, any>[]
+): Float64Array | any[] {
+  const evaluate = compileExpression(node, rows);
+  const n = rows.length;
+  const numeric = new Float64Array(n);
+  for (let i = 0; i < n; i++) {
+    const v = evaluate(i);
+    if (typeof v !== "number") {
+      // Fall back to a generic array for strings, booleans and nulls
+      const values: any[] = Array.from(numeric.subarray(0, i));
+      values.push(v);
+      for (let j = i + 1; j < n; j++) values.push(evaluate(j));
+      return values;
+    }
+    numeric[i] = v;
+  }
+  return numeric;
+}
+
+/**
+ * Applies a calculate operator: returns new rows with `name` set to the
+ * expression's value.
+ */
+export function applyCalculate(
+  rows: Record<string, any>[],
+  name: string,
+  expr: ExprNode
+): Record<string, any>[] {
+  const values = evaluateExpression(expr, rows);
+  const out = new Array(rows.length);
+  for (let i = 0; i < rows.length; i++) {
+    out[i] = { ...rows[i], [name]: values[i] };
+  }
+  return out;
+}
+
+/**
+ * Applies a filter operator: keeps rows for which the expression is truthy.
+ */
+export function applyFilter(
+  rows: Record<string, any>[],
+  expr: ExprNode
+): Record<string, any>[] {
+  const test = compileExpression(expr, rows);
+  const out: Record<string, any>[] = [];
+  for (let i = 0; i < rows.length; i++) {
+    if (test(i)) out.push(rows[i]);
+  }
+  return out;
+}
+
+function compareValues(a: any, b: any): number {
+  if (a === b) return 0;
+  if (a === null || a === undefined) return 1;
+  if (b === null || b === undefined) return -1;
+  return a < b ? -1 : a > b ? 1 : 0;
+}
+
+/**
+ * Applies a sort operator: stable multi-key sort, matching Python's sorted().
+ */
+export function applySort(
+  rows: Record<string, any>[],
+  by: string[],
+  order: ("ascending" | "descending")[]
+): Record<string, any>[] {
+  const columns = by.map((field) => columnOf(rows, field));
+  const signs = by.map((_, k) => (order[k] === "descending" ? -1 : 1));
+  const index = Array.from({ length: rows.length }, (_, i) => i);
+  index.sort((i, j) => {
+    for (let k = 0; k < columns.length; k++) {
+      const c = compareValues(columns[k][i], columns[k][j]);
+      if (c !== 0) return c * signs[k];
+    }
+    return i - j;
+  });
+  return index.map((i) => rows[i]);
+}
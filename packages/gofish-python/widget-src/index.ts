@@ -33,6 +33,16 @@ import {
   type Operator,
   type Mark,
 } from "gofish-graphics";
+import { applyCalculate, applyFilter, applySort } from "./expr";
+import { applyLookup, applyRepeat, buildLookupIndex } from "./table";
+import {
+  arrayToArrow,
+  arrowTableToArray,
+  b64ToBytes,
+  bytesToB64,
+} from "./arrow";
+import { getDeriveClient } from "./derive-client";
+import { KernelTimings, RenderTimings } from "./timings";
 
 // Type definitions for widget model and IR
 interface WidgetModel {
@@ -43,10 +53,15 @@ interface WidgetModel {
   get(key: "axes"): boolean;
   get(key: "debug"): boolean;
   get(key: "container_id"): string;
-  get(key: "derive_response"): { requestId: string; resultB64: string } | null;
+  get(key: "visible"): boolean;
+  get(key: "kernel_timings"): KernelTimings;
+  get(key: "tracing"): boolean;
+  get(key: "derive_responses"): { requestId: string; resultB64?: string; error?: string }[];
   set(key: string, value: any): void;
   save_changes(): void;
-  on(event: string, callback: () => void): void;
+  on(event: string, callback: (...args: any[]) => void): void;
+  off?(event: string, callback: (...args: any[]) => void): void;
+  send?(content: any): void;
 }
 
 interface ExperimentalAPI {
@@ -78,7 +93,19 @@ interface LayerSpec {
 }
 
 interface OperatorSpec {
-  type: "derive" | "spread" | "stack" | "group" | "scatter" | "table" | "log";
+  type:
+    | "derive"
+    | "calculate"
+    | "filter"
+    | "sort"
+    | "lookup"
+    | "repeat"
+    | "spread"
+    | "stack"
+    | "group"
+    | "scatter"
+    | "table"
+    | "log";
   lambdaId?: string;
   [key: string]: any;
 }
@@ -116,48 +143,6 @@ interface RenderOptions {
   debug: boolean;
 }
 
-// Arrow conversion helper
-/**
- * Converts Arrow IPC bytes to an array of plain objects.
- */
-function arrowTableToArray(table: Arrow.Table): Record<string, any>[] {
-  const numRows = table.numRows;
-  const columns = table.schema.fields.map((field, i) => {
-    const column = table.getChildAt(i);
-    const values = column.toArray();
-    return {
-      name: field.name,
-      type: field.type,
-      values: values,
-    };
-  });
-
-  const data: Record<string, any>[] = [];
-  for (let i = 0; i < numRows; i++) {
-    const row: Record<string, any> = {};
-    columns.forEach((col) => {
-      let value = col.values[i];
-      // Convert BigInt to Number if needed
-      if (typeof value === "bigint") {
-        value = Number(value);
-      } else if (value !== null && value !== undefined) {
-        const typeStr = col.type ? col.type.toString() : "";
-        if (
-          typeStr.includes("Int64") ||
-          typeStr.includes("UInt64") ||
-          typeStr.includes("Int32") ||
-          typeStr.includes("UInt32")
-        ) {
-          value = Number(value);
-        }
-      }
-      row[col.name] = value;
-    });
-    data.push(row);
-  }
-  return data;
-}
-
 /**
  * Normalizes a value to an array for Arrow conversion.
  */
@@ -171,103 +156,59 @@ function normalizeToArray(value: any): any[] {
   return [value];
 }
 
-/**
- * Converts an array of objects to Arrow IPC (Uint8Array).
- * Requires at least one row; callers should guard empty arrays.
- *
- * This matches the implementation of Arrow's tableToIPC function:
- * RecordBatchStreamWriter.writeAll(table).toUint8Array(true)
- */
-function arrayToArrow(rows: Record<string, any>[]): Uint8Array {
-  if (!rows || rows.length === 0) {
-    throw new Error("Cannot serialize empty data to Arrow");
-  }
+// Column tagging each row of a batched transform call with its partition
+const PARTITION_FIELD = "_partition";
 
-  const table = Arrow.tableFromJSON(rows);
-  let buffer: Uint8Array | ArrayBuffer | null = null;
+type Rows = Record<string, any>[];
 
-  try {
-    // Try tableToIPC if available (simplest method)
-    if (
-      (Arrow as any).tableToIPC &&
-      typeof (Arrow as any).tableToIPC === "function"
-    ) {
-      buffer = (Arrow as any).tableToIPC(table);
-      if (buffer && buffer.byteLength > 0) {
-        return buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
-      }
-    }
-  } catch (error) {
-    // Fall through to direct approach
-    console.warn("tableToIPC failed, trying direct approach:", error);
-  }
-
-  // Direct approach: RecordBatchStreamWriter.writeAll(table).toUint8Array(true)
-  // This is what tableToIPC does internally
-  try {
-    const writer = (Arrow as any).RecordBatchStreamWriter;
-    if (!writer || typeof writer.writeAll !== "function") {
-      throw new Error("RecordBatchStreamWriter.writeAll is not available");
-    }
-
-    // writeAll accepts the table directly and returns a stream
-    const stream = writer.writeAll(table);
-    if (!stream) {
-      throw new Error("writeAll returned null/undefined");
-    }
-
-    // The stream has a toUint8Array method that finishes the stream when passed true
-    if (typeof stream.toUint8Array === "function") {
-      buffer = stream.toUint8Array(true);
-    } else if (typeof stream.finish === "function") {
-      buffer = stream.finish();
-    } else {
-      throw new Error(
-        "Stream from writeAll has neither toUint8Array nor finish method"
-      );
+/**
+ * Collects the partitions a transform derive is called on in the same tick
+ * (one per group after a spread) and sends them as a single call: the rows
+ * are concatenated with a partition column, and the result rows are split
+ * back by it. The kernel runs the transform once per partition.
+ */
+function batchPartitions(
+  send: (rows: Rows) => Promise<Rows>
+): (rows: Rows) => Promise<Rows> {
+  let pending: {
+    rows: Rows;
+    resolve: (rows: Rows) => void;
+    reject: (error: unknown) => void;
+  }[] = [];
+
+  const flush = async () => {
+    const batch = pending;
+    pending = [];
+    if (batch.length === 1) {
+      send(batch[0].rows).then(batch[0].resolve, batch[0].reject);
+      return;
     }
-
-    if (!buffer || buffer.byteLength === 0) {
-      throw new Error("Serialized Arrow buffer is empty");
+    const tagged = batch.flatMap(({ rows }, i) =>
+      rows.map((row) => ({ ...row, [PARTITION_FIELD]: i }))
+    );
+    try {
+      const result = await send(tagged);
+      const parts: Rows[] = batch.map(() => []);
+      for (const row of result) {
+        const { [PARTITION_FIELD]: partition, ...rest } = row;
+        parts[partition]?.push(rest);
+      }
+      batch.forEach((entry, i) => entry.resolve(parts[i]));
+    } catch (error) {
+      for (const entry of batch) entry.reject(error);
     }
+  };
 
-    return buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
-  } catch (error) {
-    throw new Error(
-      `Failed to serialize Arrow table: ${error instanceof Error ? error.message : String(error)}`
-    );
-  }
+  return (rows) =>
+    new Promise<Rows>((resolve, reject) => {
+      pending.push({ rows, resolve, reject });
+      if (pending.length === 1) queueMicrotask(flush);
+    });
 }
 
-// Module-level state for traitlet-based derive fallback
-// null = untested, true = invoke works, false = use traitlet fallback
-let useInvoke: boolean | null = null;
-const pendingDerivesByModel = new WeakMap<
-  object,
-  Map<string, { resolve: (v: string) => void; reject: (e: Error) => void }>
->();
-const listenerSetupByModel = new WeakSet<object>();
-
-function setupDeriveResponseListener(model: WidgetModel): void {
-  const key = model as object;
-  if (listenerSetupByModel.has(key)) return;
-  listenerSetupByModel.add(key);
-  if (!pendingDerivesByModel.has(key)) {
-    pendingDerivesByModel.set(key, new Map());
-  }
-  // Guard: marimo may not support model.on()
-  if (typeof (model as any).on !== "function") return;
-  model.on("change:derive_response", () => {
-    const response = model.get("derive_response");
-    if (!response?.requestId) return;
-    const pending = pendingDerivesByModel.get(key);
-    const handlers = pending?.get(response.requestId);
-    if (handlers) {
-      pending!.delete(response.requestId);
-      handlers.resolve(response.resultB64);
-    }
-  });
-}
+// Timings of the render whose chart is being built; derive operators
+// capture it so their round trips count towards that render
+let activeTimings: RenderTimings | null = null;
 
 // Operator mapping: IR operator specs -> GoFish API operators
 /**
@@ -292,8 +233,33 @@ const OPERATOR_MAP: Record<
       throw new Error("derive operator missing lambdaId");
     }
 
-    // Ensure traitlet response listener is set up for this model
-    setupDeriveResponseListener(model);
+    const client = getDeriveClient(model, experimental);
+    // Requests belong to the render that built this operator
+    const generation = client.currentGeneration;
+    const timings = activeTimings;
+
+    const send = async (rows: Rows): Promise<Rows> => {
+      const arrowBuffer = arrayToArrow(rows);
+      const arrowB64 = bytesToB64(arrowBuffer);
+      // Streamed results are decoded chunk by chunk while the kernel is
+      // still producing the rest
+      const chunks: Record<string, any>[][] = [];
+      const requestStart = performance.now();
+      const resultB64 = await client.request(
+        lambdaId,
+        arrowB64,
+        generation,
+        (chunkB64, seq) => {
+          chunks[seq] = decodeArrowB64(chunkB64);
+        }
+      );
+      timings?.addDeriveWait(requestStart, lambdaId);
+      return resultB64 === null
+        ? ([] as Rows).concat(...chunks)
+        : decodeArrowB64(resultB64);
+    };
+    // Columnar transforms run every partition of a render in one call
+    const run = opts.transform ? batchPartitions(send) : send;
 
     return derive(async (d: any) => {
       const rows = normalizeToArray(d);
@@ -301,69 +267,7 @@ const OPERATOR_MAP: Record<
         return Array.isArray(d) ? d : (d ?? null);
       }
 
-      const arrowBuffer = arrayToArrow(rows);
-      const arrowB64 = btoa(String.fromCharCode(...arrowBuffer));
-
-      let resultB64: string | undefined;
-
-      // Fast path: try experimental.invoke (works in Jupyter, not in marimo)
-      if (useInvoke !== false) {
-        try {
-          // Wrap in Promise.resolve to ensure synchronous throws become rejections
-          const [response] = await Promise.resolve().then(() =>
-            experimental.invoke<{ resultB64: string }>("_execute_derive", {
-              lambdaId,
-              arrowB64,
-            })
-          );
-          useInvoke = true;
-          const rb64 = response?.resultB64;
-          if (typeof rb64 !== "string") {
-            throw new Error("Invalid executeDerive response from Python");
-          }
-          resultB64 = rb64;
-        } catch (err: any) {
-          if (useInvoke === null) {
-            // First attempt failed — invoke not supported, fall back to traitlets
-            useInvoke = false;
-          } else {
-            throw err;
-          }
-        }
-      }
-
-      // Traitlet fallback: used when invoke is not supported (e.g. marimo)
-      if (useInvoke === false) {
-        if (
-          typeof (model as any).set !== "function" ||
-          typeof (model as any).save_changes !== "function"
-        ) {
-          throw new Error(
-            "GoFish derive: neither experimental.invoke nor traitlet sync (model.set/save_changes) is available in this environment"
-          );
-        }
-        const requestId = `r-${Math.random().toString(36).slice(2)}`;
-        resultB64 = await new Promise<string>((resolve, reject) => {
-          const pending = pendingDerivesByModel.get(model as object);
-          if (!pending) {
-            reject(
-              new Error(
-                "GoFish derive: pendingDerives map not initialized for this model"
-              )
-            );
-            return;
-          }
-          pending.set(requestId, { resolve, reject });
-          model.set("derive_request", { requestId, lambdaId, arrowB64 });
-          model.save_changes();
-        });
-      }
-
-      const resultBuffer = Uint8Array.from(atob(resultB64!), (c) =>
-        c.charCodeAt(0)
-      );
-      const resultTable = Arrow.tableFromIPC(resultBuffer);
-      const resultArray = arrowTableToArray(resultTable);
+      const resultArray = await run(rows);
 
       if (Array.isArray(d)) {
         return resultArray;
@@ -372,6 +276,78 @@ const OPERATOR_MAP: Record<
       return resultArray[0] ?? null;
     });
   },
+  calculate: (
+    opts: Record<string, any>,
+    _model: WidgetModel,
+    _experimental: ExperimentalAPI
+  ) => {
+    const { name, expr } = opts;
+    if (!name || !expr) {
+      throw new Error("calculate operator missing name or expr");
+    }
+    return derive((d: any) => {
+      const rows = normalizeToArray(d);
+      const result = applyCalculate(rows, name, expr);
+      return Array.isArray(d) ? result : (result[0] ?? null);
+    });
+  },
+  filter: (
+    opts: Record<string, any>,
+    _model: WidgetModel,
+    _experimental: ExperimentalAPI
+  ) => {
+    const { expr } = opts;
+    if (!expr) {
+      throw new Error("filter operator missing expr");
+    }
+    return derive((d: any) => {
+      const result = applyFilter(normalizeToArray(d), expr);
+      return Array.isArray(d) ? result : (result[0] ?? null);
+    });
+  },
+  sort: (
+    opts: Record<string, any>,
+    _model: WidgetModel,
+    _experimental: ExperimentalAPI
+  ) => {
+    const { by, order } = opts;
+    if (!Array.isArray(by) || by.length === 0) {
+      throw new Error("sort operator missing by");
+    }
+    return derive((d: any) => {
+      if (!Array.isArray(d)) return d;
+      return applySort(d, by, order || []);
+    });
+  },
+  lookup: (
+    opts: Record<string, any>,
+    _model: WidgetModel,
+    _experimental: ExperimentalAPI
+  ) => {
+    const { on, fields, arrowB64 } = opts;
+    if (!Array.isArray(on) || !Array.isArray(fields) || !arrowB64) {
+      throw new Error("lookup operator missing on, fields or arrowB64");
+    }
+    const [left, right] = on;
+    // Decode and index the lookup table once per render, not per partition
+    const index = buildLookupIndex(decodeArrowB64(arrowB64), right, fields);
+    const defaultValue = opts.default ?? null;
+    return derive((d: any) => {
+      const result = applyLookup(normalizeToArray(d), left, index, defaultValue);
+      return Array.isArray(d) ? result : (result[0] ?? null);
+    });
+  },
+  repeat: (
+    opts: Record<string, any>,
+    _model: WidgetModel,
+    _experimental: ExperimentalAPI
+  ) => {
+    const { field } = opts;
+    if (!field) {
+      throw new Error("repeat operator missing field");
+    }
+    return derive((d: any) => applyRepeat(normalizeToArray(d), field));
+  },
   spread: (
     opts: Record<string, any>,
     _model: WidgetModel,
@@ -529,11 +505,17 @@ function renderError(
 /**
  * Decodes a base64 Arrow IPC buffer to an array of data objects.
  */
-function decodeArrowB64(b64: string): Record<string, any>[] {
+function decodeArrowB64(
+  b64: string,
+  timings?: RenderTimings
+): Record<string, any>[] {
   if (!b64) return [];
-  const arrowBuffer = Uint8Array.from(atob(b64), (c) => c.charCodeAt(0));
-  const table = Arrow.tableFromIPC(arrowBuffer);
-  return arrowTableToArray(table);
+  const decode = () => {
+    return Arrow.tableFromIPC(b64ToBytes(b64));
+  };
+  if (!timings) return arrowTableToArray(decode());
+  const table = timings.time("decode_arrow", decode);
+  return timings.time("arrow_table_to_array", () => arrowTableToArray(table));
 }
 
 /**
@@ -579,11 +561,12 @@ function buildChart(
 /**
  * Renders a Layer (multi-chart composition) from widget model state.
  */
-function renderLayer(
+async function renderLayer(
   model: WidgetModel,
   container: HTMLElement,
-  experimental: ExperimentalAPI
-): void {
+  experimental: ExperimentalAPI,
+  timings: RenderTimings
+): Promise<void> {
   const debug = model.get("debug");
   const log = debug
     ? (...args: any[]) => console.log("[GoFish Widget]", ...args)
@@ -606,9 +589,11 @@ function renderLayer(
   const childCharts: ChartBuilder[] = spec.charts.map(
     (chartSpec: ChartSpec, i: number) => {
       const b64 = arrowDict[String(i)] || "";
-      const data = decodeArrowB64(b64);
+      const data = decodeArrowB64(b64, timings);
       log(`Building chart ${i}: ${data.length} rows`);
-      return buildChart(chartSpec, data, model, experimental);
+      return timings.time("build_chart", () =>
+        buildChart(chartSpec, data, model, experimental)
+      );
     }
   );
 
@@ -623,11 +608,13 @@ function renderLayer(
   };
 
   log("Calling Layer([...]).render()...");
-  if (Object.keys(resolvedLayerOptions).length > 0) {
-    Layer(resolvedLayerOptions, childCharts).render(container, renderOptions);
-  } else {
-    Layer(childCharts).render(container, renderOptions);
-  }
+  const layer =
+    Object.keys(resolvedLayerOptions).length > 0
+      ? Layer(resolvedLayerOptions, childCharts)
+      : Layer(childCharts);
+  await timings.timeAsync("resolve", async () => {
+    await layer.render(container, renderOptions);
+  });
   log("Layer rendered successfully!");
 }
 
@@ -635,18 +622,38 @@ function renderLayer(
 /**
  * Renders a GoFish chart from widget model state.
  */
-function renderChart(
+async function renderChart(
   model: WidgetModel,
   container: HTMLElement,
-  experimental: ExperimentalAPI
-): void {
+  experimental: ExperimentalAPI,
+  timings: RenderTimings
+): Promise<void> {
   const spec = model.get("spec");
 
-  // Dispatch to layer renderer if spec.type === "layer"
-  if ((spec as any).type === "layer") {
-    renderLayer(model, container, experimental);
-    return;
+  // Derive operators built below report their waits to this render
+  activeTimings = timings;
+  try {
+    // Dispatch to layer renderer if spec.type === "layer"
+    if ((spec as any).type === "layer") {
+      await renderLayer(model, container, experimental, timings);
+      return;
+    }
+    await renderSingleChart(model, container, experimental, timings);
+  } finally {
+    activeTimings = null;
   }
+}
+
+/**
+ * Renders a single (non-layer) chart from widget model state.
+ */
+async function renderSingleChart(
+  model: WidgetModel,
+  container: HTMLElement,
+  experimental: ExperimentalAPI,
+  timings: RenderTimings
+): Promise<void> {
+  const spec = model.get("spec");
 
   const chartSpec = spec as ChartSpec;
   const debug = model.get("debug");
@@ -664,7 +671,7 @@ function renderChart(
   if (arrowDataB64) {
     try {
       log("Decoding Arrow data...");
-      data = decodeArrowB64(arrowDataB64);
+      data = decodeArrowB64(arrowDataB64, timings);
       log(`Converted to ${data.length} data objects`);
     } catch (error) {
       const err =
@@ -680,7 +687,9 @@ function renderChart(
   // 2. Build and render chart
   try {
     log("Building chart...");
-    let node = buildChart(chartSpec, data, model, experimental);
+    let node = timings.time("build_chart", () =>
+      buildChart(chartSpec, data, model, experimental)
+    );
 
     const renderOptions: RenderOptions = {
       w: model.get("width"),
@@ -690,7 +699,9 @@ function renderChart(
     };
     log("Render options:", renderOptions);
     log("Calling node.render()...");
-    node.render(container, renderOptions);
+    await timings.timeAsync("resolve", async () => {
+      await node.render(container, renderOptions);
+    });
     log("Chart rendered successfully!");
   } catch (error) {
     const err =
@@ -724,31 +735,94 @@ export default {
 
     log("render() called");
 
-    // Get container ID
-    const containerId = model.get("container_id");
-    log(`Container ID: ${containerId}`);
-
-    // Create container div
-    el.innerHTML = `<div id="${containerId}"></div>`;
-    // Query the container directly from el to avoid timing issues
-    const container = el.querySelector(`#${containerId}`) as HTMLElement;
-    if (!container) {
-      const error = new Error(
-        `Container with id "${containerId}" not found after creation`
-      );
-      renderError(el, error, debug);
-      return;
-    }
+    // Negotiate the derive transport now, while data is decoded, rather
+    // than on the first derive call
+    const client = getDeriveClient(model, experimental);
+    let generation = "";
+    // Only the first draw follows the kernel's state transfer
+    let drawn = 0;
+
+    const draw = async () => {
+      // Results of the previous render's derives are no longer needed
+      if (generation) client.cancel(generation);
+      generation = client.beginGeneration();
+      const current = generation;
+      const timings = new RenderTimings();
+      timings.fromKernel(model.get("kernel_timings"), drawn++ === 0);
+
+      // Get container ID
+      const containerId = model.get("container_id");
+      log(`Container ID: ${containerId}`);
+
+      // Create container div
+      el.innerHTML = `<div id="${containerId}"></div>`;
+      // Query the container directly from el to avoid timing issues
+      const container = el.querySelector(`#${containerId}`) as HTMLElement;
+      if (!container) {
+        const error = new Error(
+          `Container with id "${containerId}" not found after creation`
+        );
+        renderError(el, error, debug);
+        return;
+      }
 
-    // Render the chart with error handling
-    try {
-      renderChart(model, container, experimental);
-    } catch (error) {
-      const err = error instanceof Error ? error : new Error(String(error));
-      log("Error in render():", err);
-      renderError(container, err, debug);
+      // Render the chart with error handling
+      try {
+        await renderChart(model, container, experimental, timings);
+        await timings.timePaint(container);
+      } catch (error) {
+        if (generation !== current) return;
+        const err = error instanceof Error ? error : new Error(String(error));
+        log("Error in render():", err);
+        renderError(container, err, debug);
+        return;
+      }
+
+      // Report timings of renders that were not superseded
+      if (generation !== current) return;
+      log("Render timings:", timings.toJSON());
+      model.set("timings", timings.toJSON());
+      model.save_changes();
+      if (model.get("tracing") && typeof model.send === "function") {
+        model.send({ type: "trace_spans", spans: timings.spans });
+      }
+    };
+
+    draw();
+
+    // Re-render when the chart changes, cancelling the stale render's derives
+    const events = [
+      "change:spec",
+      "change:arrow_data",
+      "change:width",
+      "change:height",
+      "change:axes",
+    ];
+    if (typeof model.on === "function") {
+      for (const event of events) model.on(event, draw);
     }
 
     log("render() completed");
+
+    // Report visibility so the kernel runs on-screen charts' derives first
+    let observer: IntersectionObserver | undefined;
+    if (typeof IntersectionObserver === "function") {
+      observer = new IntersectionObserver((entries) => {
+        const visible = entries.some((entry) => entry.isIntersecting);
+        if (model.get("visible") === visible) return;
+        model.set("visible", visible);
+        model.save_changes();
+      });
+      observer.observe(el);
+    }
+
+    // Called by AnyWidget when the view is removed
+    return () => {
+      observer?.disconnect();
+      client.cancel(generation);
+      if (typeof model.off === "function") {
+        for (const event of events) model.off(event, draw);
+      }
+    };
   },
 };
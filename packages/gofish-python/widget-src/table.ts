@@ -0,0 +1,82 @@
+/**
+ * Row-table operators for declarative IR operators that combine or reshape
+ * rows (lookup, repeat). Like expr.ts, these run natively in the widget
+ * without a Python round trip.
+ *
+ * Shared by the widget bundle and the visual-test harness.
+ */
+
+export interface LookupIndex {
+  fields: string[];
+  byKey: Map<any, Record<string, any>>;
+}
+
+/**
+ * Builds a hash index over lookup rows. The first row for each key wins,
+ * matching the Python implementation.
+ */
+export function buildLookupIndex(
+  rows: Record<string, any>[],
+  key: string,
+  fields: string[]
+): LookupIndex {
+  const byKey = new Map<any, Record<string, any>>();
+  for (const row of rows) {
+    const k = row[key];
+    if (k === null || k === undefined || byKey.has(k)) continue;
+    byKey.set(k, row);
+  }
+  return { fields, byKey };
+}
+
+/**
+ * Applies a lookup operator: copies the indexed fields onto each row whose
+ * `key` matches, or `defaultValue` when there is no match.
+ */
+export function applyLookup(
+  rows: Record<string, any>[],
+  key: string,
+  index: LookupIndex,
+  defaultValue: any = null
+): Record<string, any>[] {
+  const { fields, byKey } = index;
+  const out = new Array(rows.length);
+  for (let i = 0; i < rows.length; i++) {
+    const row = rows[i];
+    const match = byKey.get(row[key]);
+    const joined: Record<string, any> = { ...row };
+    for (const field of fields) {
+      const value = match ? match[field] : undefined;
+      joined[field] = value === null || value === undefined ? defaultValue : value;
+    }
+    out[i] = joined;
+  }
+  return out;
+}
+
+/**
+ * Applies a repeat operator: each row appears `row[field]` times. The output
+ * array is sized once and the copies of a row are the same object, so memory
+ * grows with the total count, not with the count times the row's width.
+ * Operators never mutate their input rows (calculate and lookup copy them).
+ */
+export function applyRepeat(
+  rows: Record<string, any>[],
+  field: string
+): Record<string, any>[] {
+  const counts = new Int32Array(rows.length);
+  let total = 0;
+  for (let i = 0; i < rows.length; i++) {
+    const n = Math.max(0, Math.floor(Number(rows[i][field]) || 0));
+    counts[i] = n;
+    total += n;
+  }
+  const out = new Array(total);
+  let k = 0;
+  for (let i = 0; i < rows.length; i++) {
+    const row = rows[i];
+    out.fill(row, k, k + counts[i]);
+    k += counts[i];
+  }
+  return out;
+}
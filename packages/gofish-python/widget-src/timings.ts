@@ -0,0 +1,140 @@
+/**
+ * Per-render stage timings, synced back to the kernel as the `timings`
+ * trait (all values in milliseconds).
+ *
+ * Stages: kernel encode and transfer (from the kernel's `kernel_timings`),
+ * Arrow decode, arrowTableToArray, buildChart, resolve (operators, including
+ * derive round trips), layout (until the chart's SVG is in the DOM) and DOM
+ * render (until the frame showing it has painted). Derive waits are also
+ * summed separately, since they overlap the resolve stage.
+ *
+ * Every stage and derive round trip is also kept as a span (epoch-ms start
+ * and duration), sent to the kernel when it is recording a gofish.trace().
+ */
+
+export interface KernelTimings {
+  encode_ms?: number;
+  sent_at_ms?: number;
+  arrow_bytes?: number;
+}
+
+export interface TraceSpan {
+  name: string;
+  start: number;
+  dur: number;
+  cat?: string;
+  async?: boolean;
+  args?: Record<string, any>;
+}
+
+const now = () => performance.now();
+// Epoch milliseconds of a performance.now() reading
+const epochMs = (t: number) => performance.timeOrigin + t;
+
+export class RenderTimings {
+  readonly stages: Record<string, number> = {};
+  readonly spans: TraceSpan[] = [];
+  private deriveWaitMs = 0;
+  private deriveCalls = 0;
+  private readonly start = now();
+
+  /** Copies the kernel-side stages; `transfer` only for a fresh widget. */
+  fromKernel(kernel: KernelTimings | undefined, includeTransfer: boolean) {
+    if (!kernel) return;
+    if (typeof kernel.encode_ms === "number") {
+      this.stages.kernel_encode_ms = kernel.encode_ms;
+    }
+    if (typeof kernel.arrow_bytes === "number") {
+      this.stages.arrow_bytes = kernel.arrow_bytes;
+    }
+    if (includeTransfer && typeof kernel.sent_at_ms === "number") {
+      this.stages.transfer_ms = Math.max(0, Date.now() - kernel.sent_at_ms);
+    }
+  }
+
+  /** Adds the duration of `fn` to a stage. */
+  time<T>(stage: string, fn: () => T): T {
+    const t0 = now();
+    try {
+      return fn();
+    } finally {
+      this.add(stage, now() - t0);
+    }
+  }
+
+  /** Adds the duration of an async `fn` to a stage. */
+  async timeAsync<T>(stage: string, fn: () => Promise<T>): Promise<T> {
+    const t0 = now();
+    try {
+      return await fn();
+    } finally {
+      this.add(stage, now() - t0);
+    }
+  }
+
+  add(stage: string, ms: number): void {
+    const key = `${stage}_ms`;
+    this.stages[key] = (this.stages[key] ?? 0) + ms;
+    this.spans.push({ name: stage, start: epochMs(now() - ms), dur: ms });
+  }
+
+  /** Records one derive round trip that started at `start` (performance.now). */
+  addDeriveWait(start: number, lambdaId: string): void {
+    const ms = now() - start;
+    this.deriveWaitMs += ms;
+    this.deriveCalls += 1;
+    this.spans.push({
+      name: "derive",
+      cat: "derive",
+      start: epochMs(start),
+      dur: ms,
+      async: true,
+      args: { lambda_id: lambdaId },
+    });
+  }
+
+  /** Times layout (until an SVG appears) and the DOM render after it. */
+  async timePaint(container: HTMLElement): Promise<void> {
+    await this.timeAsync("layout", () => waitForSvg(container));
+    await this.timeAsync("dom_render", afterPaint);
+  }
+
+  toJSON(): Record<string, number> {
+    return {
+      ...this.stages,
+      derive_wait_ms: this.deriveWaitMs,
+      derive_calls: this.deriveCalls,
+      total_ms: now() - this.start,
+    };
+  }
+}
+
+// Layout runs asynchronously after render() returns; give up eventually
+const LAYOUT_TIMEOUT_MS = 60000;
+
+function waitForSvg(container: HTMLElement): Promise<void> {
+  return new Promise<void>((resolve) => {
+    if (container.querySelector("svg")) {
+      resolve();
+      return;
+    }
+    const observer = new MutationObserver(() => {
+      if (!container.querySelector("svg")) return;
+      finish();
+    });
+    const timer = setTimeout(() => finish(), LAYOUT_TIMEOUT_MS);
+    const finish = () => {
+      observer.disconnect();
+      clearTimeout(timer);
+      resolve();
+    };
+    observer.observe(container, { childList: true, subtree: true });
+  });
+}
+
+/** Resolves once the browser has painted the next frame. */
+function afterPaint(): Promise<void> {
+  return new Promise<void>((resolve) => {
+    requestAnimationFrame(() => setTimeout(resolve, 0));
+  });
+}
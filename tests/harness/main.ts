@@ -24,13 +24,32 @@ import {
   type Operator,
   type Mark,
 } from "gofish-graphics";
+import {
+  applyCalculate,
+  applyFilter,
+  applySort,
+} from "../../packages/gofish-python/widget-src/expr";
+import {
+  applyLookup,
+  applyRepeat,
+  buildLookupIndex,
+} from "../../packages/gofish-python/widget-src/table";
+import {
+  arrayToArrow,
+  arrowToArray,
+  b64ToBytes,
+  bytesToB64,
+} from "../../packages/gofish-python/widget-src/arrow";
 
 // ---------------------------------------------------------------------------
 // Types
 // ---------------------------------------------------------------------------
 
 interface HarnessSpec {
-  data: Record<string, any>[];
+  data?: Record<string, any>[];
+  // Arrow IPC data (base64) as a notebook widget receives it; takes
+  // precedence over `data`
+  arrowB64?: string;
   operators: OperatorSpec[];
   mark: MarkSpec;
   options: Record<string, any>;
@@ -61,6 +80,151 @@ declare global {
 // Operator mapping (mirrors widget-src/index.ts but uses HTTP for derive)
 // ---------------------------------------------------------------------------
 
+const ARROW_STREAM = "application/vnd.apache.arrow.stream";
+
+/** Whether rows are plain objects of scalars, i.e. representable as Arrow. */
+function isFlatTable(rows: any[]): boolean {
+  return rows.every(
+    (row) =>
+      row !== null &&
+      typeof row === "object" &&
+      !Array.isArray(row) &&
+      Object.values(row).every(
+        (v) => v === null || (typeof v !== "object" && typeof v !== "function")
+      )
+  );
+}
+
+/** Sends one derive call to /derive/<id>. */
+async function deriveOne(
+  deriveServerUrl: string,
+  lambdaId: string,
+  rows: any[]
+): Promise<any> {
+  // Flat rows travel as Arrow IPC, like widget derives; nested data
+  // (e.g. groups produced by an earlier derive) stays JSON
+  const arrow = isFlatTable(rows);
+  const resp = await fetch(`${deriveServerUrl}/derive/${lambdaId}`, {
+    method: "POST",
+    headers: {
+      "Content-Type": arrow ? ARROW_STREAM : "application/json",
+      Accept: `${ARROW_STREAM}, application/json`,
+    },
+    body: arrow ? arrayToArrow(rows) : JSON.stringify(rows),
+  });
+
+  if (!resp.ok) {
+    throw new Error(`Derive server error: ${resp.status} ${await resp.text()}`);
+  }
+
+  // The server answers in JSON when the result is not a table
+  return resp.headers.get("Content-Type")?.startsWith(ARROW_STREAM)
+    ? arrowToArray(new Uint8Array(await resp.arrayBuffer()))
+    : await resp.json();
+}
+
+interface PendingDerive {
+  lambdaId: string;
+  rows: any[];
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+}
+
+/**
+ * Collects the derive calls made in the same tick (e.g. one per group after
+ * a spread) and sends them as a single /derive/batch request.
+ */
+class DeriveBatcher {
+  private pending: PendingDerive[] = [];
+  private scheduled = false;
+
+  constructor(private readonly url: string) {}
+
+  call(lambdaId: string, rows: any[]): Promise<any> {
+    return new Promise((resolve, reject) => {
+      this.pending.push({ lambdaId, rows, resolve, reject });
+      if (!this.scheduled) {
+        this.scheduled = true;
+        setTimeout(() => this.flush(), 0);
+      }
+    });
+  }
+
+  private async flush(): Promise<void> {
+    const batch = this.pending;
+    this.pending = [];
+    this.scheduled = false;
+
+    if (batch.length === 1) {
+      const [only] = batch;
+      deriveOne(this.url, only.lambdaId, only.rows).then(
+        only.resolve,
+        only.reject
+      );
+      return;
+    }
+
+    try {
+      const requests = batch.map((call, id) =>
+        isFlatTable(call.rows)
+          ? {
+              id,
+              lambdaId: call.lambdaId,
+              arrowB64: bytesToB64(arrayToArrow(call.rows)),
+            }
+          : { id, lambdaId: call.lambdaId, data: call.rows }
+      );
+      const resp = await fetch(`${this.url}/derive/batch`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ requests }),
+      });
+      if (!resp.ok) {
+        throw new Error(
+          `Derive server error: ${resp.status} ${await resp.text()}`
+        );
+      }
+      const { results } = await resp.json();
+      for (const entry of results) {
+        const call = batch[entry.id];
+        if (entry.error !== undefined) {
+          call.reject(new Error(`Derive server error: ${entry.error}`));
+        } else if (entry.resultB64 !== undefined) {
+          call.resolve(arrowToArray(b64ToBytes(entry.resultB64)));
+        } else {
+          call.resolve(entry.result);
+        }
+      }
+    } catch (err) {
+      const error = err instanceof Error ? err : new Error(String(err));
+      batch.forEach((call) => call.reject(error));
+    }
+  }
+}
+
+const batchers = new Map<string, DeriveBatcher>();
+
+function remoteDerive(
+  lambdaId: string | undefined,
+  deriveServerUrl?: string
+): Operator<any, any> {
+  if (!lambdaId) throw new Error("derive operator missing lambdaId");
+  if (!deriveServerUrl)
+    throw new Error("derive operator requires deriveServerUrl");
+
+  const batcher =
+    batchers.get(deriveServerUrl) ?? new DeriveBatcher(deriveServerUrl);
+  batchers.set(deriveServerUrl, batcher);
+
+  return derive(async (d: any) => {
+    const rows = Array.isArray(d) ? d : d == null ? [] : [d];
+    if (rows.length === 0) return Array.isArray(d) ? d : (d ?? null);
+
+    const result = await batcher.call(lambdaId, rows);
+    return Array.isArray(d) ? result : (result[0] ?? null);
+  });
+}
+
 function mapOperator(
   op: OperatorSpec,
   deriveServerUrl?: string
@@ -68,32 +232,52 @@ function mapOperator(
   const { type, ...opts } = op;
 
   switch (type) {
-    case "derive": {
-      const lambdaId = opts.lambdaId;
-      if (!lambdaId) throw new Error("derive operator missing lambdaId");
-      if (!deriveServerUrl)
-        throw new Error("derive operator requires deriveServerUrl");
-
-      return derive(async (d: any) => {
+    case "derive":
+      return remoteDerive(opts.lambdaId, deriveServerUrl);
+    case "calculate": {
+      const { name, expr } = opts;
+      return derive((d: any) => {
         const rows = Array.isArray(d) ? d : d == null ? [] : [d];
-        if (rows.length === 0) return Array.isArray(d) ? d : (d ?? null);
-
-        const resp = await fetch(`${deriveServerUrl}/derive/${lambdaId}`, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify(rows),
-        });
-
-        if (!resp.ok) {
-          throw new Error(
-            `Derive server error: ${resp.status} ${await resp.text()}`
-          );
-        }
-
-        const result = await resp.json();
+        const result = applyCalculate(rows, name, expr);
+        return Array.isArray(d) ? result : (result[0] ?? null);
+      });
+    }
+    case "filter": {
+      const { expr } = opts;
+      return derive((d: any) => {
+        const rows = Array.isArray(d) ? d : d == null ? [] : [d];
+        const result = applyFilter(rows, expr);
         return Array.isArray(d) ? result : (result[0] ?? null);
       });
     }
+    case "sort": {
+      const { by, order } = opts;
+      return derive((d: any) =>
+        Array.isArray(d) ? applySort(d, by, order || []) : d
+      );
+    }
+    case "lookup": {
+      const { on, fields, arrowB64 } = opts;
+      const [left, right] = on;
+      // Index the shipped lookup table once, like the widget
+      const index = buildLookupIndex(
+        arrowToArray(b64ToBytes(arrowB64)),
+        right,
+        fields
+      );
+      const defaultValue = opts.default ?? null;
+      return derive((d: any) => {
+        const rows = Array.isArray(d) ? d : d == null ? [] : [d];
+        const result = applyLookup(rows, left, index, defaultValue);
+        return Array.isArray(d) ? result : (result[0] ?? null);
+      });
+    }
+    case "repeat": {
+      const { field } = opts;
+      return derive((d: any) =>
+        applyRepeat(Array.isArray(d) ? d : d == null ? [] : [d], field)
+      );
+    }
     case "spread": {
       const { field, ...rest } = opts;
       return field ? spread(field, rest) : spread(rest);
@@ -109,6 +293,10 @@ function mapOperator(
       return scatter(field, { x, y, ...rest });
     }
     default:
+      // Transpiled derives keep their lambdaId: run them on the derive server
+      if (opts.lambdaId && deriveServerUrl) {
+        return remoteDerive(opts.lambdaId, deriveServerUrl);
+      }
       console.warn(`Unknown operator type: ${type}`);
       return null;
   }
@@ -150,7 +338,12 @@ function renderChart(spec: HarnessSpec) {
 
     const mark = mapMark(spec.mark);
 
-    const builder = Chart(spec.data, spec.options || {});
+    // Decode like the widget, so Python stories render from the same rows
+    const data =
+      spec.arrowB64 !== undefined
+        ? arrowToArray(b64ToBytes(spec.arrowB64))
+        : (spec.data ?? []);
+    const builder = Chart(data, spec.options || {});
     const node = builder.flow(...operators).mark(mark);
 
     const { w, h, axes, debug, ...restOpts } = spec.options || {};
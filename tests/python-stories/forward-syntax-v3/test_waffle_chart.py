@@ -9,7 +9,7 @@ def story_default():
         chart(SEAFOOD)
         .flow(
             spread("lake", spacing=8, dir="x"),
-            derive(lambda d: [item for row in d for item in repeat(row, "count")]),
+            repeat("count"),
             derive(lambda d: [d[i : i + 5] for i in range(0, len(d), 5)]),
             spread({"spacing": 2, "dir": "y"}),
             spread({"spacing": 2, "dir": "x"}),
@@ -1,23 +1,42 @@
 /**
  * Capture DOM snapshots from Python story files.
  *
- * 1. Start the Python derive server
- * 2. Start the Vite harness server
- * 3. Discover Python story files (story_* functions)
- * 4. For each story: extract IR, inject into harness, capture DOM + screenshot
+ * 1. Start the Vite harness server
+ * 2. Discover Python story files (story_* functions)
+ * 3. Start N capture workers, each with its own Python derive server (on a
+ *    port of its own) and Playwright browser context
+ * 4. Workers take stories from a shared queue: get IR from their derive
+ *    server (which also registers the story's derives), inject into harness,
+ *    capture DOM + screenshot
  * 5. Normalize DOM, write to tmp/python/<path>.html and tmp/python/<path>.png
+ *
+ * Capture is incremental: each story's fingerprint (IR, data, story source
+ * and the renderer: gofish, the widget bundle and sources, gofish-graphics
+ * and the harness) is stored in tmp/python/.fingerprints.json, and stories
+ * whose fingerprint and outputs are unchanged keep their DOM and PNG from the
+ * last run instead of being rendered again.
+ *
+ * Each worker's derive server metrics are saved to
+ * tmp/derive-metrics/worker-<N>.prom at the end of the run.
+ *
+ * Usage: tsx scripts/capture-python-dom.ts [--workers N] [--force]
+ * (or PYTHON_CAPTURE_WORKERS=N; defaults to the CPU count, up to 4;
+ * --force or PYTHON_CAPTURE_FORCE=1 re-captures every story)
  */
 
 import { chromium, type Browser, type Page } from "playwright";
-import { spawn, execSync, type ChildProcess } from "child_process";
+import { createHash } from "crypto";
+import { spawn, type ChildProcess } from "child_process";
 import {
   readFileSync,
   writeFileSync,
   mkdirSync,
   readdirSync,
   existsSync,
+  statSync,
 } from "fs";
 import { join, dirname, relative } from "path";
+import { availableParallelism } from "os";
 import { normalizeDom } from "./normalize-dom.js";
 
 // ---------------------------------------------------------------------------
@@ -29,8 +48,33 @@ const TESTS_DIR = join(import.meta.dirname, "..");
 const HARNESS_DIR = join(TESTS_DIR, "harness");
 const PYTHON_STORIES_DIR = join(TESTS_DIR, "python-stories");
 const TMP_DIR = join(TESTS_DIR, "tmp/python");
-const DERIVE_SERVER_PORT = 3002;
 const HARNESS_PORT = 3001;
+const FINGERPRINTS_PATH = join(TMP_DIR, ".fingerprints.json");
+const METRICS_DIR = join(TESTS_DIR, "tmp/derive-metrics");
+const FORCE =
+  process.argv.includes("--force") || process.env.PYTHON_CAPTURE_FORCE === "1";
+
+// Everything that renders a story besides the story itself
+const RENDERER_SOURCES = [
+  join(ROOT, "packages/gofish-python/gofish"),
+  join(ROOT, "packages/gofish-python/widget-src"),
+  join(ROOT, "packages/gofish-graphics/src"),
+  HARNESS_DIR,
+  join(TESTS_DIR, "scripts/capture-python-dom.ts"),
+  join(TESTS_DIR, "scripts/derive-server.py"),
+  join(TESTS_DIR, "scripts/normalize-dom.ts"),
+];
+
+function workerCount(): number {
+  const flag = process.argv.indexOf("--workers");
+  const raw =
+    flag >= 0 ? process.argv[flag + 1] : process.env.PYTHON_CAPTURE_WORKERS;
+  const n = raw ? parseInt(raw, 10) : Math.min(4, availableParallelism());
+  if (!Number.isFinite(n) || n < 1) {
+    throw new Error(`Invalid worker count: ${raw}`);
+  }
+  return n;
+}
 
 // ---------------------------------------------------------------------------
 // Discover Python story files
@@ -94,77 +138,37 @@ function discoverPythonStories(): PythonStory[] {
 }
 
 // ---------------------------------------------------------------------------
-// Extract IR from Python story (by calling Python)
+// Extract IR from Python story (via the derive server)
 // ---------------------------------------------------------------------------
 
-function extractIR(
-  story: PythonStory
-): { spec: any; data: any; options: any; deriveIds: string[] } | null {
-  const storyAbsPath = join(TESTS_DIR, story.file);
-  const script = `
-import sys, json, importlib.util
-sys.path.insert(0, "${join(ROOT, "packages/gofish-python")}")
-sys.path.insert(0, "${TESTS_DIR}")
-
-# Register "python_stories" as a package so story imports (e.g. from python_stories.data) work
-_pkg_dir = "${PYTHON_STORIES_DIR}"
-_pkg_init = "${PYTHON_STORIES_DIR}/__init__.py"
-_pkg_spec = importlib.util.spec_from_file_location(
-    "python_stories", _pkg_init,
-    submodule_search_locations=[_pkg_dir]
-)
-_pkg_mod = importlib.util.module_from_spec(_pkg_spec)
-sys.modules["python_stories"] = _pkg_mod
-_pkg_spec.loader.exec_module(_pkg_mod)
-
-spec = importlib.util.spec_from_file_location("story_module", "${storyAbsPath}")
-mod = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(mod)
-fn = getattr(mod, "${story.function}")
-
-result = fn()
-if not isinstance(result, tuple):
-    print(json.dumps({"error": "story function must return a tuple"}))
-    sys.exit(1)
-
-builder = result[0]
-options = result[1] if len(result) > 1 else {}
-
-from gofish.ast import DeriveOperator
-
-ir = builder.to_ir()
-data = builder.data
-
-# Collect derive lambda IDs
-derive_ids = []
-for op in builder.operators:
-    if isinstance(op, DeriveOperator):
-        derive_ids.append(op.lambda_id)
-
-# Serialize data
-if hasattr(data, 'to_dict'):
-    data = data.to_dict('records')
-elif hasattr(data, 'to_dicts'):
-    data = data.to_dicts()
-
-output = {
-    "operators": ir["operators"],
-    "mark": ir["mark"],
-    "options": {**ir.get("options", {}), **options},
-    "data": data,
-    "deriveIds": derive_ids,
+interface StoryIR {
+  operators: any[];
+  mark: any;
+  options: any;
+  // The widget's Arrow IPC data, base64
+  arrowB64: string;
+  deriveIds: string[];
 }
-print(json.dumps(output))
-`;
 
+/**
+ * Asks the derive server to run a story function. The server returns the IR
+ * and Arrow data a notebook widget would receive and registers its derives
+ * in the same process, so gofish and the story modules are imported once per
+ * run instead of once per story.
+ */
+async function extractIR(
+  deriveServerUrl: string,
+  story: PythonStory
+): Promise<StoryIR | null> {
   try {
-    const result = execSync(`python3 -`, {
-      cwd: ROOT,
-      encoding: "utf-8",
-      input: script,
-      timeout: 30_000,
+    const resp = await fetch(`${deriveServerUrl}/story`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ file: story.file, function: story.function }),
     });
-    return JSON.parse(result.trim());
+    const body = await resp.json();
+    if (!resp.ok) throw new Error(body.error ?? `HTTP ${resp.status}`);
+    return body;
   } catch (err) {
     console.error(
       `  Failed to extract IR: ${err instanceof Error ? err.message : err}`
@@ -173,25 +177,117 @@ print(json.dumps(output))
   }
 }
 
+// ---------------------------------------------------------------------------
+// Incremental capture: story fingerprints
+// ---------------------------------------------------------------------------
+
+function sha256(data: string | Buffer): string {
+  return createHash("sha256").update(data).digest("hex");
+}
+
+/** Adds every file under `path` to `hash`, in a stable order. */
+function hashTree(hash: ReturnType<typeof createHash>, path: string): void {
+  if (!existsSync(path)) return;
+  if (!statSync(path).isDirectory()) {
+    hash.update(relative(ROOT, path)).update(readFileSync(path));
+    return;
+  }
+  const entries = readdirSync(path, { withFileTypes: true })
+    .filter((e) => !["node_modules", "dist", "__pycache__"].includes(e.name))
+    .map((e) => e.name)
+    .sort();
+  for (const name of entries) hashTree(hash, join(path, name));
+}
+
+/** Hash of the renderer: gofish, the widget bundle and sources, the harness. */
+function rendererHash(): string {
+  const hash = createHash("sha256");
+  for (const path of RENDERER_SOURCES) hashTree(hash, path);
+  return hash.digest("hex");
+}
+
+/**
+ * Fingerprint of one story's render: its IR (without the random lambda
+ * IDs), data payload, story source and the renderer hash.
+ */
+function storyFingerprint(
+  story: PythonStory,
+  ir: StoryIR,
+  renderer: string
+): string {
+  const spec = JSON.stringify(
+    { operators: ir.operators, mark: ir.mark, options: ir.options },
+    (key, value) => (key === "lambdaId" ? undefined : value)
+  );
+  return sha256(
+    [
+      spec,
+      sha256(ir.arrowB64),
+      sha256(readFileSync(join(TESTS_DIR, story.file))),
+      renderer,
+    ].join("\n")
+  );
+}
+
+function loadFingerprints(): Record<string, string> {
+  if (FORCE || !existsSync(FINGERPRINTS_PATH)) return {};
+  try {
+    return JSON.parse(readFileSync(FINGERPRINTS_PATH, "utf-8"));
+  } catch {
+    return {};
+  }
+}
+
+/** Whether the last run's outputs for a story can be reused. */
+function isCached(
+  story: PythonStory,
+  fingerprint: string,
+  previous: Record<string, string>
+): boolean {
+  return (
+    previous[story.path] === fingerprint &&
+    existsSync(join(TMP_DIR, `${story.path}.html`)) &&
+    existsSync(join(TMP_DIR, `${story.path}.png`))
+  );
+}
+
 // ---------------------------------------------------------------------------
 // Start derive server
 // ---------------------------------------------------------------------------
 
-function startDeriveServer(): ChildProcess {
+interface DeriveServer {
+  proc: ChildProcess;
+  url: string;
+}
+
+/**
+ * Starts a derive server on a free port (port 0) and resolves with its URL
+ * once it prints its listening line. Every worker gets its own server, so a
+ * stale server left on a fixed port can never answer for this run.
+ */
+function startDeriveServer(worker: number): Promise<DeriveServer> {
   const proc = spawn(
     "python3",
-    [join(TESTS_DIR, "scripts/derive-server.py"), String(DERIVE_SERVER_PORT)],
+    [join(TESTS_DIR, "scripts/derive-server.py"), "0"],
     { cwd: ROOT, stdio: ["ignore", "pipe", "pipe"] }
   );
 
-  proc.stdout?.on("data", (d) => {
-    if (process.env.DEBUG) process.stdout.write(d);
-  });
   proc.stderr?.on("data", (d) => {
-    if (process.env.DEBUG) process.stderr.write(d);
+    if (process.env.DEBUG) process.stderr.write(`[derive ${worker}] ${d}`);
   });
 
-  return proc;
+  return new Promise((resolve, reject) => {
+    let output = "";
+    proc.stdout?.on("data", (d) => {
+      if (process.env.DEBUG) process.stdout.write(`[derive ${worker}] ${d}`);
+      output += d;
+      const m = output.match(/listening on (http:\/\/\S+)/);
+      if (m) resolve({ proc, url: m[1] });
+    });
+    proc.on("exit", (code) =>
+      reject(new Error(`Derive server ${worker} exited with code ${code}`))
+    );
+  });
 }
 
 async function waitForServer(url: string, timeoutMs = 10_000) {
@@ -210,56 +306,6 @@ async function waitForServer(url: string, timeoutMs = 10_000) {
   );
 }
 
-// ---------------------------------------------------------------------------
-// Register derive functions for a story
-// ---------------------------------------------------------------------------
-
-function registerDerives(story: PythonStory): void {
-  const storyAbsPath = join(TESTS_DIR, story.file);
-  const script = `
-import sys, importlib.util
-sys.path.insert(0, "${join(ROOT, "packages/gofish-python")}")
-sys.path.insert(0, "${TESTS_DIR}")
-
-# Register "python_stories" as a package so story imports (e.g. from python_stories.data) work
-_pkg_dir = "${PYTHON_STORIES_DIR}"
-_pkg_init = "${PYTHON_STORIES_DIR}/__init__.py"
-_pkg_spec = importlib.util.spec_from_file_location(
-    "python_stories", _pkg_init,
-    submodule_search_locations=[_pkg_dir]
-)
-_pkg_mod = importlib.util.module_from_spec(_pkg_spec)
-sys.modules["python_stories"] = _pkg_mod
-_pkg_spec.loader.exec_module(_pkg_mod)
-
-from gofish.ast import DeriveOperator
-
-spec = importlib.util.spec_from_file_location("story_module", "${storyAbsPath}")
-mod = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(mod)
-fn = getattr(mod, "${story.function}")
-result = fn()
-builder = result[0]
-
-for op in builder.operators:
-    if isinstance(op, DeriveOperator):
-        pass
-
-print("OK")
-`;
-
-  try {
-    execSync(`python3 -`, {
-      cwd: ROOT,
-      encoding: "utf-8",
-      input: script,
-      timeout: 10_000,
-    });
-  } catch {
-    // Non-fatal — story may not have derives
-  }
-}
-
 // ---------------------------------------------------------------------------
 // Start Vite harness server
 // ---------------------------------------------------------------------------
@@ -298,21 +344,19 @@ function startHarnessServer(): ChildProcess {
 async function captureStory(
   page: Page,
   harnessUrl: string,
-  story: PythonStory,
-  ir: any
+  deriveServerUrl: string,
+  ir: StoryIR
 ): Promise<{ dom: string; screenshot: Buffer }> {
   await page.goto(harnessUrl, { waitUntil: "networkidle" });
 
   // Inject spec and trigger render
   const spec = {
-    data: ir.data,
+    arrowB64: ir.arrowB64,
     operators: ir.operators,
     mark: ir.mark,
     options: ir.options,
     deriveServerUrl:
-      ir.deriveIds && ir.deriveIds.length > 0
-        ? `http://localhost:${DERIVE_SERVER_PORT}`
-        : undefined,
+      ir.deriveIds && ir.deriveIds.length > 0 ? deriveServerUrl : undefined,
   };
 
   await page.evaluate((s) => {
@@ -358,54 +402,56 @@ async function captureStory(
 // Main
 // ---------------------------------------------------------------------------
 
-async function main() {
-  console.log("=== Capturing Python DOM snapshots ===\n");
-
-  const stories = discoverPythonStories();
-  if (stories.length === 0) {
-    console.log("No Python stories found. Skipping.");
-    return;
-  }
-  console.log(`Found ${stories.length} Python stories\n`);
-
-  // Start servers
-  const deriveProc = startDeriveServer();
-  const harnessProc = startHarnessServer();
+interface CaptureCounts {
+  captured: number;
+  cached: number;
+  failed: number;
+}
 
-  let browser: Browser | undefined;
+interface CaptureState {
+  queue: PythonStory[];
+  counts: CaptureCounts;
+  renderer: string;
+  // Fingerprints from the last run, and those of this run's good outputs
+  previous: Record<string, string>;
+  fingerprints: Record<string, string>;
+}
 
+/**
+ * One capture worker: takes stories from the shared queue until it is empty,
+ * using its own derive server and browser context.
+ */
+async function runWorker(
+  worker: number,
+  browser: Browser,
+  state: CaptureState
+): Promise<void> {
+  const { queue, counts } = state;
+  const server = await startDeriveServer(worker);
+  const context = await browser.newContext({
+    viewport: { width: 1280, height: 720 },
+  });
   try {
-    // Wait for servers to be ready
-    await waitForServer(`http://localhost:${DERIVE_SERVER_PORT}/health`);
-    console.log("Derive server ready");
-    await waitForServer(`http://localhost:${HARNESS_PORT}`);
-    console.log("Harness server ready\n");
-
-    browser = await chromium.launch({ headless: true });
-    const context = await browser.newContext({
-      viewport: { width: 1280, height: 720 },
-    });
+    await waitForServer(`${server.url}/health`);
     const page = await context.newPage();
 
-    mkdirSync(TMP_DIR, { recursive: true });
-
-    let captured = 0;
-    let failed = 0;
-
-    for (const story of stories) {
-      process.stdout.write(
-        `  ${story.module}::${story.function} → ${story.path} ... `
-      );
+    let story: PythonStory | undefined;
+    while ((story = queue.shift()) !== undefined) {
+      const label =
+        `  [${worker}] ${story.module}::${story.function} → ${story.path}`;
 
-      // Register derives for this story with the derive server
-      if (story.file) {
-        registerDerives(story);
+      const ir = await extractIR(server.url, story);
+      if (!ir) {
+        console.log(`${label} ... SKIP (no IR)`);
+        counts.failed++;
+        continue;
       }
 
-      const ir = extractIR(story);
-      if (!ir) {
-        console.log("SKIP (no IR)");
-        failed++;
+      const fingerprint = storyFingerprint(story, ir, state.renderer);
+      if (isCached(story, fingerprint, state.previous)) {
+        console.log(`${label} ... CACHED`);
+        state.fingerprints[story.path] = fingerprint;
+        counts.cached++;
         continue;
       }
 
@@ -413,11 +459,12 @@ async function main() {
         const { dom, screenshot } = await captureStory(
           page,
           `http://localhost:${HARNESS_PORT}`,
-          story,
+          server.url,
           ir
         );
         const normalized = normalizeDom(dom);
 
+        // Story paths are unique, so workers write straight into TMP_DIR
         const domPath = join(TMP_DIR, `${story.path}.html`);
         mkdirSync(dirname(domPath), { recursive: true });
         writeFileSync(domPath, normalized, "utf-8");
@@ -425,20 +472,88 @@ async function main() {
         const screenshotPath = join(TMP_DIR, `${story.path}.png`);
         writeFileSync(screenshotPath, screenshot);
 
-        console.log("OK");
-        captured++;
+        console.log(`${label} ... OK`);
+        state.fingerprints[story.path] = fingerprint;
+        counts.captured++;
       } catch (err) {
-        console.log(`FAILED: ${err instanceof Error ? err.message : err}`);
-        failed++;
+        console.log(
+          `${label} ... FAILED: ${err instanceof Error ? err.message : err}`
+        );
+        counts.failed++;
       }
     }
+  } finally {
+    await dumpMetrics(worker, server.url);
+    await context.close();
+    server.proc.kill();
+  }
+}
 
-    console.log(`\nDone: ${captured} captured, ${failed} failed`);
+/** Saves a worker's derive server metrics (Prometheus text) for this run. */
+async function dumpMetrics(worker: number, deriveServerUrl: string) {
+  try {
+    const resp = await fetch(`${deriveServerUrl}/metrics`);
+    if (!resp.ok) return;
+    mkdirSync(METRICS_DIR, { recursive: true });
+    writeFileSync(
+      join(METRICS_DIR, `worker-${worker}.prom`),
+      await resp.text(),
+      "utf-8"
+    );
+  } catch {
+    // The server may have died; metrics are best-effort
+  }
+}
 
-    await context.close();
+async function main() {
+  console.log("=== Capturing Python DOM snapshots ===\n");
+
+  const stories = discoverPythonStories();
+  if (stories.length === 0) {
+    console.log("No Python stories found. Skipping.");
+    return;
+  }
+  const workers = Math.min(workerCount(), stories.length);
+  console.log(
+    `Found ${stories.length} Python stories, capturing with ${workers} worker(s)\n`
+  );
+
+  const harnessProc = startHarnessServer();
+
+  let browser: Browser | undefined;
+
+  try {
+    await waitForServer(`http://localhost:${HARNESS_PORT}`);
+    console.log("Harness server ready\n");
+
+    browser = await chromium.launch({ headless: true });
+    mkdirSync(TMP_DIR, { recursive: true });
+
+    const state: CaptureState = {
+      queue: [...stories],
+      counts: { captured: 0, cached: 0, failed: 0 },
+      renderer: rendererHash(),
+      previous: loadFingerprints(),
+      fingerprints: {},
+    };
+    const b = browser;
+    await Promise.all(
+      Array.from({ length: workers }, (_, i) => runWorker(i, b, state))
+    );
+    // Failed and removed stories drop out, so they are captured next time
+    writeFileSync(
+      FINGERPRINTS_PATH,
+      JSON.stringify(state.fingerprints, null, 2),
+      "utf-8"
+    );
+
+    const { captured, cached, failed } = state.counts;
+    console.log(
+      `\nDone: ${captured} captured, ${cached} cached, ${failed} failed`
+    );
+    console.log(`Derive server metrics: ${relative(ROOT, METRICS_DIR)}/`);
   } finally {
     await browser?.close();
-    deriveProc.kill();
     harnessProc.kill();
   }
 }
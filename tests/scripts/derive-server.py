@@ -2,36 +2,564 @@
 Python derive server — executes Python derive functions during test rendering.
 
 Endpoints:
+  POST /story          — Run a story: return its widget IR and data, register its derives
   POST /register       — Load a story module and register its derive functions
-  POST /derive/<id>    — Execute a registered derive function on JSON data
+  POST /derive/<id>    — Execute a registered derive function on JSON or Arrow data
+  POST /derive/batch   — Execute many (lambdaId, data) entries in one request
   POST /reset          — Clear all registered functions
+  GET  /manifest       — List story files and story_* functions without running them
+  GET  /metrics        — Per-lambda and per-module metrics (Prometheus text format)
   GET  /health         — Health check
 
-The capture-python-dom.ts script starts this server, registers story modules,
-then the test harness calls /derive/<id> during chart rendering.
+The capture-python-dom.ts script starts this server and asks /story for each
+story's IR, which also registers the story's derives in this process (lambda
+IDs are generated when the story runs, so they only exist here). /story
+builds its reply through the widget's render path (``_prepare_render``):
+leading eager operators are applied to the data and dropped from the IR, and
+the data is the same Arrow payload a notebook widget receives. The test
+harness then calls /derive/<id> during chart rendering. gofish, pandas and
+the story modules are imported once for the whole run.
+
+Story files (and the shared python_stories modules) are re-imported when
+their mtime changes, so edited stories are picked up without a restart; the
+derives a story registered are swapped for the new ones in one step.
+
+Derive bodies are JSON, or Arrow IPC streams
+(``application/vnd.apache.arrow.stream``) like the widget exchanges with the
+kernel. The request's Content-Type says what was sent; the reply is Arrow when
+the Accept header asks for it (or, without an Accept header, when the request
+was Arrow) and the result is a table. Other results, such as nested lists of
+groups, fall back to JSON.
+
+A batch body is ``{"requests": [{"id", "lambdaId", "data" | "arrowB64"}]}``;
+entries run in parallel (one at a time per lambda, as below) and the reply is
+``{"results": [...]}`` in request order, each with the entry's ``id`` and
+either ``result`` (JSON), ``resultB64`` (Arrow, for Arrow entries with a
+tabular result) or ``error``. One failing entry does not fail the batch.
+
+Results are cached on disk (see derive_cache.py), keyed by the function (its
+bytecode, the source of the modules it reaches and the content of the values
+it reads), the renderer and the input data; responses say whether they
+came from the cache with ``X-Cache: hit`` / ``miss`` (``"cache"`` in batch
+results). Pass ``--no-cache`` to disable it.
+
+With ``--workers N`` derives of stories loaded through /story run in N
+pre-forked worker processes instead of under the server's GIL (see "Worker
+processes" below).
+
+Each connection is served on its own thread with HTTP/1.1 keep-alive, so
+parallel browser pages reuse their connections and derives for different
+lambdas run concurrently. Calls to the same lambda are serialized, since
+story derive functions are not written to be thread-safe.
 """
 
+import argparse
+import ast
+import base64
+import hashlib
 import importlib
+import importlib.util
 import json
 import sys
 import os
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse
 
 # Add project root to path so we can import gofish
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 sys.path.insert(0, os.path.join(PROJECT_ROOT, "packages/gofish-python"))
 sys.path.insert(0, os.path.join(PROJECT_ROOT, "tests"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.join(PROJECT_ROOT, "tests")
+PYTHON_STORIES_DIR = os.path.join(TESTS_DIR, "python-stories")
+DEFAULT_CACHE_DIR = os.path.join(TESTS_DIR, "tmp/derive-cache")
+
+from derive_cache import DeriveCache, code_hash  # noqa: E402
+from derive_metrics import DeriveMetrics  # noqa: E402
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+JSON = "application/json"
 
 # Registry: lambdaId → Python function
 _registry: dict = {}
+# Guards _registry and _lambda_locks; held only to look up or swap entries
+_registry_lock = threading.Lock()
+# lambdaId → lock serializing calls to that function
+_lambda_locks: dict = {}
+# lambdaId → (story file, story function, derive index, derive count, code
+# hash of the function), for worker processes
+_origins: dict = {}
+# Result cache; None when disabled
+_cache = None
+_metrics = DeriveMetrics()
+# Runs the entries of /derive/batch requests
+_batch_pool = ThreadPoolExecutor(
+    max_workers=min(32, (os.cpu_count() or 1) + 4),
+    thread_name_prefix="derive-batch",
+)
+
+
+def _lookup(lambda_id: str):
+    """Return (fn, lock) for a registered lambda, or (None, None)."""
+    with _registry_lock:
+        fn = _registry.get(lambda_id)
+        if fn is None:
+            return None, None
+        lock = _lambda_locks.setdefault(lambda_id, threading.Lock())
+        return fn, lock
+
+
+def _media_type(header) -> str:
+    return (header or "").split(";")[0].strip().lower()
+
+
+def _decode_body(body: bytes, content_type: str):
+    """Decode a derive request body into the data passed to the function."""
+    if _media_type(content_type) == ARROW_STREAM:
+        from gofish.arrow_utils import arrow_to_dataframe
+
+        # Same conversion as the widget: Arrow → row dicts
+        return arrow_to_dataframe(body).to_dict("records")
+    return json.loads(body)
+
+
+def _wants_arrow(accept, content_type) -> bool:
+    """Whether the client asked for (or, by default, sent) Arrow."""
+    if accept:
+        return ARROW_STREAM in accept.lower()
+    return _media_type(content_type) == ARROW_STREAM
+
+
+def _encode_arrow(result):
+    """Arrow IPC bytes of a tabular result, or None if it is not tabular."""
+    import pandas as pd
+    import pyarrow as pa
+    from gofish.arrow_utils import dataframe_to_arrow, table_to_arrow
+
+    if isinstance(result, pa.Table):
+        return table_to_arrow(result)
+    if hasattr(result, "to_arrow"):
+        # Polars DataFrame
+        return table_to_arrow(result.to_arrow())
+    if isinstance(result, pd.DataFrame):
+        return dataframe_to_arrow(result)
+    if isinstance(result, list) and all(isinstance(r, dict) for r in result):
+        return dataframe_to_arrow(pd.DataFrame(result))
+    return None
+
+
+def _call(fn, lock, data):
+    """Run a derive function through the result cache.
+
+    Returns:
+        (result, cache status: "hit", "miss", "bypass" or None if disabled)
+    """
+    with lock:
+        if _cache is None:
+            return fn(data), None
+        return _cache.call(fn, data)
+
+
+def _json_value(result):
+    """Make a derive result JSON-serializable."""
+    if hasattr(result, "to_dicts"):
+        # Polars DataFrame
+        return result.to_dicts()
+    if hasattr(result, "to_dict"):
+        # Pandas DataFrame
+        return result.to_dict("records")
+    return result
+
+
+def _run_encoded(fn, lock, body: bytes, content_type, want_arrow: bool):
+    """
+    Decode, run (through the cache) and encode one derive call.
+
+    Returns:
+        (response content type, response body, cache status)
+    """
+    data = _decode_body(body, content_type)
+    result, cache = _call(fn, lock, data)
+    if want_arrow:
+        arrow = _encode_arrow(result)
+        if arrow is not None:
+            return ARROW_STREAM, arrow, cache
+    return JSON, json.dumps(_json_value(result)).encode(), cache
+
+
+def _dispatch(lambda_id: str, fn, lock, body: bytes, content_type, want_arrow):
+    """Run a derive call on the worker pool if there is one, else here."""
+    with _registry_lock:
+        origin = _origins.get(lambda_id)
+    start = time.perf_counter()
+    out_body, cache, error = b"", None, True
+    try:
+        if _pool is not None and origin is not None:
+            future = _pool.submit(
+                _worker_run, origin, body, content_type, want_arrow
+            )
+            _pool_futures.add(future)
+            future.add_done_callback(_pool_futures.discard)
+            out = future.result()
+        else:
+            out = _run_encoded(fn, lock, body, content_type, want_arrow)
+        out_body, cache, error = out[1], out[2], False
+        return out
+    finally:
+        _metrics.observe(
+            *_metric_labels(lambda_id, origin),
+            seconds=time.perf_counter() - start,
+            bytes_in=len(body),
+            bytes_out=len(out_body),
+            error=error,
+            cache=cache,
+        )
+
+
+def _metric_labels(lambda_id: str, origin):
+    """(module, lambda) labels; stable across runs for story derives."""
+    if origin is None:
+        return lambda_id, lambda_id
+    path, function, index = origin[:3]
+    module = os.path.relpath(path, TESTS_DIR)
+    return module, f"{module}::{function}#{index}"
+
+
+def _observe_unknown(lambda_id: str):
+    """Count a call to an unregistered lambda as a failed call."""
+    _metrics.observe(
+        *_metric_labels(lambda_id, None),
+        seconds=0.0,
+        bytes_in=0,
+        bytes_out=0,
+        error=True,
+        cache=None,
+    )
+
+
+def _run_batch_entry(entry: dict) -> dict:
+    """Run one /derive/batch entry; failures become an error result."""
+    lambda_id = entry.get("lambdaId")
+    out = {"id": entry.get("id"), "lambdaId": lambda_id}
+    fn, lock = _lookup(lambda_id)
+    if fn is None:
+        _observe_unknown(str(lambda_id))
+        out["error"] = f"Unknown lambda_id: {lambda_id}"
+        return out
+    try:
+        if "arrowB64" in entry:
+            body, content_type = base64.b64decode(entry["arrowB64"]), ARROW_STREAM
+        else:
+            body, content_type = json.dumps(entry.get("data")).encode(), JSON
+        out_type, out_body, cache = _dispatch(
+            lambda_id, fn, lock, body, content_type, content_type == ARROW_STREAM
+        )
+        if cache is not None:
+            out["cache"] = cache
+        if out_type == ARROW_STREAM:
+            out["resultB64"] = base64.b64encode(out_body).decode("ascii")
+        else:
+            out["result"] = json.loads(out_body)
+    except Exception as e:
+        out["error"] = str(e)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Worker processes (--workers N)
+# ---------------------------------------------------------------------------
+#
+# Story derives are pure Python and hold the GIL, so with --workers N the
+# server forks N processes up front and runs derive calls there. Lambdas are
+# closures created when a story runs and cannot be sent to another process;
+# instead each registered lambda keeps its origin (story file, story
+# function, index among its derives), and a worker loads that story module
+# itself (re-importing it when it changes on disk) to find the same function.
+# The origin also records how many derives the story had and the bytecode
+# hash of this one, so a worker whose copy of the story differs from the one
+# registered (edited in between) fails the call instead of running another
+# derive. Each worker opens its own DeriveCache after the fork: the parent's
+# size counter and lock must not be shared.
+# Requests and results cross the process boundary as encoded bodies (Arrow
+# IPC or JSON), never as pickled Python rows.
+
+# Pool of worker processes; None runs derives in the server process
+_pool = None
+# Calls submitted to the pool and not finished, cancelled on shutdown
+_pool_futures: set = set()
+# In a worker: (story file, story function) → (module, derive functions)
+_worker_derives: dict = {}
+_worker_lock = threading.Lock()
+
+
+def _worker_function(origin):
+    """The function an origin names, as the worker's copy of the story builds it."""
+    path, function, index, count, digest = origin
+    module = _load_story_file(path)
+    cached = _worker_derives.get((path, function))
+    if cached is None or cached[0] is not module:
+        builder = getattr(module, function)()[0]
+        cached = (module, list(_derive_functions(builder).values()))
+        _worker_derives[(path, function)] = cached
+    functions = cached[1]
+    if len(functions) != count or code_hash(functions[index]) != digest:
+        raise RuntimeError(
+            f"{os.path.relpath(path, TESTS_DIR)}::{function} changed since its "
+            "derives were registered; request /story again"
+        )
+    return functions[index]
+
+
+def _worker_run(origin, body: bytes, content_type, want_arrow: bool):
+    """Entry point of a derive call in a worker process."""
+    fn = _worker_function(origin)
+    return _run_encoded(fn, _worker_lock, body, content_type, want_arrow)
+
+
+def _init_worker():
+    """Give a forked worker its own handle on the shared cache directory."""
+    global _cache
+    if _cache is not None:
+        _cache = DeriveCache(_cache.directory, _cache.max_bytes, _cache.renderer)
+
+
+def _worker_pid(_) -> int:
+    """Warm-up task; returns the worker's pid."""
+    return os.getpid()
+
+
+def _start_workers(count: int):
+    """Fork ``count`` worker processes now, before any request arrives."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Imported before forking so every worker shares them copy-on-write
+    import pandas  # noqa: F401
+    import pyarrow  # noqa: F401
+    import gofish.arrow_utils  # noqa: F401
+    import gofish.ast  # noqa: F401
+
+    global _pool
+    _pool = ProcessPoolExecutor(
+        max_workers=count,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+    )
+    # A fork-context pool starts all of its processes on the first submit
+    _pool.submit(_worker_pid, 0).result()
+
+
+# Story file path → (mtime, loaded module)
+_story_modules: dict = {}
+# Modules of the python_stories package (shared data) → mtime when loaded
+_shared_mtimes: dict = {}
+_story_lock = threading.Lock()
+# (story file, story function) → lambda IDs it registered
+_story_lambdas: dict = {}
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+
+def _ensure_stories_package():
+    """Register python-stories/ as the "python_stories" package.
+
+    The directory name is not importable, but stories import shared data
+    from it (e.g. ``from python_stories.data import SEAFOOD``).
+    """
+    if "python_stories" in sys.modules:
+        return
+    spec = importlib.util.spec_from_file_location(
+        "python_stories",
+        os.path.join(PYTHON_STORIES_DIR, "__init__.py"),
+        submodule_search_locations=[PYTHON_STORIES_DIR],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["python_stories"] = package
+    spec.loader.exec_module(package)
+
+
+def _reload_changed_shared_modules() -> bool:
+    """Reload edited python_stories.* modules; True if any changed.
+
+    Stories copy names out of them at import time, so every story module
+    has to be reloaded afterwards.
+    """
+    changed = False
+    for name, module in list(sys.modules.items()):
+        if name != "python_stories" and not name.startswith("python_stories."):
+            continue
+        path = getattr(module, "__file__", None)
+        if not path:
+            continue
+        mtime = _mtime(path)
+        if _shared_mtimes.setdefault(name, mtime) != mtime:
+            importlib.reload(module)
+            _shared_mtimes[name] = mtime
+            changed = True
+    return changed
+
+
+def _load_story_file(path: str):
+    """Return a story file's module, re-importing it if it changed on disk."""
+    path = os.path.abspath(os.path.join(TESTS_DIR, path))
+    with _story_lock:
+        _ensure_stories_package()
+        if _reload_changed_shared_modules():
+            _story_modules.clear()
+        mtime = _mtime(path)
+        loaded = _story_modules.get(path)
+        if loaded is not None and loaded[0] == mtime:
+            return loaded[1]
+        digest = hashlib.sha1(path.encode()).hexdigest()[:12]
+        spec = importlib.util.spec_from_file_location(f"_story_{digest}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _story_modules[path] = (mtime, module)
+        if loaded is not None:
+            print(f"Reloaded {os.path.relpath(path, TESTS_DIR)}", flush=True)
+        return module
+
+
+def story_manifest() -> list:
+    """
+    List story files and their story_* functions without running them.
+
+    Functions are found by parsing each file, so listing stories costs no
+    imports and no chart construction; derives are registered only when a
+    story is actually requested from /story.
+    """
+    manifest = []
+    for root, dirs, files in os.walk(PYTHON_STORIES_DIR):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("__"))
+        for name in sorted(files):
+            if not (name.startswith("test_") and name.endswith(".py")):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding="utf-8") as f:
+                tree = ast.parse(f.read(), filename=path)
+            manifest.append({
+                "file": os.path.relpath(path, TESTS_DIR),
+                "mtime": _mtime(path),
+                "functions": [
+                    node.name
+                    for node in tree.body
+                    if isinstance(node, ast.FunctionDef)
+                    and node.name.startswith("story_")
+                ],
+            })
+    return manifest
+
+
+def _derive_functions(builder) -> dict:
+    """lambdaId → function for the derives the widget calls back into.
+
+    Same registry as ``_prepare_render``: leading eager operators run in the
+    kernel before the data is sent, so they are never called by lambda ID.
+    """
+    from gofish.ast import DeriveOperator, _split_eager
+
+    _, widget_ops = _split_eager(builder.data, builder.operators)
+    return {
+        op.lambda_id: op.fn
+        for op in widget_ops
+        if isinstance(op, DeriveOperator)
+    }
+
+
+def run_story(path: str, function: str) -> dict:
+    """
+    Run one story function, register its derives and return its render input.
+
+    Args:
+        path: Story file, absolute or relative to tests/
+        function: Name of the story_* function
+
+    Returns:
+        Dict with the widget's IR operators and mark, merged options, the
+        widget's Arrow data (base64) and the derive lambda IDs
+    """
+    module = _load_story_file(path)
+    story_fn = getattr(module, function)
+    result = story_fn()
+    if not isinstance(result, tuple):
+        raise TypeError("story function must return a tuple")
+    builder = result[0]
+    options = result[1] if len(result) > 1 else {}
+
+    # Exactly what a notebook widget is given
+    arrow_data, spec, _ = builder._prepare_render()
+    derives = _derive_functions(builder)
+    # Replace whatever an earlier run (or an older version) of this story
+    # registered, in one step, so lambda IDs never pile up across reloads
+    _swap((module.__file__, function), derives)
+
+    return {
+        "operators": spec["operators"],
+        "mark": spec["mark"],
+        "options": {**spec.get("options", {}), **options},
+        "arrowB64": base64.b64encode(arrow_data).decode("ascii"),
+        "deriveIds": list(derives),
+    }
+
+
+def _swap(owner, functions: dict):
+    """Atomically replace the lambdas registered by ``owner``."""
+    with _registry_lock:
+        for lambda_id in _story_lambdas.pop(owner, ()):
+            _registry.pop(lambda_id, None)
+            _lambda_locks.pop(lambda_id, None)
+            _origins.pop(lambda_id, None)
+        _registry.update(functions)
+        _story_lambdas[owner] = set(functions)
+        for index, (lambda_id, fn) in enumerate(functions.items()):
+            _origins[lambda_id] = (*owner, index, len(functions), code_hash(fn))
+
+
+def _register(functions: dict):
+    with _registry_lock:
+        _registry.update(functions)
+        return len(_registry)
+
+
+def _reset():
+    with _registry_lock:
+        _registry.clear()
+        _lambda_locks.clear()
+        _story_lambdas.clear()
+        _origins.clear()
 
 
 class DeriveHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests
+    protocol_version = "HTTP/1.1"
+
     def do_GET(self):
         parsed = urlparse(self.path)
         if parsed.path == "/health":
-            self._json_response(200, {"status": "ok", "registered": len(_registry)})
+            with _registry_lock:
+                registered = len(_registry)
+            self._json_response(200, {
+                "status": "ok",
+                "registered": registered,
+                "pid": os.getpid(),
+                "workers": _pool._max_workers if _pool is not None else 1,
+            })
+        elif parsed.path == "/metrics":
+            self._response(
+                200,
+                "text/plain; version=0.0.4; charset=utf-8",
+                _metrics.render().encode(),
+            )
+        elif parsed.path == "/manifest":
+            self._json_response(200, {"stories": story_manifest()})
         else:
             self._json_response(404, {"error": "not found"})
 
@@ -40,17 +568,31 @@ class DeriveHandler(BaseHTTPRequestHandler):
         content_length = int(self.headers.get("Content-Length", 0))
         body = self.rfile.read(content_length) if content_length > 0 else b""
 
-        if parsed.path == "/register":
+        if parsed.path == "/story":
+            self._handle_story(body)
+        elif parsed.path == "/register":
             self._handle_register(body)
+        elif parsed.path == "/derive/batch":
+            self._handle_batch(body)
         elif parsed.path.startswith("/derive/"):
             lambda_id = parsed.path[len("/derive/"):]
             self._handle_derive(lambda_id, body)
         elif parsed.path == "/reset":
-            _registry.clear()
+            _reset()
             self._json_response(200, {"status": "cleared"})
         else:
             self._json_response(404, {"error": "not found"})
 
+    def _handle_story(self, body: bytes):
+        """Return a story's IR and data and register its derives."""
+        try:
+            request = json.loads(body)
+            output = run_story(request["file"], request["function"])
+        except Exception as e:
+            self._json_response(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._json_response(200, output)
+
     def _handle_register(self, body: bytes):
         """Register derive functions from a story module."""
         try:
@@ -63,56 +605,76 @@ class DeriveHandler(BaseHTTPRequestHandler):
             #
             # For now, the capture script handles registration by importing
             # story modules and calling register_story_derives().
-            _registry.update(functions)
+            total = _register(functions)
             self._json_response(200, {
                 "status": "registered",
                 "count": len(functions),
-                "total": len(_registry),
+                "total": total,
             })
         except Exception as e:
             self._json_response(500, {"error": str(e)})
 
     def _handle_derive(self, lambda_id: str, body: bytes):
-        """Execute a registered derive function on JSON data."""
-        if lambda_id not in _registry:
+        """Execute a registered derive function on JSON or Arrow data."""
+        fn, lock = _lookup(lambda_id)
+        if fn is None:
+            _observe_unknown(lambda_id)
+            with _registry_lock:
+                registered = list(_registry.keys())
             self._json_response(404, {
                 "error": f"Unknown lambda_id: {lambda_id}",
-                "registered": list(_registry.keys()),
+                "registered": registered,
             })
             return
 
+        content_type = self.headers.get("Content-Type")
+        want_arrow = _wants_arrow(self.headers.get("Accept"), content_type)
         try:
-            data = json.loads(body)
-            fn = _registry[lambda_id]
-            result = fn(data)
-
-            # Ensure result is JSON-serializable
-            if hasattr(result, "to_dicts"):
-                # Polars DataFrame
-                result = result.to_dicts()
-            elif hasattr(result, "to_dict"):
-                # Pandas DataFrame
-                result = result.to_dict("records")
-
-            self._json_response(200, result)
+            out_type, out_body, cache = _dispatch(
+                lambda_id, fn, lock, body, content_type, want_arrow
+            )
+            headers = {"X-Cache": cache} if cache is not None else {}
+            self._response(200, out_type, out_body, headers)
         except Exception as e:
             self._json_response(500, {"error": str(e), "lambda_id": lambda_id})
 
-    def _json_response(self, status: int, data):
+    def _handle_batch(self, body: bytes):
+        """Execute many derive entries in parallel, with per-entry errors."""
+        try:
+            entries = json.loads(body)["requests"]
+        except Exception as e:
+            self._json_response(400, {"error": f"Invalid batch: {e}"})
+            return
+        results = list(_batch_pool.map(_run_batch_entry, entries))
+        self._json_response(200, {"results": results})
+
+    def _json_response(self, status: int, data, headers=None):
+        self._response(status, JSON, json.dumps(data).encode(), headers)
+
+    def _response(self, status: int, content_type: str, body: bytes, headers=None):
         self.send_response(status)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        # Keep-alive needs every response to be length-delimited
+        self.send_header("Content-Length", str(len(body)))
+        self._cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _cors_headers(self):
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, Accept")
+        self.send_header("Access-Control-Expose-Headers", "X-Cache")
+        # Let browsers reuse the preflight instead of repeating it per derive
+        self.send_header("Access-Control-Max-Age", "600")
 
     def do_OPTIONS(self):
         """Handle CORS preflight."""
         self.send_response(204)
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.send_header("Content-Length", "0")
+        self._cors_headers()
         self.end_headers()
 
     def log_message(self, format, *args):
@@ -121,18 +683,18 @@ class DeriveHandler(BaseHTTPRequestHandler):
             super().log_message(format, *args)
 
 
-def register_story_derives(story_module_name: str):
+def register_story_derives(story_module_name: str, stories=None):
     """
-    Import a story module and register all DeriveOperator functions.
+    Import a story module and register its DeriveOperator functions.
 
     Story modules define story_*() functions that return (ChartBuilder, options).
     We extract DeriveOperator instances from the builder's operators list.
+    Prefer /story, which registers a story's derives only when it is
+    rendered; pass ``stories`` to run just those functions here.
     """
-    from gofish.ast import DeriveOperator
-
     mod = importlib.import_module(story_module_name)
 
-    for attr_name in dir(mod):
+    for attr_name in stories or dir(mod):
         if not attr_name.startswith("story_"):
             continue
         story_fn = getattr(mod, attr_name)
@@ -147,20 +709,66 @@ def register_story_derives(story_module_name: str):
         if not hasattr(builder, "operators"):
             continue
 
-        for op in builder.operators:
-            if isinstance(op, DeriveOperator):
-                _registry[op.lambda_id] = op.fn
+        _swap((mod.__file__, attr_name), _derive_functions(builder))
+
+
+class DeriveServer(ThreadingHTTPServer):
+    """Thread-per-connection server; worker threads die with the process."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # Parallel browser workers open many connections at once
+    request_queue_size = 128
 
 
 def main():
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 3002
-    server = HTTPServer(("localhost", port), DeriveHandler)
-    print(f"Derive server listening on http://localhost:{port}")
+    global _cache
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("port", nargs="?", type=int, default=3002)
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get("DERIVE_CACHE_DIR", DEFAULT_CACHE_DIR),
+        help="Directory of the derive result cache",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=256,
+        help="Size above which least recently used results are evicted",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the result cache"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Run story derives in N pre-forked worker processes",
+    )
+    args = parser.parse_args()
+    port = args.port
+    if not args.no_cache and os.environ.get("DERIVE_CACHE") != "0":
+        _cache = DeriveCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+    if args.workers > 1:
+        # Fork before the server starts any threads
+        _start_workers(args.workers)
+        print(f"Started {args.workers} derive worker processes", flush=True)
+
+    server = DeriveServer(("localhost", port), DeriveHandler)
+    # Port 0 picks a free port; capture workers read the real one from here
+    port = server.server_address[1]
+    print(f"Derive server listening on http://localhost:{port}", flush=True)
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         pass
     server.server_close()
+    if _pool is not None:
+        # shutdown(cancel_futures=True) needs Python 3.9
+        for future in list(_pool_futures):
+            future.cancel()
+        _pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,319 @@
+"""
+Disk-backed cache of derive results for the test derive server.
+
+Stories run the same derives (sorting, sqrt, aggregation) on the same inputs
+every test run. Results are pickled to ``<cache dir>/<key>.pkl``, keyed by:
+
+- the function: its bytecode, constants and names, the source of its file
+  and of every module it reaches through its globals (helpers imported from
+  other files included), and the content of its defaults, closure cells and
+  the global values it reads (DataFrames by ``hash_pandas_object``, other
+  values pickled). A function reading a value that cannot be hashed by
+  content is never cached;
+- the renderer: gofish, the widget, gofish-graphics and the harness, the
+  same hash capture-python-dom.ts fingerprints stories with;
+- the canonicalized input data,
+
+so a changed function, helper, renderer or input is a miss rather than a
+stale hit.
+
+The cache is bounded: once its files exceed ``max_bytes`` the least recently
+used entries (by file mtime, refreshed on every hit) are deleted. Several
+server processes (one per capture worker) can share a directory; writes are
+atomic renames.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import types
+from typing import Any, Optional, Tuple
+
+MISS = object()
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+# Keep in sync with RENDERER_SOURCES in capture-python-dom.ts
+RENDERER_SOURCES = [
+    os.path.join(ROOT, "packages/gofish-python/gofish"),
+    os.path.join(ROOT, "packages/gofish-python/widget-src"),
+    os.path.join(ROOT, "packages/gofish-graphics/src"),
+    os.path.join(ROOT, "tests/harness"),
+    os.path.join(ROOT, "tests/scripts/capture-python-dom.ts"),
+    os.path.join(ROOT, "tests/scripts/derive-server.py"),
+    os.path.join(ROOT, "tests/scripts/normalize-dom.ts"),
+]
+_SKIPPED_DIRS = ("node_modules", "dist", "__pycache__")
+
+# path → ((mtime, size), sha256 of the file)
+_file_digests: dict = {}
+
+
+class _Uncacheable(Exception):
+    """A value the function depends on cannot be hashed by content."""
+
+
+def _hash_tree(hash, path: str) -> None:
+    """Add every file under ``path`` to a hash, like hashTree() in the TS."""
+    if not os.path.exists(path):
+        return
+    if not os.path.isdir(path):
+        hash.update(os.path.relpath(path, ROOT).encode())
+        with open(path, "rb") as f:
+            hash.update(f.read())
+        return
+    for name in sorted(n for n in os.listdir(path) if n not in _SKIPPED_DIRS):
+        _hash_tree(hash, os.path.join(path, name))
+
+
+def renderer_hash() -> str:
+    """Hash of the renderer; equal to rendererHash() in capture-python-dom.ts."""
+    hash = hashlib.sha256()
+    for path in RENDERER_SOURCES:
+        _hash_tree(hash, path)
+    return hash.hexdigest()
+
+
+def _file_digest(hash, path: Optional[str]) -> None:
+    """Feed a source file's content into a hash (memoized by mtime and size)."""
+    if not path:
+        return
+    try:
+        stat = os.stat(path)
+    except OSError:
+        hash.update(path.encode())
+        return
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _file_digests.get(path)
+    if cached is None or cached[0] != version:
+        with open(path, "rb") as f:
+            cached = (version, hashlib.sha256(f.read()).digest())
+        _file_digests[path] = cached
+    hash.update(cached[1])
+
+
+def _code_digest(hash, code) -> None:
+    """Feed a code object, including nested functions, into a hash."""
+    hash.update(code.co_code)
+    hash.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _code_digest(hash, const)
+        else:
+            hash.update(repr(const).encode())
+
+
+def code_hash(fn) -> str:
+    """Hash of a function's bytecode alone (not its file, globals or values)."""
+    code = getattr(fn, "__code__", None)
+    if not isinstance(code, types.CodeType):
+        return type(fn).__qualname__
+    hash = hashlib.sha256()
+    _code_digest(hash, code)
+    return hash.hexdigest()
+
+
+def _global_names(code) -> set:
+    """Names a code object (or a function nested in it) may read globally."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            names |= _global_names(const)
+    return names
+
+
+def _module_digest(hash, module) -> None:
+    hash.update(module.__name__.encode())
+    _file_digest(hash, getattr(module, "__file__", None))
+
+
+def _value_digest(hash, value, seen: set) -> None:
+    """
+    Feed a value into a hash by content.
+
+    Raises:
+        _Uncacheable: If the value cannot be hashed by content
+    """
+    if isinstance(value, types.FunctionType):
+        _function_digest(hash, value, seen)
+    elif isinstance(value, types.ModuleType):
+        _module_digest(hash, value)
+    elif isinstance(value, type):
+        # A class is as current as the module that defines it
+        hash.update(value.__qualname__.encode())
+        module = sys.modules.get(value.__module__)
+        if module is not None:
+            _module_digest(hash, module)
+    elif _is_pandas(value):
+        import pandas as pd
+
+        # repr() elides the middle rows; hash every value (and the index)
+        if isinstance(value, pd.DataFrame):
+            hash.update(repr((list(value.columns), list(value.dtypes))).encode())
+        else:
+            hash.update(repr((value.name, value.dtype)).encode())
+        hash.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    else:
+        try:
+            # pyarrow Tables and NumPy arrays pickle their buffers
+            hash.update(pickle.dumps(value, protocol=4))
+        except Exception as e:
+            raise _Uncacheable(type(value).__name__) from e
+
+
+def _is_pandas(value) -> bool:
+    pd = sys.modules.get("pandas")
+    return pd is not None and isinstance(value, (pd.DataFrame, pd.Series))
+
+
+def _function_digest(hash, fn, seen: set) -> None:
+    """Feed a function, the helpers it calls and the values it reads."""
+    code = fn.__code__
+    if code in seen:
+        return
+    seen.add(code)
+    _code_digest(hash, code)
+    _file_digest(hash, code.co_filename)
+    _value_digest(hash, fn.__defaults__, seen)
+    _value_digest(hash, fn.__kwdefaults__, seen)
+    for cell in fn.__closure__ or ():
+        _value_digest(hash, cell.cell_contents, seen)
+    # Globals it reads: helpers (followed into their own modules), imported
+    # modules (their source) and data (its content). Attribute names in
+    # co_names that happen to match a global only add to the key.
+    namespace = fn.__globals__
+    for name in sorted(_global_names(code)):
+        if name in namespace:
+            hash.update(name.encode())
+            _value_digest(hash, namespace[name], seen)
+
+
+def function_key(fn) -> Optional[str]:
+    """
+    Hash identifying what a derive function computes, or None if unknown.
+
+    Objects without Python bytecode (e.g. columnar transforms) and functions
+    depending on values that cannot be hashed by content return None and are
+    never cached.
+    """
+    if not isinstance(getattr(fn, "__code__", None), types.CodeType):
+        return None
+    hash = hashlib.sha256()
+    try:
+        _function_digest(hash, fn, set())
+    except _Uncacheable:
+        return None
+    return hash.hexdigest()
+
+
+def input_key(data: Any) -> str:
+    """Hash of derive input, independent of key order."""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class DeriveCache:
+    """
+    Result cache in a directory, bounded to ``max_bytes``.
+
+    Args:
+        directory: Where entries are stored (created if missing)
+        max_bytes: Total size above which old entries are evicted
+        renderer: Renderer hash mixed into every key (default: computed
+            with ``renderer_hash()``)
+    """
+
+    def __init__(self, directory: str, max_bytes: int, renderer: Optional[str] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.renderer = renderer_hash() if renderer is None else renderer
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._entries())
+
+    def key(self, fn, data: Any) -> Optional[str]:
+        """Cache key for calling ``fn`` on ``data``, or None if uncacheable."""
+        fn_key = function_key(fn)
+        if fn_key is None:
+            return None
+        key = f"{self.renderer}:{fn_key}:{input_key(data)}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """The cached result, or ``MISS``."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return MISS
+        try:
+            # Mark as recently used for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key: str, result: Any) -> None:
+        """Store a result; results that cannot be pickled are skipped."""
+        try:
+            payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        if len(payload) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._bytes += len(payload)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def call(self, fn, data: Any) -> Tuple[Any, str]:
+        """
+        Return ``(fn(data), status)``, from the cache when possible.
+
+        ``status`` is ``"hit"``, ``"miss"`` or ``"bypass"`` (uncacheable).
+        """
+        key = self.key(fn, data)
+        if key is None:
+            return fn(data), "bypass"
+        result = self.get(key)
+        if result is not MISS:
+            return result, "hit"
+        result = fn(data)
+        self.put(key, result)
+        return result, "miss"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _entries(self):
+        """(path, size, mtime) of every entry; other processes add files too."""
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict(self) -> None:
+        """Delete least recently used entries down to 90% of the bound."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._bytes = total
@@ -0,0 +1,185 @@
+"""
+Per-lambda metrics of the test derive server, in Prometheus text format.
+
+Every derive call is recorded under two labels: ``module`` (the story file it
+came from) and ``lambda`` (``<story file>::<story function>#<index>``, which,
+unlike lambda IDs, stays the same across runs and reloads). Lambdas
+registered without a story keep their ID as both labels' value.
+
+Exposed series:
+  derive_requests_total            calls
+  derive_errors_total              failed calls
+  derive_duration_seconds          latency histogram (bucket/sum/count)
+  derive_request_bytes_total       encoded request bodies
+  derive_response_bytes_total      encoded response bodies
+  derive_cache_requests_total      calls by result cache outcome (hit/miss/bypass)
+  derive_cache_hit_ratio           hits / (hits + misses), per module
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Latency bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, str]
+
+
+class _Series:
+    """Counters and latency histogram of one (module, lambda)."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.cache: Dict[str, int] = defaultdict(int)
+
+
+class DeriveMetrics:
+    """Thread-safe registry of derive call metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[Labels, _Series] = {}
+
+    def observe(
+        self,
+        module: str,
+        name: str,
+        seconds: float,
+        bytes_in: int,
+        bytes_out: int,
+        error: bool,
+        cache: Optional[str],
+    ) -> None:
+        """Record one derive call."""
+        with self._lock:
+            series = self._series.setdefault((module, name), _Series())
+            series.requests += 1
+            series.errors += int(error)
+            series.bytes_in += bytes_in
+            series.bytes_out += bytes_out
+            series.seconds += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series.buckets[i] += 1
+            if cache is not None:
+                series.cache[cache] += 1
+
+    def render(self) -> str:
+        """The metrics in Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._series.items())
+            lines: List[str] = []
+
+            def family(name: str, kind: str, help: str, samples):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+
+            def sample(name: str, labels: Dict[str, str], value) -> str:
+                body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                return f"{name}{{{body}}} {value}"
+
+            def per_series(name: str, attr: str):
+                return [
+                    sample(name, {"module": m, "lambda": n}, getattr(s, attr))
+                    for (m, n), s in items
+                ]
+
+            family(
+                "derive_requests_total",
+                "counter",
+                "Derive calls.",
+                per_series("derive_requests_total", "requests"),
+            )
+            family(
+                "derive_errors_total",
+                "counter",
+                "Failed derive calls.",
+                per_series("derive_errors_total", "errors"),
+            )
+
+            histogram = []
+            for (m, n), s in items:
+                labels = {"module": m, "lambda": n}
+                for bound, count in zip(BUCKETS, s.buckets):
+                    histogram.append(
+                        sample(
+                            "derive_duration_seconds_bucket",
+                            {**labels, "le": repr(bound)},
+                            count,
+                        )
+                    )
+                histogram.append(
+                    sample(
+                        "derive_duration_seconds_bucket",
+                        {**labels, "le": "+Inf"},
+                        s.requests,
+                    )
+                )
+                histogram.append(
+                    sample("derive_duration_seconds_sum", labels, f"{s.seconds:.6f}")
+                )
+                histogram.append(
+                    sample("derive_duration_seconds_count", labels, s.requests)
+                )
+            family(
+                "derive_duration_seconds",
+                "histogram",
+                "Derive call latency, including decoding and encoding.",
+                histogram,
+            )
+
+            family(
+                "derive_request_bytes_total",
+                "counter",
+                "Encoded derive request bodies.",
+                per_series("derive_request_bytes_total", "bytes_in"),
+            )
+            family(
+                "derive_response_bytes_total",
+                "counter",
+                "Encoded derive response bodies.",
+                per_series("derive_response_bytes_total", "bytes_out"),
+            )
+            family(
+                "derive_cache_requests_total",
+                "counter",
+                "Derive calls by result cache outcome.",
+                [
+                    sample(
+                        "derive_cache_requests_total",
+                        {"module": m, "lambda": n, "result": result},
+                        count,
+                    )
+                    for (m, n), s in items
+                    for result, count in sorted(s.cache.items())
+                ],
+            )
+
+            by_module: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+            for (m, _), s in items:
+                by_module[m][0] += s.cache.get("hit", 0)
+                by_module[m][1] += s.cache.get("miss", 0)
+            family(
+                "derive_cache_hit_ratio",
+                "gauge",
+                "Result cache hits / (hits + misses) per story module.",
+                [
+                    sample(
+                        "derive_cache_hit_ratio", {"module": m}, f"{h / (h + x):.4f}"
+                    )
+                    for m, (h, x) in sorted(by_module.items())
+                    if h + x
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")